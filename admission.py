@@ -0,0 +1,148 @@
+import time
+import asyncio
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager
+from typing import Callable, Hashable, Optional
+
+import metrics
+
+
+class QueueFull(Exception):
+    """Raised instead of queueing when too many requests already wait."""
+
+
+class _Waiter:
+    def __init__(self, user: Hashable, priority: int, on_update: Optional[Callable[[int, float], None]]):
+        self.user = user
+        self.priority = priority
+        self.on_update = on_update
+        self.granted = asyncio.get_running_loop().create_future()
+        self.position: Optional[int] = None
+        self.queued = False
+
+
+class AdmissionControl:
+    """Bounded concurrency for one backend with a fair queue in front of it.
+
+    At most `limit` requests run at once. Requests beyond that wait in a
+    queue served by highest priority first and, within a priority, round-robin
+    across users, so one user's burst cannot starve everybody else. When
+    `max_queue` requests already wait, `acquire` raises QueueFull at once
+    rather than letting latency grow without bound.
+
+    Waiters are told their position (0 is next in line) and an estimated
+    wait in seconds whenever it changes, through the `on_update` callback.
+    The estimate comes from a moving average of how long admitted requests
+    held their slot, starting at `estimate` seconds.
+    """
+
+    def __init__(self, name: str, limit: int, max_queue: int, estimate: float = 30.0):
+        self.name = name
+        self.limit = limit
+        self.max_queue = max_queue
+        self.estimate = estimate
+        self.running = 0
+        # priority -> user -> that user's waiters, users in round-robin order
+        self._queues: dict[int, OrderedDict[Hashable, deque[_Waiter]]] = {}
+        self._waiting = 0
+
+    @property
+    def waiting(self) -> int:
+        return self._waiting
+
+    def _order(self) -> list[_Waiter]:
+        """Queued waiters in the order they would be admitted."""
+        order = []
+        for priority in sorted(self._queues, reverse=True):
+            users = list(self._queues[priority].values())
+            for depth in range(max(len(waiters) for waiters in users)):
+                order.extend(waiters[depth] for waiters in users if depth < len(waiters))
+        return order
+
+    def eta(self, position: int) -> float:
+        """Estimated seconds until the waiter at `position` is admitted."""
+        return (position // self.limit + 1) * self.estimate
+
+    def _notify(self):
+        for position, waiter in enumerate(self._order()):
+            if waiter.position != position:
+                waiter.position = position
+                if waiter.on_update is not None:
+                    waiter.on_update(position, self.eta(position))
+
+    def _enqueue(self, waiter: _Waiter):
+        users = self._queues.setdefault(waiter.priority, OrderedDict())
+        users.setdefault(waiter.user, deque()).append(waiter)
+        waiter.queued = True
+        self._waiting += 1
+        metrics.gauge("admission_queue_depth", 1, "Requests waiting for admission", backend=self.name)
+
+    def _remove(self, waiter: _Waiter):
+        users = self._queues[waiter.priority]
+        waiters = users[waiter.user]
+        waiters.remove(waiter)
+        if not waiters:
+            del users[waiter.user]
+        if not users:
+            del self._queues[waiter.priority]
+        waiter.queued = False
+        self._waiting -= 1
+        metrics.gauge("admission_queue_depth", -1, "Requests waiting for admission", backend=self.name)
+
+    def _admit_next(self):
+        while self.running < self.limit and self._queues:
+            users = self._queues[max(self._queues)]
+            user, waiters = next(iter(users.items()))
+            waiter = waiters[0]
+            self._remove(waiter)
+            if waiter.user in users:
+                # The user had more waiting, so they go to the back of the rotation
+                users.move_to_end(waiter.user)
+            if waiter.granted.done():
+                # Cancelled, its task has not run yet to leave the queue
+                continue
+            self.running += 1
+            waiter.granted.set_result(None)
+        self._notify()
+
+    def _release(self, held: float):
+        self.running -= 1
+        # Moving average of slot hold times for the wait estimates
+        self.estimate += 0.2 * (held - self.estimate)
+        self._admit_next()
+
+    @asynccontextmanager
+    async def acquire(self, user: Hashable, priority: int = 0,
+                      on_update: Optional[Callable[[int, float], None]] = None):
+        """Hold one of the backend's slots for the duration of the block."""
+        if self.running >= self.limit or self._queues:
+            if self._waiting >= self.max_queue:
+                metrics.count("admission_total", 1, "Admission decisions", backend=self.name, result="rejected")
+                raise QueueFull(f"{self._waiting} requests are already waiting for {self.name}")
+            waiter = _Waiter(user, priority, on_update)
+            self._enqueue(waiter)
+            self._notify()
+            queued = time.monotonic()
+            try:
+                await waiter.granted
+            except asyncio.CancelledError:
+                if waiter.queued:
+                    self._remove(waiter)
+                    self._notify()
+                elif not waiter.granted.cancelled():
+                    # Admitted just as the caller gave up, so pass the slot on
+                    self.running -= 1
+                    self._admit_next()
+                raise
+            metrics.observe("admission_wait_seconds", time.monotonic() - queued,
+                            "Time spent queued for admission", backend=self.name)
+        else:
+            self.running += 1
+        metrics.count("admission_total", 1, "Admission decisions", backend=self.name, result="admitted")
+        metrics.gauge("admission_running", 1, "Admitted requests running", backend=self.name)
+        started = time.monotonic()
+        try:
+            yield
+        finally:
+            metrics.gauge("admission_running", -1, "Admitted requests running", backend=self.name)
+            self._release(time.monotonic() - started)
@@ -2,17 +2,36 @@ from typing import List, Union, Generator, Iterator
 from pydantic import BaseModel
 import os
 from langgraph.types import interrupt, Command
+from langgraph.errors import GraphInterrupt
+from langgraph.config import get_stream_writer
 from langgraph.checkpoint.sqlite.aio import AsyncSqliteSaver
-from mcp import ClientSession, StdioServerParameters
-from mcp.client.stdio import stdio_client
+from langchain_core.runnables import RunnableConfig
+from mcp import StdioServerParameters
+from mcp_pool import MCPSessionPool
+from checkpoint_maintenance import run_periodically, tune_connection
+from checkpoint_blobs import offload_large_values
+from speculative import SpeculativeRuns
+from blob_store import BlobStore
+from prompt_templates import format_prompt, pick_candidate
+from prompt_cache import PromptCache
+from admission import AdmissionControl, QueueFull
+import metrics
 import asyncio
+import contextvars
+import threading
+from contextlib import AsyncExitStack
 from typing_extensions import TypedDict
 from langgraph.graph import StateGraph, START, END
 
 
+# Replies that retry a render the admission queue turned away
+RETRY_REPLIES = {"retry", "try again"}
+
+
 class State(TypedDict):
     topic: str
     prompt: str
+    candidates: list[str]
     user_feedback: str
     image_url: str
 
@@ -26,6 +45,28 @@ class Pipeline:
         OUTPUT_NODE_ID: str
         OLLAMA_API_BASE: str
         PROMPT_LLM: str
+        COMFY_MCP_URL: str
+        COMFY_NATIVE: bool
+        PROMPT_CANDIDATES: int
+        PROMPT_CACHE_TTL: int
+        PROMPT_CACHE_MAX_ENTRIES: int
+        PROMPT_CACHE_VERSION: str
+        SPECULATIVE_GENERATION: bool
+        RENDER_CONCURRENCY: int
+        RENDER_QUEUE_LIMIT: int
+        RENDER_PRIORITIES: str
+        CHECKPOINT_MAINTENANCE_INTERVAL: int
+        CHECKPOINT_KEEP_LAST: int
+        CHECKPOINT_IDLE_TTL: int
+        CHECKPOINT_FINISHED_TTL: int
+        CHECKPOINT_BLOB_DIR: str
+        CHECKPOINT_BLOB_THRESHOLD: int
+        METRICS_PORT: int
+        METRICS_FILE: str
+        BLOB_STORE_DIR: str
+        BLOB_STORE_HOST: str
+        BLOB_STORE_PORT: int
+        BLOB_STORE_URL: str
         pass
 
     def __init__(self):
@@ -43,13 +84,73 @@ class Pipeline:
                 "OUTPUT_NODE_ID": os.getenv("OUTPUT_NODE_ID",
                                             "output-node-id"),
                 "OLLAMA_API_BASE": os.getenv("OLLAMA_API_BASE", "ollama-api-base"),
-                "PROMPT_LLM": os.getenv("PROMPT_LLM", "prompt-llm")
+                "PROMPT_LLM": os.getenv("PROMPT_LLM", "prompt-llm"),
+                # URL of a comfy MCP server running with an HTTP transport;
+                # empty spawns comfy-mcp-server over stdio instead
+                "COMFY_MCP_URL": os.getenv("COMFY_MCP_URL", ""),
+                # Render with this repo's comfy_generate_image tool (main.py),
+                # which keeps workflow.json parsed and follows renders over
+                # ComfyUI's websocket; prompts still come from comfy-mcp-server
+                "COMFY_NATIVE": os.getenv("COMFY_NATIVE", "").lower() in ("1", "true", "yes"),
+                # Prompts written concurrently per review round; with more
+                # than one the user answers with the number of the one to use
+                "PROMPT_CANDIDATES": int(os.getenv("PROMPT_CANDIDATES", "1")),
+                # Prompts written for a topic are reused for this many
+                # seconds, for up to this many topics (0 disables the cache);
+                # bump the version after changing the prompt LLM's template
+                "PROMPT_CACHE_TTL": int(os.getenv("PROMPT_CACHE_TTL", str(7 * 24 * 3600))),
+                "PROMPT_CACHE_MAX_ENTRIES": int(os.getenv("PROMPT_CACHE_MAX_ENTRIES", "10000")),
+                "PROMPT_CACHE_VERSION": os.getenv("PROMPT_CACHE_VERSION", "1"),
+                "SPECULATIVE_GENERATION": os.getenv(
+                    "SPECULATIVE_GENERATION", "").lower() in ("1", "true", "yes"),
+                # Renders run at once on the backend, renders allowed to wait
+                # for a slot before new ones are turned away, and priorities
+                # as comma-separated "role or user id:priority" pairs (e.g.
+                # "admin:10"); waiting renders are served by priority, then
+                # round-robin across users
+                "RENDER_CONCURRENCY": int(os.getenv("RENDER_CONCURRENCY", "2")),
+                "RENDER_QUEUE_LIMIT": int(os.getenv("RENDER_QUEUE_LIMIT", "20")),
+                "RENDER_PRIORITIES": os.getenv("RENDER_PRIORITIES", ""),
+                # Seconds between maintenance runs (0, the default, disables
+                # them), the checkpoints kept per chat and the TTLs in
+                # seconds. Maintenance deletes old checkpoints, and the first
+                # run does a one-time full VACUUM of checkpoints.sqlite to
+                # switch it to incremental vacuuming
+                "CHECKPOINT_MAINTENANCE_INTERVAL": int(os.getenv(
+                    "CHECKPOINT_MAINTENANCE_INTERVAL", "0")),
+                "CHECKPOINT_KEEP_LAST": int(os.getenv("CHECKPOINT_KEEP_LAST", "10")),
+                "CHECKPOINT_IDLE_TTL": int(os.getenv(
+                    "CHECKPOINT_IDLE_TTL", str(30 * 24 * 3600))),
+                "CHECKPOINT_FINISHED_TTL": int(os.getenv(
+                    "CHECKPOINT_FINISHED_TTL", str(7 * 24 * 3600))),
+                # State values longer than the threshold (e.g. images as data:
+                # URLs) are stored once in this directory and checkpoints only
+                # refer to them (0 keeps every value inline)
+                "CHECKPOINT_BLOB_DIR": os.getenv("CHECKPOINT_BLOB_DIR", "checkpoint_blobs"),
+                "CHECKPOINT_BLOB_THRESHOLD": int(os.getenv("CHECKPOINT_BLOB_THRESHOLD", "16384")),
+                # Prometheus text metrics on a local port and/or in a file
+                # (0 and "" leave instrumentation disabled)
+                "METRICS_PORT": int(os.getenv("METRICS_PORT", "0")),
+                "METRICS_FILE": os.getenv("METRICS_FILE", ""),
+                # Generated images are stored here and served on host:port
+                # (the pipelines server itself listens on 9099); 0 leaves
+                # serving to something else. BLOB_STORE_URL is the address
+                # browsers use to reach it (defaults to http://host:port).
+                # Without either, images stay inline as data: URLs.
+                "BLOB_STORE_DIR": os.getenv("BLOB_STORE_DIR", "blobs"),
+                "BLOB_STORE_HOST": os.getenv("BLOB_STORE_HOST", "127.0.0.1"),
+                "BLOB_STORE_PORT": int(os.getenv("BLOB_STORE_PORT", "9199")),
+                "BLOB_STORE_URL": os.getenv("BLOB_STORE_URL", ""),
             }
         )
+        # Renders started while a chat waits at prompt_feedback
+        self.speculative = SpeculativeRuns()
         pass
 
     async def on_startup(self):
         print(f"on_startup:{__name__}")
+        if self.valves.METRICS_PORT or self.valves.METRICS_FILE:
+            metrics.start_exporter(self.valves.METRICS_PORT, self.valves.METRICS_FILE)
         self.server_params = StdioServerParameters(
             command="uvx",
             args=["comfy-mcp-server"],
@@ -65,6 +166,45 @@ class Pipeline:
                 "PATH": os.getenv("PATH"),
             }
         )
+        # Chats rendering the same prompt at once share one ComfyUI job
+        self.pool = MCPSessionPool(
+            self.valves.COMFY_MCP_URL or self.server_params, coalesce=("generate_image",))
+        # Enough sessions to write every candidate prompt at once
+        self.pool.max_size = max(self.pool.max_size, self.valves.PROMPT_CANDIDATES)
+        self.render_pool, self.render_tool = self.pool, "generate_image"
+        if self.valves.COMFY_NATIVE:
+            self.render_tool = "comfy_generate_image"
+            self.render_pool = MCPSessionPool(StdioServerParameters(
+                command="uv",
+                args=["run", "main.py"],
+                cwd=os.path.dirname(os.path.abspath(__file__)),
+                env={
+                    "COMFY_URL": self.valves.COMFY_URL,
+                    "COMFY_URL_EXTERNAL": self.valves.COMFY_URL_EXTERNAL,
+                    "COMFY_WORKFLOW_JSON_FILE": self.valves.COMFY_WORKFLOW_JSON_FILE,
+                    "PROMPT_NODE_ID": self.valves.PROMPT_NODE_ID,
+                    "OUTPUT_NODE_ID": self.valves.OUTPUT_NODE_ID,
+                    "PATH": os.getenv("PATH"),
+                }
+            ), coalesce=(self.render_tool,))
+        self.prompt_cache = PromptCache(
+            "prompt_cache.sqlite", self.valves.PROMPT_CACHE_TTL, self.valves.PROMPT_CACHE_MAX_ENTRIES)
+        self.admission = AdmissionControl(
+            self.render_tool, self.valves.RENDER_CONCURRENCY, self.valves.RENDER_QUEUE_LIMIT)
+        self.blobs = None
+        if self.valves.BLOB_STORE_PORT or self.valves.BLOB_STORE_URL:
+            self.blobs = BlobStore(
+                self.valves.BLOB_STORE_DIR,
+                self.valves.BLOB_STORE_URL
+                or f"http://{self.valves.BLOB_STORE_HOST}:{self.valves.BLOB_STORE_PORT}")
+        if self.valves.BLOB_STORE_PORT:
+            try:
+                self.blobs.serve(self.valves.BLOB_STORE_HOST, self.valves.BLOB_STORE_PORT)
+            except OSError as e:
+                print(f"Serving blobs on {self.valves.BLOB_STORE_HOST}:{self.valves.BLOB_STORE_PORT} failed: {e}")
+                if not self.valves.BLOB_STORE_URL:
+                    # Nothing would serve the blobs, so keep images inline
+                    self.blobs = None
         builder = StateGraph(State)
         builder.add_node("generate_prompt", self.generate_prompt)
         builder.add_node("prompt_feedback", self.prompt_feedback)
@@ -74,12 +214,55 @@ class Pipeline:
         builder.add_conditional_edges("prompt_feedback", self.process_feedback)
         builder.add_edge("generate_image", END)
         self.builder = builder
+
+        # One long-lived event loop owns the saver, the compiled graph and the
+        # MCP session pool; pipe() submits each chat turn to it.
+        self.loop = asyncio.new_event_loop()
+        self.loop_thread = threading.Thread(
+            target=self.loop.run_forever, name="pipeline-loop", daemon=True)
+        self.loop_thread.start()
+        self.exit_stack = AsyncExitStack()
+        self.saver = await self.submit(self.exit_stack.enter_async_context(
+            AsyncSqliteSaver.from_conn_string("checkpoints.sqlite")))
+        self.exit_stack.push_async_callback(self.pool.aclose)
+        if self.render_pool is not self.pool:
+            self.exit_stack.push_async_callback(self.render_pool.aclose)
+        await self.submit(tune_connection(self.saver.conn))
+        offload_large_values(
+            self.saver, self.valves.CHECKPOINT_BLOB_DIR, self.valves.CHECKPOINT_BLOB_THRESHOLD)
+        metrics.instrument_saver(self.saver)
+        self.graph = self.builder.compile(checkpointer=self.saver)
+
+        self.maintenance = None
+        if self.valves.CHECKPOINT_MAINTENANCE_INTERVAL > 0:
+            self.maintenance = asyncio.run_coroutine_threadsafe(run_periodically(
+                self.saver.conn,
+                self.saver.lock,
+                self.valves.CHECKPOINT_MAINTENANCE_INTERVAL,
+                keep_last=self.valves.CHECKPOINT_KEEP_LAST,
+                idle_ttl=self.valves.CHECKPOINT_IDLE_TTL,
+                finished_ttl=self.valves.CHECKPOINT_FINISHED_TTL,
+                blob_dir=self.valves.CHECKPOINT_BLOB_DIR,
+            ), self.loop)
         pass
 
     async def on_shutdown(self):
         print(f"on_shutdown:{__name__}")
+        if self.maintenance is not None:
+            self.maintenance.cancel()
+        await self.submit(self.exit_stack.aclose())
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.loop_thread.join()
+        self.loop.close()
+        if self.blobs is not None:
+            self.blobs.close()
         pass
 
+    def submit(self, coro) -> asyncio.Future:
+        """Schedule `coro` on the pipeline loop and return an awaitable for it."""
+        return asyncio.wrap_future(
+            asyncio.run_coroutine_threadsafe(coro, self.loop))
+
     async def on_valves_updated(self):
         pass
 
@@ -96,9 +279,14 @@ class Pipeline:
 
         messages = body["messages"]
         last_message = messages[-1]
+        # The streamed reply ends with the image on its own line; inline
+        # data: images (e.g. from older chats) are moved to the blob store so
+        # only a short URL travels with the chat history
+        image_url = last_message["content"].rsplit("\n", 1)[-1]
         if (last_message["role"] == "assistant"
-                and last_message["content"][:5] == "data:"):
-            image_url = last_message["content"]
+                and image_url[:5] == "data:"):
+            if self.blobs is not None:
+                image_url = await asyncio.to_thread(self.blobs.put_data_url, image_url)
             content = messages[-2]["content"]
             last_message["content"] = f"Generated: {content}"
             last_message["files"] = [{"type": "image", "url": image_url}]
@@ -116,85 +304,194 @@ class Pipeline:
             return user_message
 
         thread_id = body.get("id")
+        user = body.get("user") or {}
         config = {
             "configurable": {
-                "thread_id": thread_id
+                "thread_id": thread_id,
+                # Renders are queued fairly across users
+                "user_id": user.get("id") or thread_id,
+                "priority": self.priority(user),
             }
         }
 
-        async def apipe() -> str:
-            async with AsyncSqliteSaver.from_conn_string("checkpoints.sqlite") as saver:
-                graph = self.builder.compile(checkpointer=saver)
-                state = await graph.aget_state(config)
-                next = state.next[0] if len(state.next) > 0 else None
-                response = "Invalid input"
-
-                prompt = {"topic": user_message}
-                if next == "prompt_feedback":
-                    prompt = Command(resume=user_message)
-                async for item in graph.astream(prompt, config):
+        async def apipe():
+            state = await self.graph.aget_state(config)
+            next = state.next[0] if len(state.next) > 0 else None
+
+            prompt = {"topic": user_message}
+            if next == "prompt_feedback":
+                prompt = Command(resume=user_message)
+            elif (next == "generate_image"
+                    and user_message.strip().strip(".!").casefold() in RETRY_REPLIES):
+                # The render was turned away last turn, try it again; any
+                # other message starts over with a new topic
+                prompt = None
+            # "custom" carries the status and progress events written by the
+            # nodes, so the chat shows each step as soon as it starts
+            try:
+                async for mode, item in self.graph.astream(
+                        prompt, config, stream_mode=["updates", "custom"]):
+                    if mode == "custom":
+                        yield item
+                        continue
                     step = list(item.keys())[0]
                     print(f"Step: {step}")
                     if "__interrupt__" in item:
                         value = item['__interrupt__'][0].value
-                        print(
-                            f"Prompt: {value['prompt']}\n\nAction: {value['action']}")
-                        response = f"Prompt: {value['prompt']}\n\nAction: {value['action']}"
+                        shown = format_prompt(value, "\n\n")
+                        print(f"{shown}\n\nAction: {value['action']}")
+                        yield f"{shown}\n\nAction: {value['action']}"
+                        # Speculate only with idle render capacity, never
+                        # ahead of renders users already approved
+                        if (self.valves.SPECULATIVE_GENERATION
+                                and self.admission.running < self.admission.limit
+                                and self.admission.waiting == 0):
+                            self.speculative.start(
+                                thread_id, value['prompt'], self.admitted_render(
+                                    value['prompt'], config["configurable"]))
                     elif "generate_image" in item:
                         value = item['generate_image']
                         print(f"Image: {value['image_url']}")
                         image_url = value['image_url']
-                        if image_url[:4] == 'http' and image_url[-11:] == 'type=output':
-                            response = f"\n![image]({image_url})\n"
+                        if image_url[:5] == 'data:':
+                            if self.blobs is not None:
+                                image_url = await asyncio.to_thread(
+                                    self.blobs.put_data_url, image_url)
+                            yield f"\n![image]({image_url})\n"
+                        elif image_url[:4] == 'http' and image_url[-11:] == 'type=output':
+                            yield f"\n![image]({image_url})\n"
                         else:
-                            response = image_url
-
-                return response
-
-        coro = apipe()
-        try:
-            loop = asyncio.get_running_loop()
-        except RuntimeError:
-            print("asyncio.run")
-            result = asyncio.run(coro)
-        else:
-            print("loop.run_until_complete")
-            result = loop.run_until_complete(coro)
-
-        return result
-
-    async def run_tool(self, tool: str, args: dict) -> str:
-        async with stdio_client(self.server_params) as (read, write):
-            async with ClientSession(read, write) as session:
-                await session.initialize()
-                return await session.call_tool(
-                    tool, arguments=args
-                )
-
-    async def generate_prompt(self, state: State) -> State:
+                            yield f"\n{image_url}"
+            except QueueFull:
+                # The approved prompt stays checkpointed; a "retry" reply
+                # renders it again and any other message starts a new topic
+                yield ("Too many images are waiting to be rendered right now. "
+                       "Reply \"retry\" to try again, or send a new topic.")
+
+        def stream() -> Iterator[str]:
+            # Pull each chunk from the shared pipeline loop; this blocks only
+            # the calling worker thread, other chats keep running. Closing the
+            # generator early (e.g. the client went away) stops the graph.
+            events = apipe()
+            try:
+                while True:
+                    try:
+                        yield asyncio.run_coroutine_threadsafe(
+                            events.__anext__(), self.loop).result()
+                    except StopAsyncIteration:
+                        return
+            finally:
+                asyncio.run_coroutine_threadsafe(events.aclose(), self.loop).result()
+
+        return stream()
+
+    async def run_tool(self, tool: str, args: dict, progress_callback=None) -> str:
+        return await self.pool.call_tool(tool, args, progress_callback)
+
+    async def render(self, prompt: str, progress_callback=None) -> str:
+        return await self.render_pool.call_tool(
+            self.render_tool, {"prompt": prompt}, progress_callback)
+
+    async def admitted_render(self, prompt: str, configurable: dict,
+                              progress_callback=None, on_update=None) -> str:
+        """Render once the admission queue lets this chat's user through."""
+        async with self.admission.acquire(
+                configurable.get("user_id") or configurable["thread_id"],
+                configurable.get("priority", 0), on_update):
+            return await self.render(prompt, progress_callback)
+
+    def priority(self, user: dict) -> int:
+        """Render priority of an Open WebUI user from the RENDER_PRIORITIES valve."""
+        priorities = {}
+        for entry in self.valves.RENDER_PRIORITIES.split(","):
+            name, _, value = entry.strip().rpartition(":")
+            if name:
+                priorities[name] = int(value)
+        return priorities.get(user.get("id"), priorities.get(user.get("role"), 0))
+
+    @metrics.node
+    async def generate_prompt(self, state: State, config: RunnableConfig) -> State:
         topic = state["topic"]
-        result = await self.run_tool("generate_prompt", {"topic": topic})
-        # print(f"Tool: generate_prompt, Input: {topic}, Result: {result}")
-        state["prompt"] = result.content[0].text
+        # A new prompt is coming, so any render speculated for the old one is wasted
+        self.speculative.discard(config["configurable"]["thread_id"])
+        count = max(1, self.valves.PROMPT_CANDIDATES)
+        key = self.prompt_cache.key(topic, self.valves.PROMPT_LLM, self.valves.PROMPT_CACHE_VERSION)
+        # Reaching this node again after a review means the user turned the
+        # prompts down, so write new ones instead of serving the cached ones
+        feedback = state.get("user_feedback")
+        regenerate = feedback is not None and pick_candidate(
+            feedback, state.get("candidates") or [state.get("prompt", "")]) is None
+        candidates = None if regenerate else await asyncio.to_thread(
+            self.prompt_cache.get, key, count)
+        if candidates is None:
+            get_stream_writer()("_Writing a prompt..._\n\n" if count == 1
+                                else f"_Writing {count} prompts..._\n\n")
+            # Candidates are written concurrently, so K of them take about as
+            # long as one; repeats returned by the LLM are shown once
+            results = await asyncio.gather(*(
+                self.run_tool("generate_prompt", {"topic": topic}) for _ in range(count)))
+            # print(f"Tool: generate_prompt, Input: {topic}, Result: {results}")
+            candidates = list(dict.fromkeys(result.content[0].text for result in results))
+            await asyncio.to_thread(self.prompt_cache.put, key, topic, candidates, count)
+        state["candidates"] = candidates
+        state["prompt"] = state["candidates"][0]
         return state
 
-    async def generate_image(self, state: State) -> State:
+    @metrics.node(ignore=(QueueFull,))
+    async def generate_image(self, state: State, config: RunnableConfig) -> State:
         prompt = state["prompt"]
-        result = await self.run_tool("generate_image", {"prompt": prompt})
+        thread_id = config["configurable"]["thread_id"]
+        writer = get_stream_writer()
+        # Adopt the render speculatively started while the prompt was reviewed
+        if self.speculative.pending(thread_id):
+            writer("_Finishing the image rendered while you reviewed the prompt..._\n\n")
+        result = await self.speculative.adopt(thread_id, prompt)
+        if result is None:
+            writer("_Rendering the image..._\n\n")
+            reported = -1
+            # Progress arrives on the MCP session's reader task, and queue
+            # updates on whichever render frees a slot, both outside the
+            # node's runnable context that the stream writer looks up
+            context = contextvars.copy_context()
+
+            def queued(position: int, eta: float):
+                context.run(writer, f"_Waiting for a free renderer: {position + 1} in line, "
+                                    f"about {eta:.0f}s_\n\n")
+
+            async def progress(done: float, total: float, message: str = None):
+                # Report in 10% steps to keep the chat message short
+                nonlocal reported
+                if not total:
+                    return
+                percent = min(100, int(done / total * 100)) // 10 * 10
+                if percent > reported:
+                    reported = percent
+                    context.run(writer, f"{message or 'Rendering'}: {percent}%\n\n")
+
+            result = await self.admitted_render(prompt, config["configurable"], progress, queued)
         # print(f"Tool: generate_image, Input: {prompt}, Result: {result}")
         state["image_url"] = result.content[0].text
         return state
 
+    @metrics.node(ignore=(GraphInterrupt,))
     def prompt_feedback(self, state: State) -> State:
-        state["user_feedback"] = interrupt({
+        candidates = state.get("candidates") or [state["prompt"]]
+        value = {
             "topic": state["topic"],
             "prompt": state["prompt"],
             "action": "Do you like this prompt? (y/n)"
-        })
+        }
+        if len(candidates) > 1:
+            value["candidates"] = candidates
+            value["action"] = f"Pick a prompt (1-{len(candidates)}), or n for new ones"
+        state["user_feedback"] = interrupt(value)
+        choice = pick_candidate(state["user_feedback"], candidates)
+        if choice is not None:
+            state["prompt"] = candidates[choice]
         return state
 
     def process_feedback(self, state: State) -> str:
-        user_feedback = state["user_feedback"]
-        if len(user_feedback.strip()) == 0 or user_feedback.lower().strip()[0] == "y":
+        candidates = state.get("candidates") or [state["prompt"]]
+        if pick_candidate(state["user_feedback"], candidates) is not None:
             return "generate_image"
         return "generate_prompt"
@@ -9,15 +9,24 @@
 # ///
 from langgraph.func import entrypoint, task
 from langgraph.types import interrupt, Command
+from langgraph.errors import GraphInterrupt
 from langgraph.checkpoint.sqlite.aio import AsyncSqliteSaver
-from mcp import ClientSession, StdioServerParameters
-from mcp.client.stdio import stdio_client
+from mcp import StdioServerParameters
+from mcp_pool import MCPSessionPool
+from checkpoint_maintenance import tune_connection
+from checkpoint_blobs import offload_large_values
+from prompt_templates import format_prompt, pick_candidate
+from prompt_cache import PromptCache
+import metrics
 import os
 import asyncio
+from contextlib import aclosing
 import argparse
 import textwrap
 
-server_params = StdioServerParameters(
+# COMFY_MCP_URL points at a comfy MCP server already running with an HTTP
+# transport instead of spawning one over stdio
+server_params = os.getenv("COMFY_MCP_URL") or StdioServerParameters(
     command="uvx",
     args=["comfy-mcp-server"],
     env={
@@ -34,48 +43,97 @@ server_params = StdioServerParameters(
 )
 
 
+# Warm MCP server processes shared by every tool call; identical renders in
+# flight at once share one ComfyUI job
+pool = MCPSessionPool(server_params, coalesce=("generate_image",))
+
+# COMFY_NATIVE renders with this repo's comfy_generate_image tool (main.py),
+# which keeps the workflow parsed and follows renders over ComfyUI's websocket
+render_pool, RENDER_TOOL = pool, "generate_image"
+if os.getenv("COMFY_NATIVE", "").lower() in ("1", "true", "yes"):
+    RENDER_TOOL = "comfy_generate_image"
+    render_pool = MCPSessionPool(StdioServerParameters(
+        command="uv",
+        args=["run", "main.py"],
+        cwd=os.path.dirname(os.path.abspath(__file__)),
+        env={
+            "COMFY_URL": os.getenv("COMFY_URL"),
+            "COMFY_URL_EXTERNAL": os.getenv("COMFY_URL_EXTERNAL"),
+            "COMFY_WORKFLOW_JSON_FILE": os.getenv("COMFY_WORKFLOW_JSON_FILE"),
+            "PROMPT_NODE_ID": os.getenv("PROMPT_NODE_ID"),
+            "OUTPUT_NODE_ID": os.getenv("OUTPUT_NODE_ID"),
+            "PATH": os.getenv("PATH"),
+        }
+    ), coalesce=(RENDER_TOOL,))
+
+
+# Prompts the LLM wrote per topic, model and PROMPT_CACHE_VERSION (bump it
+# after changing the LLM's prompt template); PROMPT_CACHE_MAX_ENTRIES=0
+# disables it
+prompt_cache = PromptCache(
+    os.getenv("PROMPT_CACHE_DB", "prompt_cache.sqlite"),
+    float(os.getenv("PROMPT_CACHE_TTL", str(7 * 24 * 3600))),
+    int(os.getenv("PROMPT_CACHE_MAX_ENTRIES", "10000")),
+)
+
+
 async def run_tool(tool: str, args: dict) -> str:
-    async with stdio_client(server_params) as (read, write):
-        async with ClientSession(read, write) as session:
-            await session.initialize()
-            return await session.call_tool(
-                tool, arguments=args
-            )
+    return await pool.call_tool(tool, args)
 
 
 @task
-async def generate_prompt(topic: str) -> str:
-    result = await run_tool("generate_prompt", {"topic": topic})
-    # print(f"Tool: generate_prompt, Input: {topic}, Result: {result}")
-    return result.content[0].text
+@metrics.node
+async def generate_prompts(topic: str, count: int, regenerate: bool) -> list[str]:
+    key = prompt_cache.key(topic, os.getenv("PROMPT_LLM", ""), os.getenv("PROMPT_CACHE_VERSION", "1"))
+    prompts = None if regenerate else await asyncio.to_thread(prompt_cache.get, key, count)
+    if prompts is None:
+        # Candidates are written concurrently and reviewed in one round
+        results = await asyncio.gather(*(
+            run_tool("generate_prompt", {"topic": topic}) for _ in range(count)))
+        # print(f"Tool: generate_prompt, Input: {topic}, Result: {results}")
+        prompts = list(dict.fromkeys(result.content[0].text for result in results))
+        await asyncio.to_thread(prompt_cache.put, key, topic, prompts, count)
+    return prompts
 
 
 @task
+@metrics.node
 async def generate_image(prompt: str) -> str:
-    result = await run_tool("generate_image", {"prompt": prompt})
+    result = await render_pool.call_tool(RENDER_TOOL, {"prompt": prompt})
     # print(f"Tool: generate_image, Input: {prompt}, Result: {result}")
     return result.content[0].text
 
 
 @task
-def get_feedback(topic: str, prompt: str) -> str:
-    feedback = interrupt({
+@metrics.node(ignore=(GraphInterrupt,))
+def get_feedback(topic: str, candidates: list[str]) -> str:
+    value = {
         "topic": topic,
-        "prompt": prompt,
+        "prompt": candidates[0],
         "action": "Do you like this prompt (y/n)?",
-    })
+    }
+    if len(candidates) > 1:
+        value["candidates"] = candidates
+        value["action"] = f"Pick a prompt (1-{len(candidates)}), or n for new ones"
+    feedback = interrupt(value)
     return feedback
 
 
-def workflow_func(saver):
+def workflow_func(saver, candidates: int = 1):
     @entrypoint(checkpointer=saver)
     async def workflow(topic: str) -> dict:
         """A simple workflow that generates prompts and an ai generated image for a topic."""
 
-        is_approved = "n"
-        while is_approved.lower()[0] != "y":
-            prompt = await generate_prompt(topic)
-            is_approved = await get_feedback(topic, prompt)
+        choice = None
+        regenerate = False
+        while choice is None:
+            # Cached prompts for the topic are offered first; rejected ones
+            # are replaced with newly written prompts
+            prompts = await generate_prompts(topic, candidates, regenerate)
+            feedback = await get_feedback(topic, prompts)
+            choice = pick_candidate(feedback, prompts)
+            regenerate = True
+        prompt = prompts[choice]
 
         image_url = await generate_image(prompt)
         return {
@@ -94,8 +152,13 @@ async def main():
     parser.add_argument("thread_id")
     parser.add_argument("--topic")
     parser.add_argument("--feedback")
+    parser.add_argument(
+        "--candidates", type=int, default=int(os.getenv("PROMPT_CANDIDATES", "1")),
+        help="Candidate prompts offered per review round; answer with the number of the one to use")
 
     args = parser.parse_args()
+    # Exposes metrics when METRICS_PORT or METRICS_FILE is set
+    metrics.start_exporter_from_env()
     topic = args.topic
     thread_id = args.thread_id
     feedback = args.feedback
@@ -109,8 +172,14 @@ async def main():
     }
 
     prompt = topic
-    async with AsyncSqliteSaver.from_conn_string("checkpoints.sqlite") as saver:
-        workflow = workflow_func(saver)
+    # Enough sessions to write every candidate prompt at once
+    pool.max_size = max(pool.max_size, args.candidates)
+    async with AsyncSqliteSaver.from_conn_string("checkpoints.sqlite") as saver, aclosing(pool), \
+            aclosing(render_pool):
+        await tune_connection(saver.conn)
+        offload_large_values(saver)
+        metrics.instrument_saver(saver)
+        workflow = workflow_func(saver, max(1, args.candidates))
         state = await workflow.aget_state(config)
 
         if state.values is not None and state.values != {}:
@@ -128,9 +197,7 @@ async def main():
             value = current_interrupt
             print(textwrap.dedent(f"""\
             Topic: {value['topic']}
-            Prompt: {value['prompt']}
-            Action: {value['action']}
-            """))
+            """) + format_prompt(value) + f"\nAction: {value['action']}\n")
             if feedback is not None:
                 prompt = Command(resume=feedback)
             else:
@@ -147,10 +214,7 @@ async def main():
                 if "__interrupt__" in item:
                     # print(item)
                     value = item['__interrupt__'][0].value
-                    print(textwrap.dedent(f"""\
-                    Prompt: {value['prompt']}
-                    {value['action']}: 
-                    """))
+                    print(format_prompt(value) + f"\n{value['action']}: \n")
 
 
 if __name__ == "__main__":
@@ -0,0 +1,83 @@
+#!/usr/bin/env python3
+"""
+Micro-benchmark for prompt template matching.
+
+Generates synthetic template files of increasing size and measures the time
+PromptTemplates.expand takes per topic, compared with the linear
+substring scan graph.py used before templates were indexed. The indexed
+matcher should stay flat as the template count grows.
+
+Usage:
+    python benchmarks/bench_prompt_templates.py [--counts 5 100 1000 10000]
+"""
+
+import os
+import sys
+import json
+import random
+import string
+import argparse
+import tempfile
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from prompt_templates import PromptTemplates
+
+TOPICS = [
+    "A cute robot holding a 'Hello World' sign",
+    "A portrait of an old fisherman at dawn",
+    "A misty mountain landscape with a lake",
+    "Something nobody has a template for at all",
+]
+
+
+def make_templates(count: int, rng: random.Random) -> dict:
+    templates = [
+        {"keywords": ["robot"], "template": "{topic}, futuristic design"},
+        {"keywords": ["portrait"], "template": "{topic}, soft natural lighting"},
+        {"keywords": ["landscape"], "template": "{topic}, golden hour lighting"},
+    ]
+    while len(templates) < count:
+        keyword = "".join(rng.choices(string.ascii_lowercase, k=rng.randint(6, 12)))
+        templates.append({"keywords": [keyword], "template": f"{{topic}}, {keyword} style"})
+    return {"templates": templates[:count]}
+
+
+def linear_expand(data: dict, topic: str) -> str:
+    lowered = topic.lower()
+    for entry in data["templates"]:
+        for keyword in entry["keywords"]:
+            if keyword.lower() in lowered:
+                return entry["template"].replace("{topic}", topic)
+    return f"{topic}, high quality, detailed, professional, artistic"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--counts", type=int, nargs="+", default=[5, 100, 1000, 10000])
+    parser.add_argument("--number", type=int, default=2000)
+    args = parser.parse_args()
+
+    rng = random.Random(42)
+    print(f"{'templates':>10} {'indexed us/topic':>18} {'linear us/topic':>17}")
+    for count in args.counts:
+        data = make_templates(count, rng)
+        with tempfile.NamedTemporaryFile("w", suffix=".json", delete=False) as f:
+            json.dump(data, f)
+        try:
+            templates = PromptTemplates(f.name, reload_interval=3600)
+            for topic in TOPICS:
+                assert templates.expand(topic) == linear_expand(data, topic)
+            indexed = timeit.timeit(
+                lambda: [templates.expand(topic) for topic in TOPICS], number=args.number)
+            linear = timeit.timeit(
+                lambda: [linear_expand(data, topic) for topic in TOPICS], number=args.number)
+        finally:
+            os.unlink(f.name)
+        per_topic = 1e6 / (args.number * len(TOPICS))
+        print(f"{count:>10} {indexed * per_topic:>18.2f} {linear * per_topic:>17.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,44 @@
+#!/usr/bin/env python3
+"""
+Local stand-in for the comfy-mcp-server used by app.py and the Open WebUI pipeline.
+
+Exposes the same `generate_prompt` and `generate_image` MCP tools over stdio,
+sleeping FAKE_PROMPT_LATENCY and FAKE_IMAGE_LATENCY seconds instead of
+calling an LLM or rendering, and returns a ComfyUI style output URL. The
+render reports FAKE_IMAGE_STEPS progress notifications along the way.
+"""
+
+import os
+import random
+import asyncio
+import hashlib
+from mcp.server.fastmcp import FastMCP, Context
+
+mcp = FastMCP("fake_comfy_server")
+
+PROMPT_LATENCY = float(os.getenv("FAKE_PROMPT_LATENCY", "0.2"))
+IMAGE_LATENCY = float(os.getenv("FAKE_IMAGE_LATENCY", "1.0"))
+IMAGE_STEPS = int(os.getenv("FAKE_IMAGE_STEPS", "20"))
+COMFY_URL_EXTERNAL = os.getenv("COMFY_URL_EXTERNAL", "http://127.0.0.1:8188")
+STYLES = ["dramatic lighting", "soft pastel colors", "cinematic composition", "golden hour", "moody fog"]
+
+
+@mcp.tool()
+async def generate_prompt(topic: str) -> str:
+    await asyncio.sleep(PROMPT_LATENCY)
+    # Vary the wording like a sampling LLM would
+    return f"{topic}, highly detailed, {random.choice(STYLES)}, trending on artstation"
+
+
+@mcp.tool()
+async def generate_image(prompt: str, ctx: Context = None) -> str:
+    for step in range(1, IMAGE_STEPS + 1):
+        await asyncio.sleep(IMAGE_LATENCY / IMAGE_STEPS)
+        if ctx is not None:
+            await ctx.report_progress(step, IMAGE_STEPS, "Sampling")
+    name = hashlib.sha256(prompt.encode()).hexdigest()[:16]
+    return f"{COMFY_URL_EXTERNAL}/view?filename={name}.png&subfolder=&type=output"
+
+
+if __name__ == "__main__":
+    mcp.run()
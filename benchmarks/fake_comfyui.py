@@ -0,0 +1,149 @@
+#!/usr/bin/env python3
+"""
+Local stand-in for a ComfyUI server.
+
+Implements the parts of the ComfyUI API the native `comfy_generate_image`
+tool uses: POST /prompt queues a workflow, GET /ws streams `progress`,
+`executing` and `execution_success` events to the submitting client, GET
+/history/<prompt_id> reports the saved images and GET /view serves them.
+Renders are simulated by sleeping `latency` seconds over `steps` sampler
+steps, one prompt at a time like a single GPU.
+
+Usage:
+    python benchmarks/fake_comfyui.py --port 8188 --latency 2 --steps 20
+"""
+
+import asyncio
+import contextlib
+import hashlib
+import argparse
+import threading
+import uuid
+
+import uvicorn
+from starlette.applications import Starlette
+from starlette.responses import JSONResponse, Response
+from starlette.routing import Route, WebSocketRoute
+from starlette.websockets import WebSocket, WebSocketDisconnect
+
+from fake_openai import fake_png
+
+
+def create_app(latency: float = 2.0, steps: int = 20, size: int = 200_000) -> Starlette:
+    clients: dict[str, WebSocket] = {}
+    history: dict[str, dict] = {}
+    queue: asyncio.Queue = asyncio.Queue()
+    image = fake_png(size)
+    stats = {"prompts": 0}
+
+    async def send(client_id: str, event: dict):
+        ws = clients.get(client_id)
+        if ws is not None:
+            try:
+                await ws.send_json(event)
+            except Exception:
+                clients.pop(client_id, None)
+
+    async def worker():
+        while True:
+            prompt_id, client_id, workflow = await queue.get()
+            if prompt_id not in history:
+                # Deleted from the queue before it started
+                continue
+            await send(client_id, {"type": "execution_start", "data": {"prompt_id": prompt_id}})
+            for step in range(1, steps + 1):
+                await asyncio.sleep(latency / steps)
+                await send(client_id, {"type": "progress", "data": {
+                    "value": step, "max": steps, "prompt_id": prompt_id, "node": "3"}})
+            text = next((node["inputs"].get("text", "") for node in workflow.values()
+                         if node.get("class_type") == "CLIPTextEncode"), "")
+            filename = f"ComfyUI_{hashlib.sha256(text.encode()).hexdigest()[:12]}.png"
+            history[prompt_id] = {
+                "status": {"completed": True, "status_str": "success"},
+                "outputs": {node_id: {"images": [{"filename": filename, "subfolder": "", "type": "output"}]}
+                            for node_id, node in workflow.items() if node.get("class_type") == "SaveImage"},
+            }
+            await send(client_id, {"type": "executing", "data": {"node": None, "prompt_id": prompt_id}})
+            await send(client_id, {"type": "execution_success", "data": {"prompt_id": prompt_id}})
+
+    async def submit(request):
+        body = await request.json()
+        prompt_id = str(uuid.uuid4())
+        stats["prompts"] += 1
+        history[prompt_id] = {"status": {"completed": False}, "outputs": {}}
+        await queue.put((prompt_id, body.get("client_id"), body["prompt"]))
+        return JSONResponse({"prompt_id": prompt_id, "number": stats["prompts"], "node_errors": {}})
+
+    async def manage_queue(request):
+        body = await request.json()
+        for prompt_id in body.get("delete", []):
+            if not history.get(prompt_id, {}).get("status", {}).get("completed"):
+                history.pop(prompt_id, None)
+        return JSONResponse({})
+
+    async def get_history(request):
+        prompt_id = request.path_params["prompt_id"]
+        entry = history.get(prompt_id)
+        return JSONResponse({prompt_id: entry} if entry and entry["status"]["completed"] else {})
+
+    async def view(request):
+        return Response(image, media_type="image/png")
+
+    async def stats_endpoint(request):
+        return JSONResponse(stats)
+
+    @contextlib.asynccontextmanager
+    async def lifespan(app):
+        task = asyncio.create_task(worker())
+        yield
+        task.cancel()
+
+    async def events(ws: WebSocket):
+        await ws.accept()
+        client_id = ws.query_params.get("clientId") or uuid.uuid4().hex
+        clients[client_id] = ws
+        await ws.send_json({"type": "status", "data": {"sid": client_id}})
+        try:
+            while True:
+                await ws.receive_text()
+        except WebSocketDisconnect:
+            clients.pop(client_id, None)
+
+    app = Starlette(routes=[
+        Route("/prompt", submit, methods=["POST"]),
+        Route("/queue", manage_queue, methods=["POST"]),
+        Route("/history/{prompt_id}", get_history),
+        Route("/view", view),
+        Route("/stats", stats_endpoint),
+        WebSocketRoute("/ws", events),
+    ], lifespan=lifespan)
+    return app
+
+
+def start(port: int = 0, **options) -> uvicorn.Server:
+    """Serve the fake ComfyUI on a background thread and return the server once it listens."""
+    config = uvicorn.Config(create_app(**options), host="127.0.0.1", port=port, log_level="warning")
+    server = uvicorn.Server(config)
+    threading.Thread(target=server.run, daemon=True).start()
+    while not server.started:
+        threading.Event().wait(0.05)
+    return server
+
+
+def base_url(server: uvicorn.Server) -> str:
+    port = server.servers[0].sockets[0].getsockname()[1]
+    return f"http://127.0.0.1:{port}"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Fake ComfyUI server")
+    parser.add_argument("--port", type=int, default=8188)
+    parser.add_argument("--latency", type=float, default=2.0, help="Seconds per render")
+    parser.add_argument("--steps", type=int, default=20, help="Sampler steps reported per render")
+    parser.add_argument("--size", type=int, default=200_000, help="Image size in bytes")
+    args = parser.parse_args()
+    uvicorn.run(create_app(args.latency, args.steps, args.size), host="127.0.0.1", port=args.port)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+"""
+Local stand-in for the OpenAI images API.
+
+Serves POST /v1/images/generations with a configurable latency, returning
+either an inline b64_json image or a URL to GET /images/<id>.png served by
+the same process. The image is a PNG header followed by random bytes of a
+configurable size, which is enough for the tools to save and inspect it.
+Every Nth generation can be made slow or answered with a 500 to exercise
+the tools' deadlines, hedging and circuit breaker.
+
+Usage:
+    python benchmarks/fake_openai.py --port 8765 --latency 0.5 --size 1800000
+"""
+
+import os
+import json
+import time
+import base64
+import struct
+import zlib
+import argparse
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+
+def fake_png(size: int, width: int = 1024, height: int = 1024) -> bytes:
+    """A PNG signature and IHDR chunk padded with random bytes up to `size`."""
+    ihdr = struct.pack(">IIBBBBB", width, height, 8, 2, 0, 0, 0)
+    chunk = b"IHDR" + ihdr
+    header = b"\x89PNG\r\n\x1a\n" + struct.pack(">I", len(ihdr)) + chunk + struct.pack(">I", zlib.crc32(chunk))
+    return header + os.urandom(max(0, size - len(header)))
+
+
+class FakeImagesHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, *args):
+        pass
+
+    def _send(self, status: int, content_type: str, body: bytes, headers: dict = None):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self):
+        request = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        server = self.server
+        with server.lock:
+            server.calls += 1
+            calls = server.calls
+        slow = server.slow_every and calls % server.slow_every == 0
+        time.sleep(server.slow_latency if slow else server.latency)
+        if server.error_every and calls % server.error_every == 0:
+            body = json.dumps({"error": {"message": "Internal error", "type": "server_error"}}).encode()
+            self._send(500, "application/json", body)
+            return
+        if server.rate_limit_every and calls % server.rate_limit_every == 0:
+            body = json.dumps({"error": {"message": "Rate limit reached", "type": "requests"}}).encode()
+            self._send(429, "application/json", body, {"Retry-After": "1"})
+            return
+        if request.get("response_format") == "url":
+            host, port = server.server_address[:2]
+            data = {"url": f"http://{host}:{port}/images/{calls}.png"}
+        else:
+            data = {"b64_json": server.b64_payload}
+        body = json.dumps({"created": int(time.time()), "data": [data]}).encode()
+        self._send(200, "application/json", body)
+
+    def do_GET(self):
+        self._send(200, "image/png", self.server.payload)
+
+
+def start(port: int = 0, latency: float = 0.5, size: int = 1_800_000,
+          rate_limit_every: int = 0, slow_every: int = 0, slow_latency: float = 10.0,
+          error_every: int = 0) -> ThreadingHTTPServer:
+    """Start the fake API on a background thread and return the server."""
+    server = ThreadingHTTPServer(("127.0.0.1", port), FakeImagesHandler)
+    server.daemon_threads = True
+    # Hedged and timed-out clients hang up mid-response; that is expected
+    server.handle_error = lambda request, client_address: None
+    server.latency = latency
+    server.payload = fake_png(size)
+    server.b64_payload = base64.b64encode(server.payload).decode()
+    server.rate_limit_every = rate_limit_every
+    server.slow_every = slow_every
+    server.slow_latency = slow_latency
+    server.error_every = error_every
+    server.calls = 0
+    server.lock = threading.Lock()
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def base_url(server: ThreadingHTTPServer) -> str:
+    host, port = server.server_address[:2]
+    return f"http://{host}:{port}/v1"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Fake OpenAI images endpoint")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency", type=float, default=0.5, help="Seconds per generation")
+    parser.add_argument("--size", type=int, default=1_800_000, help="Image size in bytes")
+    parser.add_argument("--rate-limit-every", type=int, default=0,
+                        help="Answer every Nth generation with a 429")
+    parser.add_argument("--slow-every", type=int, default=0,
+                        help="Make every Nth generation take --slow-latency seconds")
+    parser.add_argument("--slow-latency", type=float, default=10.0)
+    parser.add_argument("--error-every", type=int, default=0,
+                        help="Answer every Nth generation with a 500")
+    args = parser.parse_args()
+
+    server = start(args.port, args.latency, args.size, args.rate_limit_every,
+                   args.slow_every, args.slow_latency, args.error_every)
+    print(f"Fake OpenAI images API at {base_url(server)}")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,337 @@
+#!/usr/bin/env python3
+"""
+Offline benchmark suite for the LangGraph MCP pipeline.
+
+Runs everything against local stand-ins (benchmarks/fake_openai.py for the
+OpenAI images API and benchmarks/fake_comfy_server.py for comfy-mcp-server),
+so no API keys, GPUs or network access are needed. It measures:
+
+- MCP server spawn + handshake cost, and warm calls through the session pool,
+  over stdio and against one long-lived server over streamable HTTP
+- graph.py per-node wall time: generate_prompt, prompt_feedback resume and
+  generate_image (through the real image MCP server)
+- Open WebUI pipeline turn latency and time to first streamed chunk, for a
+  new topic and for an approval
+- AsyncSqliteSaver checkpoint write/read cost for several payload sizes
+- Image download and b64 decode throughput of the image tools
+
+Results are written as JSON; pass --compare with an earlier result file to
+print the change between versions.
+
+Usage:
+    python benchmarks/run_benchmarks.py --output bench.json
+    python benchmarks/run_benchmarks.py --compare bench.json
+"""
+
+import os
+import sys
+import json
+import time
+import asyncio
+import logging
+import argparse
+import platform
+import socket
+import tempfile
+import subprocess
+import importlib.util
+from contextlib import aclosing, contextmanager
+
+REPO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO)
+
+import fake_openai
+
+
+def summarize(samples: list[float]) -> dict:
+    ordered = sorted(samples)
+    pick = lambda pct: ordered[min(len(ordered) - 1, int(pct / 100 * len(ordered)))]
+    return {
+        "n": len(ordered),
+        "mean": sum(ordered) / len(ordered),
+        "p50": pick(50),
+        "p90": pick(90),
+        "min": ordered[0],
+        "max": ordered[-1],
+    }
+
+
+async def bench_mcp(results: dict, image_params, comfy_params, iterations: int):
+    from mcp import ClientSession
+    from mcp.client.stdio import stdio_client
+    from mcp.client.streamable_http import streamablehttp_client
+    from mcp_pool import MCPSessionPool
+
+    for name, params in (("image_server", image_params), ("comfy_server", comfy_params)):
+        samples = []
+        for _ in range(iterations):
+            started = time.perf_counter()
+            async with stdio_client(params) as (read, write):
+                async with ClientSession(read, write) as session:
+                    await session.initialize()
+                    samples.append(time.perf_counter() - started)
+        results[f"mcp.{name}.spawn_handshake"] = summarize(samples)
+
+    async with MCPSessionPool(image_params, max_size=1, min_size=1) as pool:
+        samples = []
+        for _ in range(iterations * 10):
+            started = time.perf_counter()
+            await pool.call_tool("get_images_info", {"filenames": []})
+            samples.append(time.perf_counter() - started)
+    results["mcp.image_server.pooled_call"] = summarize(samples)
+
+    # The same server as one long-lived process over streamable HTTP
+    with serve_http(image_params) as url:
+        samples = []
+        for _ in range(iterations):
+            started = time.perf_counter()
+            async with streamablehttp_client(url) as (read, write, _):
+                async with ClientSession(read, write) as session:
+                    await session.initialize()
+                    samples.append(time.perf_counter() - started)
+        results["mcp.image_server_http.connect_handshake"] = summarize(samples)
+
+        async with MCPSessionPool(url, max_size=1, min_size=1) as pool:
+            samples = []
+            for _ in range(iterations * 10):
+                started = time.perf_counter()
+                await pool.call_tool("get_images_info", {"filenames": []})
+                samples.append(time.perf_counter() - started)
+        results["mcp.image_server_http.pooled_call"] = summarize(samples)
+
+
+@contextmanager
+def serve_http(params):
+    """Run the stdio server command with the streamable HTTP transport on a free port."""
+    with socket.socket() as probe:
+        probe.bind(("127.0.0.1", 0))
+        port = probe.getsockname()[1]
+    process = subprocess.Popen(
+        [params.command, *params.args, "--transport", "streamable-http", "--port", str(port)],
+        cwd=params.cwd, env=params.env, stderr=subprocess.DEVNULL)
+    try:
+        deadline = time.monotonic() + 30
+        while True:
+            try:
+                socket.create_connection(("127.0.0.1", port), 0.2).close()
+                break
+            except OSError:
+                if time.monotonic() > deadline or process.poll() is not None:
+                    raise RuntimeError("The HTTP image server did not start")
+                time.sleep(0.1)
+        yield f"http://127.0.0.1:{port}/mcp"
+    finally:
+        process.terminate()
+        process.wait()
+
+
+async def bench_graph(results: dict, image_params, workdir: str, iterations: int):
+    import graph
+    from langgraph.types import Command
+    from langgraph.checkpoint.sqlite.aio import AsyncSqliteSaver
+
+    graph.pool.server_params = image_params
+    timings = {"generate_prompt": [], "prompt_feedback_resume": [], "generate_image": []}
+    db = os.path.join(workdir, "graph_checkpoints.sqlite")
+    async with AsyncSqliteSaver.from_conn_string(db) as saver, aclosing(graph.pool):
+        compiled = graph.builder.compile(checkpointer=saver)
+        # Warm the session pool so node timings exclude the first spawn
+        await graph.pool.start()
+        for i in range(iterations):
+            config = {"configurable": {"thread_id": f"bench-{time.time_ns()}"}}
+            started = time.perf_counter()
+            async for item in compiled.astream({"topic": f"benchmark robot {i} {time.time_ns()}"}, config):
+                if "generate_prompt" in item:
+                    timings["generate_prompt"].append(time.perf_counter() - started)
+            started = time.perf_counter()
+            async for item in compiled.astream(Command(resume="y"), config):
+                now = time.perf_counter()
+                if "prompt_feedback" in item:
+                    timings["prompt_feedback_resume"].append(now - started)
+                elif "generate_image" in item:
+                    timings["generate_image"].append(now - started)
+                started = now
+    for node, samples in timings.items():
+        results[f"graph.{node}"] = summarize(samples)
+
+
+def bench_pipeline(results: dict, comfy_params, iterations: int):
+    os.environ["CHECKPOINT_MAINTENANCE_INTERVAL"] = "0"
+    spec = importlib.util.spec_from_file_location(
+        "ai_image_gen_pipeline", os.path.join(REPO, "ai-image-gen-pipeline.py"))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+
+    pipeline = module.Pipeline()
+
+    async def startup():
+        await pipeline.on_startup()
+        pipeline.pool.server_params = comfy_params
+        await pipeline.submit(pipeline.pool.start())
+
+    asyncio.run(startup())
+    timings = {name: [] for name in (
+        "prompt_turn", "prompt_first_chunk", "approve_turn", "approve_first_chunk")}
+
+    def turn(name: str, message: str, body: dict):
+        started = time.perf_counter()
+        for i, _ in enumerate(pipeline.pipe(message, "bench", [], body)):
+            if i == 0:
+                timings[f"{name}_first_chunk"].append(time.perf_counter() - started)
+        timings[f"{name}_turn"].append(time.perf_counter() - started)
+
+    try:
+        for i in range(iterations):
+            body = {"id": f"bench-{time.time_ns()}"}
+            turn("prompt", f"benchmark castle {i}", body)
+            turn("approve", "y", body)
+    finally:
+        asyncio.run(pipeline.on_shutdown())
+    for name, samples in timings.items():
+        results[f"pipeline.{name}"] = summarize(samples)
+
+
+async def bench_checkpoints(results: dict, workdir: str, iterations: int):
+    from langgraph.checkpoint.base import empty_checkpoint
+    from langgraph.checkpoint.sqlite.aio import AsyncSqliteSaver
+    from checkpoint_maintenance import tune_connection
+
+    db = os.path.join(workdir, "checkpoint_bench.sqlite")
+    async with AsyncSqliteSaver.from_conn_string(db) as saver:
+        await tune_connection(saver.conn)
+        for size in (1_000, 100_000, 2_000_000):
+            config = {"configurable": {"thread_id": f"size-{size}", "checkpoint_ns": ""}}
+            writes, reads = [], []
+            for step in range(iterations * 5):
+                checkpoint = empty_checkpoint()
+                checkpoint["channel_values"] = {"image_url": "x" * size}
+                metadata = {"source": "loop", "step": step, "parents": {}}
+                started = time.perf_counter()
+                config = await saver.aput(config, checkpoint, metadata, {})
+                writes.append(time.perf_counter() - started)
+                started = time.perf_counter()
+                await saver.aget_tuple(config)
+                reads.append(time.perf_counter() - started)
+            results[f"checkpoint.write.{size}B"] = summarize(writes)
+            results[f"checkpoint.read.{size}B"] = summarize(reads)
+
+
+async def bench_download(results: dict, server, workdir: str, iterations: int):
+    from tools import image_tools
+
+    # Importing the server enables per-request httpx logging
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+    size = len(server.payload)
+    url = fake_openai.base_url(server).replace("/v1", "/images/bench.png")
+    target = os.path.join(workdir, "download_bench.png")
+    for name, chunks in (
+        ("stream_url", lambda: image_tools._download_chunks(url)),
+        ("decode_b64", lambda: image_tools._decoded_chunks(server.b64_payload)),
+    ):
+        samples = []
+        for _ in range(iterations * 5):
+            started = time.perf_counter()
+            await image_tools._write_file(target, chunks())
+            samples.append(time.perf_counter() - started)
+        stats = summarize(samples)
+        stats["mb_per_s"] = size / stats["p50"] / 1e6
+        results[f"download.{name}"] = stats
+
+
+def compare(baseline: dict, current: dict):
+    print(f"{'benchmark':<42} {'baseline p50':>13} {'current p50':>12} {'change':>8}")
+    for name, stats in current["results"].items():
+        before = baseline["results"].get(name)
+        if before is None:
+            print(f"{name:<42} {'-':>13} {stats['p50'] * 1000:>10.2f}ms {'new':>8}")
+            continue
+        change = (stats["p50"] - before["p50"]) / before["p50"] * 100 if before["p50"] else 0.0
+        print(f"{name:<42} {before['p50'] * 1000:>11.2f}ms {stats['p50'] * 1000:>10.2f}ms {change:>+7.1f}%")
+
+
+def git_revision() -> str:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=REPO,
+            capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline benchmarks for the LangGraph MCP pipeline")
+    parser.add_argument("--output", default="bench.json", help="Where to write the JSON results")
+    parser.add_argument("--compare", help="Earlier JSON results to compare against")
+    parser.add_argument("--iterations", type=int, default=5)
+    parser.add_argument("--latency", type=float, default=0.2,
+                        help="Fake API latency per generation, in seconds")
+    parser.add_argument("--image-bytes", type=int, default=1_800_000)
+    parser.add_argument("--only", nargs="+",
+                        choices=["mcp", "graph", "pipeline", "checkpoints", "download"],
+                        help="Run only these benchmarks")
+    args = parser.parse_args()
+    selected = set(args.only or ["mcp", "graph", "pipeline", "checkpoints", "download"])
+
+    workdir = tempfile.mkdtemp(prefix="pipeline-bench-")
+    server = fake_openai.start(latency=args.latency, size=args.image_bytes)
+    os.environ.update({
+        "OPENAI_API_KEY": "benchmark",
+        "OPENAI_BASE_URL": fake_openai.base_url(server),
+        "IMAGE_CACHE_DIR": os.path.join(workdir, ".image_cache"),
+        "IMAGE_CATALOG_DB": os.path.join(workdir, "generated_images.sqlite"),
+    })
+    os.chdir(workdir)
+
+    from mcp import StdioServerParameters
+    server_env = {
+        name: os.environ[name]
+        for name in ("OPENAI_API_KEY", "OPENAI_BASE_URL", "IMAGE_CACHE_DIR", "IMAGE_CATALOG_DB", "PATH")
+    }
+    image_params = StdioServerParameters(
+        command=sys.executable, args=[os.path.join(REPO, "main.py")], cwd=workdir, env=server_env)
+    comfy_params = StdioServerParameters(
+        command=sys.executable,
+        args=[os.path.join(REPO, "benchmarks", "fake_comfy_server.py")],
+        env={"PATH": os.environ["PATH"], "FAKE_IMAGE_LATENCY": str(args.latency)})
+
+    results = {}
+    if "mcp" in selected:
+        asyncio.run(bench_mcp(results, image_params, comfy_params, args.iterations))
+    if "graph" in selected:
+        asyncio.run(bench_graph(results, image_params, workdir, args.iterations))
+    if "pipeline" in selected:
+        bench_pipeline(results, comfy_params, args.iterations)
+    if "checkpoints" in selected:
+        asyncio.run(bench_checkpoints(results, workdir, args.iterations))
+    if "download" in selected:
+        asyncio.run(bench_download(results, server, workdir, args.iterations))
+    server.shutdown()
+
+    report = {
+        "meta": {
+            "revision": git_revision(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+            "iterations": args.iterations,
+            "latency": args.latency,
+            "image_bytes": args.image_bytes,
+        },
+        "results": results,
+    }
+    output = args.output if os.path.isabs(args.output) else os.path.join(REPO, args.output)
+    with open(output, "w") as f:
+        json.dump(report, f, indent=2)
+
+    for name, stats in results.items():
+        extra = f"  {stats['mb_per_s']:.1f} MB/s" if "mb_per_s" in stats else ""
+        print(f"{name:<42} p50 {stats['p50'] * 1000:9.2f}ms  p90 {stats['p90'] * 1000:9.2f}ms{extra}")
+    print(f"Results written to {output}")
+
+    if args.compare:
+        with open(args.compare if os.path.isabs(args.compare) else os.path.join(REPO, args.compare)) as f:
+            compare(json.load(f), report)
+
+
+if __name__ == "__main__":
+    main()
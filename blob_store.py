@@ -0,0 +1,103 @@
+"""
+Content-addressed store for generated images, served over a small local HTTP
+endpoint.
+
+Images are written once under `root`, named by a hash of their bytes, and
+referenced from chat messages by a short URL instead of an inline `data:` URL.
+Blobs never change once written, so they are served with immutable caching
+headers and an ETag.
+"""
+
+import os
+import re
+import uuid
+import base64
+import hashlib
+import mimetypes
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from typing import Optional
+
+BLOB_ID = re.compile(r"^[0-9a-f]{32}(\.[a-z0-9]{1,5})?$")
+DATA_URL = re.compile(r"^data:(?P<type>[\w/+.-]+)?(?P<params>(;[^;,]*)*?)(?P<base64>;base64)?,")
+
+
+class BlobStore:
+    def __init__(self, root: str, base_url: str):
+        self.root = root
+        self.base_url = base_url.rstrip("/")
+        os.makedirs(root, exist_ok=True)
+        self._server: Optional[ThreadingHTTPServer] = None
+
+    def path(self, blob_id: str) -> str:
+        if not BLOB_ID.match(blob_id):
+            raise ValueError(f"Invalid blob id: {blob_id!r}")
+        return os.path.join(self.root, blob_id)
+
+    def url(self, blob_id: str) -> str:
+        return f"{self.base_url}/blobs/{blob_id}"
+
+    def put(self, data: bytes, content_type: str = "application/octet-stream") -> str:
+        """Store `data` once and return its blob id."""
+        extension = mimetypes.guess_extension(content_type) or ""
+        blob_id = hashlib.sha256(data).hexdigest()[:32] + extension
+        path = self.path(blob_id)
+        if not os.path.exists(path):
+            tmp_path = f"{path}.{uuid.uuid4().hex}.part"
+            with open(tmp_path, "wb") as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        return blob_id
+
+    def put_data_url(self, data_url: str) -> str:
+        """Store the payload of a `data:` URL and return the blob's URL."""
+        match = DATA_URL.match(data_url)
+        if match is None:
+            raise ValueError("Not a data: URL")
+        payload = data_url[match.end():]
+        data = base64.b64decode(payload) if match["base64"] else payload.encode()
+        return self.url(self.put(data, match["type"] or "text/plain"))
+
+    def serve(self, host: str, port: int):
+        """Serve GET /blobs/<id> on a background thread."""
+        store = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def do_GET(self):
+                prefix, _, blob_id = self.path.split("?", 1)[0].partition("/blobs/")
+                try:
+                    if prefix:
+                        raise ValueError(self.path)
+                    path = store.path(blob_id)
+                    size = os.path.getsize(path)
+                except (ValueError, OSError):
+                    self.send_error(404)
+                    return
+                etag = f'"{os.path.splitext(blob_id)[0]}"'
+                if self.headers.get("If-None-Match") == etag:
+                    self.send_response(304)
+                    self.send_header("ETag", etag)
+                    self.end_headers()
+                    return
+                self.send_response(200)
+                self.send_header("Content-Type", mimetypes.guess_type(path)[0] or "application/octet-stream")
+                self.send_header("Content-Length", str(size))
+                self.send_header("Cache-Control", "public, max-age=31536000, immutable")
+                self.send_header("ETag", etag)
+                self.end_headers()
+                with open(path, "rb") as f:
+                    while chunk := f.read(64 * 1024):
+                        self.wfile.write(chunk)
+
+        self._server = ThreadingHTTPServer((host, port), Handler)
+        self._server.daemon_threads = True
+        threading.Thread(target=self._server.serve_forever, name="blob-store", daemon=True).start()
+
+    def close(self):
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
@@ -0,0 +1,136 @@
+"""
+Keeps large values out of the checkpoints.sqlite rows.
+
+`OffloadingSerializer` wraps a saver's serializer. Strings and bytes longer
+than `threshold` anywhere in a checkpoint or pending write (e.g. an image
+returned as a data: URL) are written once to a content-addressed BlobStore
+and replaced by a short reference. References are resolved again when a
+checkpoint is read, since nodes receive channel values as plain Python
+values. Recently read or written values are cached up to a byte budget
+together with their blob ids, so a value carried over to the next checkpoint
+is not hashed or read again. Checkpoints are rewritten at every step, so a
+large value then costs one file instead of a copy in every row.
+
+`checkpoint_maintenance.maintain(..., blob_dir=...)` deletes blobs no longer
+referenced by any checkpoint or write.
+"""
+
+import os
+import re
+from collections import OrderedDict
+from typing import Any, Optional
+
+from blob_store import BlobStore
+
+REF_PREFIX = "checkpoint-blob://"
+# Matches references in serialized checkpoints without deserializing them
+REF_PATTERN = re.compile(rb"checkpoint-blob://[sb]/([0-9a-f]{32}(?:\.[a-z0-9]{1,5})?)")
+
+
+class OffloadingSerializer:
+    def __init__(self, blobs: BlobStore, threshold: int, serde, cache_bytes: int = 64 * 1024 * 1024):
+        self.blobs = blobs
+        self.threshold = threshold
+        self.serde = serde
+        self.cache_bytes = cache_bytes
+        # Values of recently resolved or offloaded blobs, least recently used
+        # first, and the reference of each of those values
+        self._values: OrderedDict[str, Any] = OrderedDict()
+        self._refs: dict[Any, str] = {}
+        self._cached_bytes = 0
+
+    def _remember(self, ref: str, value):
+        if ref in self._values:
+            self._values.move_to_end(ref)
+            return
+        if len(value) > self.cache_bytes:
+            return
+        self._values[ref] = value
+        self._refs[value] = ref
+        self._cached_bytes += len(value)
+        while self._cached_bytes > self.cache_bytes:
+            _, evicted = self._values.popitem(last=False)
+            del self._refs[evicted]
+            self._cached_bytes -= len(evicted)
+
+    def _offload(self, value: Any) -> Any:
+        kind = type(value)
+        if kind is dict:
+            return {key: self._offload(item) for key, item in value.items()}
+        if kind is list or kind is tuple:
+            return kind(self._offload(item) for item in value)
+        if (kind is str or kind is bytes) and len(value) > self.threshold:
+            ref = self._refs.get(value)
+            if ref is not None:
+                try:
+                    # Refresh the blob, so maintenance's grace period covers
+                    # the checkpoint about to refer to it; this also checks
+                    # that it was not swept
+                    os.utime(self.blobs.path(ref[2:]))
+                    self._values.move_to_end(ref)
+                    return REF_PREFIX + ref
+                except FileNotFoundError:
+                    pass
+            data, content_type = (value.encode("utf-8"), "text/plain") if kind is str \
+                else (value, "application/octet-stream")
+            # put() skips blobs that already exist, and one that maintenance
+            # swept is written again
+            blob_id = self.blobs.put(data, content_type)
+            try:
+                # Refresh a blob put() found already there
+                os.utime(self.blobs.path(blob_id))
+            except FileNotFoundError:
+                # Swept just now
+                self.blobs.put(data, content_type)
+            ref = f"{'s' if kind is str else 'b'}/{blob_id}"
+            self._remember(ref, value)
+            return REF_PREFIX + ref
+        return value
+
+    def _resolve(self, value: Any) -> Any:
+        kind = type(value)
+        if kind is dict:
+            return {key: self._resolve(item) for key, item in value.items()}
+        if kind is list or kind is tuple:
+            return kind(self._resolve(item) for item in value)
+        if kind is str and value.startswith(REF_PREFIX) and REF_PATTERN.fullmatch(value.encode()):
+            ref = value[len(REF_PREFIX):]
+            resolved = self._values.get(ref)
+            if resolved is None:
+                with open(self.blobs.path(ref[2:]), "rb") as f:
+                    resolved = f.read()
+                if ref[0] == "s":
+                    resolved = resolved.decode("utf-8")
+            self._remember(ref, resolved)
+            return resolved
+        return value
+
+    def dumps_typed(self, obj: Any) -> tuple[str, bytes]:
+        if self.threshold > 0:
+            obj = self._offload(obj)
+        return self.serde.dumps_typed(obj)
+
+    def loads_typed(self, data: tuple[str, bytes]) -> Any:
+        return self._resolve(self.serde.loads_typed(data))
+
+
+def offload_large_values(saver, root: Optional[str] = None, threshold: Optional[int] = None):
+    """Make `saver` keep values over `threshold` bytes in blobs under `root`.
+
+    Defaults come from CHECKPOINT_BLOB_DIR ("checkpoint_blobs") and
+    CHECKPOINT_BLOB_THRESHOLD (16384 bytes; 0 keeps every value inline).
+    """
+    root = root or os.getenv("CHECKPOINT_BLOB_DIR", "checkpoint_blobs")
+    if threshold is None:
+        threshold = int(os.getenv("CHECKPOINT_BLOB_THRESHOLD", "16384"))
+    saver.serde = OffloadingSerializer(BlobStore(root, ""), threshold, saver.serde)
+    return saver
+
+
+def referenced_blobs(rows) -> set[str]:
+    """Blob ids referenced by raw serialized checkpoints or writes."""
+    referenced = set()
+    for (data,) in rows:
+        if data:
+            referenced.update(match.decode() for match in REF_PATTERN.findall(bytes(data)))
+    return referenced
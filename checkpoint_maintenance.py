@@ -0,0 +1,260 @@
+"""
+Maintenance for the checkpoints.sqlite store shared by the LangGraph scripts.
+
+Keeps only the last N checkpoints per thread, expires idle (and optionally
+finished) threads, deletes offloaded blobs no checkpoint refers to any more,
+vacuums incrementally and reports what was reclaimed.
+Run it from the command line or call `maintain` on an open connection, as
+the Open WebUI pipeline does from a background task.
+
+Usage:
+    python checkpoint_maintenance.py --keep-last 10 --idle-ttl-hours 168
+"""
+
+import os
+import time
+import asyncio
+import argparse
+from typing import Optional
+
+import aiosqlite
+from langgraph.checkpoint.serde.jsonplus import JsonPlusSerializer
+
+from checkpoint_blobs import referenced_blobs
+
+# Offset between the UUID v6 epoch (1582-10-15) and the UNIX epoch, in 100 ns
+UUID_EPOCH_OFFSET = 0x01B21DD213814000
+
+
+def checkpoint_time(checkpoint_id: str) -> float:
+    """Return the UNIX time encoded in a time-ordered (v6) checkpoint id."""
+    h = checkpoint_id.replace("-", "")
+    ticks = (int(h[0:8], 16) << 28) | (int(h[8:12], 16) << 12) | int(h[13:16], 16)
+    return (ticks - UUID_EPOCH_OFFSET) / 1e7
+
+
+def _store_bytes(db_path: str) -> int:
+    return sum(
+        os.path.getsize(path)
+        for path in (db_path, f"{db_path}-wal")
+        if os.path.exists(path)
+    )
+
+
+async def tune_connection(conn: aiosqlite.Connection) -> None:
+    """Enable WAL with NORMAL sync, which is durable enough for checkpoints."""
+    await conn.execute("PRAGMA journal_mode=WAL")
+    await conn.execute("PRAGMA synchronous=NORMAL")
+    await conn.execute("PRAGMA busy_timeout=5000")
+
+
+async def _latest_checkpoints(conn: aiosqlite.Connection) -> list[tuple]:
+    async with conn.execute(
+        "SELECT thread_id, MAX(checkpoint_id) FROM checkpoints "
+        "WHERE checkpoint_ns = '' GROUP BY thread_id"
+    ) as cursor:
+        return await cursor.fetchall()
+
+
+async def _is_finished(conn: aiosqlite.Connection, serde: JsonPlusSerializer,
+                       thread_id: str, checkpoint_id: str) -> bool:
+    """A thread is finished when its latest checkpoint schedules no more work."""
+    async with conn.execute(
+        "SELECT 1 FROM writes WHERE thread_id = ? AND checkpoint_ns = '' "
+        "AND checkpoint_id = ? LIMIT 1", (thread_id, checkpoint_id)
+    ) as cursor:
+        if await cursor.fetchone() is not None:
+            return False
+    async with conn.execute(
+        "SELECT type, checkpoint FROM checkpoints WHERE thread_id = ? "
+        "AND checkpoint_ns = '' AND checkpoint_id = ?", (thread_id, checkpoint_id)
+    ) as cursor:
+        row = await cursor.fetchone()
+    checkpoint = serde.loads_typed(tuple(row))
+    return not any(
+        channel.startswith("branch:to:") or channel == "__start__"
+        for channel in checkpoint.get("channel_values", {})
+    )
+
+
+async def _sweep_blobs(conn: aiosqlite.Connection, blob_dir: str, grace: float) -> int:
+    """Delete blobs in `blob_dir` unreferenced by any checkpoint or write.
+
+    Blobs younger than `grace` seconds are kept, since a checkpoint
+    referring to them may still be on its way to the database.
+    """
+    referenced = set()
+    for query in ("SELECT checkpoint FROM checkpoints", "SELECT value FROM writes"):
+        async with conn.execute(query) as cursor:
+            referenced |= referenced_blobs(await cursor.fetchall())
+    deleted = 0
+    cutoff = time.time() - grace
+    for entry in os.scandir(blob_dir):
+        if (entry.is_file() and entry.name not in referenced
+                and not entry.name.endswith(".part") and entry.stat().st_mtime < cutoff):
+            os.unlink(entry.path)
+            deleted += 1
+    return deleted
+
+
+async def maintain(
+    conn: aiosqlite.Connection,
+    keep_last: Optional[int] = None,
+    idle_ttl: Optional[float] = None,
+    finished_ttl: Optional[float] = None,
+    vacuum_pages: int = 1000,
+    blob_dir: Optional[str] = None,
+    blob_grace: float = 3600,
+) -> dict:
+    """
+    Prune and compact a checkpoint database.
+
+    Args:
+        conn: Open connection to the checkpoint database
+        keep_last: Keep only this many most recent checkpoints per thread
+        idle_ttl: Delete threads whose last checkpoint is older than this many seconds
+        finished_ttl: Delete finished threads whose last checkpoint is older than this many seconds
+        vacuum_pages: Maximum number of free pages to release to the filesystem
+        blob_dir: Directory of offloaded checkpoint values to sweep (see checkpoint_blobs)
+        blob_grace: Keep unreferenced blobs younger than this many seconds
+
+    Returns:
+        A dict reporting threads expired, rows deleted and bytes reclaimed
+    """
+    async with conn.execute("PRAGMA database_list") as cursor:
+        db_path = next(row[2] for row in await cursor.fetchall() if row[1] == "main")
+    bytes_before = _store_bytes(db_path)
+    report = {"threads_expired": 0, "checkpoints_deleted": 0, "writes_deleted": 0, "blobs_deleted": 0}
+
+    async with conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'checkpoints'"
+    ) as cursor:
+        if await cursor.fetchone() is None:
+            # The saver has not created its tables yet, nothing to prune
+            keep_last = idle_ttl = finished_ttl = blob_dir = None
+
+    now = time.time()
+    expired = []
+    serde = JsonPlusSerializer()
+    expiring = idle_ttl is not None or finished_ttl is not None
+    latest = await _latest_checkpoints(conn) if expiring else []
+    for thread_id, checkpoint_id in latest:
+        age = now - checkpoint_time(checkpoint_id)
+        if idle_ttl is not None and age > idle_ttl:
+            expired.append(thread_id)
+        elif (finished_ttl is not None and age > finished_ttl
+                and await _is_finished(conn, serde, thread_id, checkpoint_id)):
+            expired.append(thread_id)
+    for thread_id in expired:
+        cursor = await conn.execute(
+            "DELETE FROM checkpoints WHERE thread_id = ?", (thread_id,))
+        report["checkpoints_deleted"] += cursor.rowcount
+        cursor = await conn.execute(
+            "DELETE FROM writes WHERE thread_id = ?", (thread_id,))
+        report["writes_deleted"] += cursor.rowcount
+    report["threads_expired"] = len(expired)
+
+    if keep_last is not None:
+        cursor = await conn.execute("""
+            DELETE FROM checkpoints WHERE rowid IN (
+                SELECT rowid FROM (
+                    SELECT rowid, ROW_NUMBER() OVER (
+                        PARTITION BY thread_id, checkpoint_ns
+                        ORDER BY checkpoint_id DESC
+                    ) AS position
+                    FROM checkpoints
+                ) WHERE position > ?
+            )
+        """, (max(1, keep_last),))
+        report["checkpoints_deleted"] += cursor.rowcount
+        cursor = await conn.execute("""
+            DELETE FROM writes WHERE NOT EXISTS (
+                SELECT 1 FROM checkpoints
+                WHERE checkpoints.thread_id = writes.thread_id
+                AND checkpoints.checkpoint_ns = writes.checkpoint_ns
+                AND checkpoints.checkpoint_id = writes.checkpoint_id
+            )
+        """)
+        report["writes_deleted"] += cursor.rowcount
+    await conn.commit()
+
+    if blob_dir is not None and os.path.isdir(blob_dir):
+        report["blobs_deleted"] = await _sweep_blobs(conn, blob_dir, blob_grace)
+
+    # Incremental vacuum needs auto_vacuum=INCREMENTAL, which only takes
+    # effect after one full VACUUM
+    async with conn.execute("PRAGMA auto_vacuum") as cursor:
+        (auto_vacuum,) = await cursor.fetchone()
+    if auto_vacuum != 2:
+        await conn.execute("PRAGMA auto_vacuum=INCREMENTAL")
+        await conn.execute("VACUUM")
+    else:
+        await conn.execute(f"PRAGMA incremental_vacuum({int(vacuum_pages)})")
+    await conn.commit()
+    await conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+
+    report["bytes_before"] = bytes_before
+    report["bytes_after"] = _store_bytes(db_path)
+    report["bytes_reclaimed"] = max(0, bytes_before - report["bytes_after"])
+    return report
+
+
+def format_report(report: dict) -> str:
+    return (
+        f"Expired {report['threads_expired']} threads, deleted "
+        f"{report['checkpoints_deleted']} checkpoints, {report['writes_deleted']} writes "
+        f"and {report['blobs_deleted']} blobs, "
+        f"reclaimed {report['bytes_reclaimed']:,} bytes "
+        f"({report['bytes_before']:,} -> {report['bytes_after']:,})"
+    )
+
+
+async def run_periodically(conn: aiosqlite.Connection, lock: asyncio.Lock,
+                           interval: float, **options) -> None:
+    """Run `maintain` every `interval` seconds, holding `lock` while it runs."""
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            async with lock:
+                report = await maintain(conn, **options)
+            print(f"Checkpoint maintenance: {format_report(report)}")
+        except Exception as e:
+            print(f"Checkpoint maintenance failed: {e}")
+
+
+async def main():
+    parser = argparse.ArgumentParser(
+        prog="Checkpoint maintenance",
+        description="Prune, expire and vacuum a LangGraph checkpoints.sqlite store."
+    )
+    parser.add_argument("--db", default="checkpoints.sqlite")
+    parser.add_argument("--keep-last", type=int,
+                        help="Keep only the N most recent checkpoints per thread")
+    parser.add_argument("--idle-ttl-hours", type=float,
+                        help="Delete threads idle for longer than this")
+    parser.add_argument("--finished-ttl-hours", type=float,
+                        help="Delete finished threads idle for longer than this")
+    parser.add_argument("--vacuum-pages", type=int, default=1000,
+                        help="Maximum free pages to release per run")
+    parser.add_argument("--blob-dir", default=os.getenv("CHECKPOINT_BLOB_DIR", "checkpoint_blobs"),
+                        help="Directory of offloaded checkpoint values to sweep")
+
+    args = parser.parse_args()
+    idle_ttl = args.idle_ttl_hours * 3600 if args.idle_ttl_hours is not None else None
+    finished_ttl = args.finished_ttl_hours * 3600 if args.finished_ttl_hours is not None else None
+
+    async with aiosqlite.connect(args.db) as conn:
+        await tune_connection(conn)
+        report = await maintain(
+            conn,
+            keep_last=args.keep_last,
+            idle_ttl=idle_ttl,
+            finished_ttl=finished_ttl,
+            vacuum_pages=args.vacuum_pages,
+            blob_dir=args.blob_dir,
+        )
+    print(format_report(report))
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -13,15 +13,29 @@
 from typing_extensions import TypedDict
 from langgraph.graph import StateGraph, START, END
 from langgraph.types import interrupt, Command
+from langgraph.errors import GraphInterrupt
 from langgraph.checkpoint.sqlite.aio import AsyncSqliteSaver
-from mcp import ClientSession, StdioServerParameters
-from mcp.client.stdio import stdio_client
+from langchain_core.runnables import RunnableConfig
+from mcp import StdioServerParameters
+from mcp_pool import MCPSessionPool
+from checkpoint_maintenance import tune_connection
+from checkpoint_blobs import offload_large_values
+from prompt_templates import PromptTemplates, format_prompt, pick_candidate
+from speculative import SpeculativeRuns
+import metrics
 import os
 import asyncio
+from contextlib import aclosing
 import argparse
+import json
+import math
+import time
+import uuid
 
-# Updated server parameters for our DALL-E MCP server
-server_params = StdioServerParameters(
+# Updated server parameters for our DALL-E MCP server. IMAGE_MCP_URL points at
+# a long-lived server started with `main.py --transport streamable-http`
+# (e.g. http://127.0.0.1:8000/mcp) instead of spawning one over stdio
+server_params = os.getenv("IMAGE_MCP_URL") or StdioServerParameters(
     command="uv",
     args=["run", "main.py"],
     cwd=os.path.dirname(os.path.abspath(__file__)),
@@ -35,72 +49,92 @@ server_params = StdioServerParameters(
 class State(TypedDict):
     topic: str
     prompt: str
+    candidates: list[str]
     user_feedback: str
     image_url: str
 
 
+# Style templates for generate_prompt, reloaded when the file changes
+prompt_templates = PromptTemplates(os.getenv(
+    "PROMPT_TEMPLATES_FILE",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "prompt_templates.json")))
+
+# Candidate prompts offered per review round; more than one lets the user
+# pick by number instead of rejecting prompts one at a time. A run can set
+# its own count with the "candidates" configurable
+PROMPT_CANDIDATES = int(os.getenv("PROMPT_CANDIDATES", "1"))
+
+# Warm MCP server processes shared by every tool call; identical image
+# requests in flight at once (e.g. in batch mode) share one generation
+pool = MCPSessionPool(server_params, coalesce=("generate_image",))
+
+
+# Image generations started while a thread waits at prompt_feedback
+speculative = SpeculativeRuns()
+
+
 async def run_tool(tool: str, args: dict) -> str:
-    async with stdio_client(server_params) as (read, write):
-        async with ClientSession(read, write) as session:
-            await session.initialize()
-            return await session.call_tool(
-                tool, arguments=args
-            )
+    return await pool.call_tool(tool, args)
+
+
+def image_args(prompt: str) -> dict:
+    return {
+        "prompt": prompt,
+        "model": "dall-e-3",
+        "size": "1024x1024",
+        "quality": "standard"
+    }
 
 
-async def generate_prompt(state: State) -> State:
+@metrics.node
+async def generate_prompt(state: State, config: RunnableConfig) -> State:
     """Generate an enhanced prompt for DALL-E based on the topic"""
     topic = state["topic"]
+    # A new prompt is coming, so any image speculated for the old one is wasted
+    speculative.discard(config["configurable"]["thread_id"])
     
-    # Enhanced prompt generation for better DALL-E results
-    enhanced_prompts = {
-        "cat": f"{topic}, highly detailed, photorealistic, professional photography, studio lighting",
-        "robot": f"{topic}, futuristic design, sleek metallic surfaces, LED details, cinematic lighting",
-        "landscape": f"{topic}, breathtaking vista, golden hour lighting, ultra-wide angle, 8K quality",
-        "portrait": f"{topic}, professional portrait, soft natural lighting, shallow depth of field",
-        "abstract": f"{topic}, abstract art style, vibrant colors, dynamic composition, modern art",
-    }
-    
-    # Simple keyword matching or use the topic directly with enhancement
-    enhanced_prompt = topic
-    for keyword, template in enhanced_prompts.items():
-        if keyword.lower() in topic.lower():
-            enhanced_prompt = template
-            break
-    else:
-        # Default enhancement if no keyword matches
-        enhanced_prompt = f"{topic}, high quality, detailed, professional, artistic"
-    
-    state["prompt"] = enhanced_prompt
+    # Enhanced prompt generation for better DALL-E results, using the best
+    # keyword-matched style templates and the default enhancement
+    count = config["configurable"].get("candidates", PROMPT_CANDIDATES)
+    state["candidates"] = prompt_templates.candidates(topic, count)
+    state["prompt"] = state["candidates"][0]
     return state
 
 
-async def generate_image(state: State) -> State:
+@metrics.node
+async def generate_image(state: State, config: RunnableConfig) -> State:
     """Generate image using DALL-E MCP server"""
     prompt = state["prompt"]
-    result = await run_tool("generate_image", {
-        "prompt": prompt,
-        "model": "dall-e-3",
-        "size": "1024x1024",
-        "quality": "standard"
-    })
+    # Adopt the image speculatively generated while the prompt was reviewed
+    result = await speculative.adopt(config["configurable"]["thread_id"], prompt)
+    if result is None:
+        result = await run_tool("generate_image", image_args(prompt))
     # The result should contain the file path and success message
     state["image_url"] = result.content[0].text
     return state
 
 
+@metrics.node(ignore=(GraphInterrupt,))
 def prompt_feedback(state: State) -> State:
-    state["user_feedback"] = interrupt({
+    candidates = state.get("candidates") or [state["prompt"]]
+    value = {
         "topic": state["topic"],
         "prompt": state["prompt"],
         "action": "Do you like this prompt? (y/n)"
-    })
+    }
+    if len(candidates) > 1:
+        value["candidates"] = candidates
+        value["action"] = f"Pick a prompt (1-{len(candidates)}), or n for new ones"
+    state["user_feedback"] = interrupt(value)
+    choice = pick_candidate(state["user_feedback"], candidates)
+    if choice is not None:
+        state["prompt"] = candidates[choice]
     return state
 
 
 def process_feedback(state: State) -> str:
-    user_feedback = state["user_feedback"]
-    if len(user_feedback.strip()) == 0 or user_feedback.lower().strip()[0] == "y":
+    candidates = state.get("candidates") or [state["prompt"]]
+    if pick_candidate(state["user_feedback"], candidates) is not None:
         return "generate_image"
     return "generate_prompt"
 
@@ -115,6 +149,106 @@ builder.add_conditional_edges("prompt_feedback", process_feedback)
 builder.add_edge("generate_image", END)
 
 
+def percentile(values: list[float], pct: float) -> float:
+    """Nearest-rank percentile of a non-empty list."""
+    ordered = sorted(values)
+    rank = max(1, math.ceil(pct / 100 * len(ordered)))
+    return ordered[rank - 1]
+
+
+def parse_job(line: str) -> dict:
+    """Parse one line of a batch file, raising ValueError if it is not a valid job."""
+    job = json.loads(line)
+    if not isinstance(job, dict):
+        raise ValueError("a job must be a JSON object")
+    if not isinstance(job.get("topic"), str) or not job["topic"].strip():
+        raise ValueError('a job needs a non-empty "topic" string')
+    return job
+
+
+async def run_job(graph, job: dict, auto_approve: bool, candidates: int = PROMPT_CANDIDATES) -> dict:
+    """Drive one thread through the graph, answering interrupts from the job's feedback."""
+    thread_id = job.get("thread_id") or uuid.uuid4().hex
+    config = {"configurable": {"thread_id": thread_id, "candidates": candidates}}
+    result = {"thread_id": thread_id, "topic": job.get("topic"), "status": "done"}
+
+    started = time.perf_counter()
+    try:
+        feedback = job.get("feedback", [])
+        if isinstance(feedback, str):
+            feedback = [feedback]
+        feedback = list(feedback)
+        prompt = {"topic": job["topic"]}
+        state = await graph.aget_state(config)
+        if state.next and state.next[0] == "prompt_feedback" and feedback:
+            # Continue a thread left waiting for feedback by an earlier batch
+            prompt = Command(resume=feedback.pop(0))
+        while prompt is not None:
+            next_prompt = None
+            async for item in graph.astream(prompt, config):
+                if "__interrupt__" in item:
+                    value = item['__interrupt__'][0].value
+                    result["prompt"] = value["prompt"]
+                    if feedback:
+                        next_prompt = Command(resume=feedback.pop(0))
+                    elif auto_approve:
+                        next_prompt = Command(resume="y")
+                    else:
+                        result["status"] = "awaiting_feedback"
+                elif "generate_image" in item:
+                    result["image_url"] = item['generate_image']['image_url']
+            prompt = next_prompt
+    except Exception as e:
+        result["status"] = "error"
+        result["error"] = str(e)
+    result["seconds"] = round(time.perf_counter() - started, 3)
+    return result
+
+
+async def run_batch(graph, path: str, output: str, concurrency: int, auto_approve: bool,
+                    candidates: int = PROMPT_CANDIDATES):
+    """Run every job in a JSONL file concurrently, streaming results to `output`.
+
+    Lines that are not valid jobs get an error result of their own instead of
+    stopping the batch. Every result carries the line number of its job.
+    """
+    jobs = []
+    with open(path) as f:
+        for number, line in enumerate(f, 1):
+            if not line.strip():
+                continue
+            try:
+                jobs.append((number, parse_job(line), None))
+            except ValueError as e:
+                jobs.append((number, None, f"Invalid job: {e}"))
+    # At least one job runs at a time, whatever --concurrency says
+    slots = asyncio.Semaphore(max(1, concurrency))
+
+    async def run(number: int, job: dict, error: str) -> dict:
+        if error is not None:
+            return {"line": number, "status": "error", "error": error, "seconds": 0.0}
+        async with slots:
+            return {"line": number, **await run_job(graph, job, auto_approve, candidates)}
+
+    latencies = []
+    statuses = {}
+    started = time.perf_counter()
+    with open(output, "w") as out:
+        for done in asyncio.as_completed([run(*job) for job in jobs]):
+            result = await done
+            out.write(json.dumps(result) + "\n")
+            out.flush()
+            latencies.append(result["seconds"])
+            statuses[result["status"]] = statuses.get(result["status"], 0) + 1
+    elapsed = time.perf_counter() - started
+
+    print(f"Threads: {len(jobs)} ({', '.join(f'{k}: {v}' for k, v in statuses.items())})")
+    print(f"Elapsed: {elapsed:.2f}s, throughput: {len(jobs) / elapsed:.2f} threads/s")
+    if latencies:
+        print("Latency: " + ", ".join(
+            f"p{pct}={percentile(latencies, pct):.3f}s" for pct in (50, 90, 99)))
+
+
 async def main():
     parser = argparse.ArgumentParser(
         prog="DALL-E LangGraph MCP",
@@ -123,8 +257,37 @@ async def main():
     parser.add_argument("--thread_id")
     parser.add_argument("--topic", default="A cute robot holding a 'Hello World' sign")
     parser.add_argument("--feedback")
+    parser.add_argument(
+        "--candidates", type=int, default=PROMPT_CANDIDATES,
+        help="Candidate prompts offered per review round; answer with the number of the one to use")
+    parser.add_argument(
+        "--speculative", action="store_true",
+        default=os.getenv("SPECULATIVE_GENERATION", "").lower() in ("1", "true", "yes"),
+        help="Start generating the image for a proposed prompt before it is approved")
+    parser.add_argument(
+        "--batch",
+        help="JSONL file of jobs ({\"topic\": ..., \"thread_id\": ..., \"feedback\": [...]}) to run concurrently")
+    parser.add_argument("--output", default="results.jsonl", help="JSONL file for batch results")
+    parser.add_argument("--concurrency", type=int, default=8, help="Threads run at once in batch mode")
+    parser.add_argument(
+        "--auto-approve", action="store_true",
+        help="In batch mode, approve prompts for jobs that run out of feedback")
 
     args = parser.parse_args()
+    # Exposes metrics when METRICS_PORT or METRICS_FILE is set
+    metrics.start_exporter_from_env()
+    if args.batch:
+        # One saver and one session pool shared by every thread in the batch
+        pool.max_size = max(pool.max_size, args.concurrency)
+        async with AsyncSqliteSaver.from_conn_string("checkpoints.sqlite") as saver, aclosing(pool):
+            await tune_connection(saver.conn)
+            offload_large_values(saver)
+            metrics.instrument_saver(saver)
+            graph = builder.compile(checkpointer=saver)
+            await run_batch(graph, args.batch, args.output, args.concurrency, args.auto_approve,
+                            max(1, args.candidates))
+        return
+
     thread_id = args.thread_id
     topic = args.topic
     feedback = args.feedback
@@ -133,27 +296,44 @@ async def main():
     config = {
         "configurable": {
             "thread_id": thread_id,
+            "candidates": max(1, args.candidates),
         }
     }
 
     prompt = {"topic": topic}
-    async with AsyncSqliteSaver.from_conn_string("checkpoints.sqlite") as saver:
+    async with AsyncSqliteSaver.from_conn_string("checkpoints.sqlite") as saver, aclosing(pool):
+        await tune_connection(saver.conn)
+        offload_large_values(saver)
+        metrics.instrument_saver(saver)
         graph = builder.compile(checkpointer=saver)
         state = await graph.aget_state(config)
         next = state.next[0] if len(state.next) > 0 else None
         if next == "prompt_feedback" and feedback is not None:
             prompt = Command(resume=feedback)
-        async for item in graph.astream(prompt, config):
-            step = list(item.keys())[0]
-            print(f"Step: {step}")
-            if "__interrupt__" in item:
-                value = item['__interrupt__'][0].value
-                print(
-                    f"Prompt: {value['prompt']}\n\nAction: {value['action']}")
-            elif "generate_image" in item:
-                value = item['generate_image']
-                print(f"Generated: {value['image_url']}")
+        while True:
+            async for item in graph.astream(prompt, config):
+                step = list(item.keys())[0]
+                print(f"Step: {step}")
+                if "__interrupt__" in item:
+                    value = item['__interrupt__'][0].value
+                    print(f"{format_prompt(value)}\n\nAction: {value['action']}")
+                    if args.speculative:
+                        speculative.start(thread_id, value['prompt'], run_tool(
+                            "generate_image", image_args(value['prompt'])))
+                elif "generate_image" in item:
+                    value = item['generate_image']
+                    print(f"Generated: {value['image_url']}")
 
+            # The image is being generated speculatively, so read the feedback
+            # in this process: approving adopts the run, rejecting cancels it
+            if not speculative.pending(thread_id):
+                break
+            try:
+                answer = await asyncio.to_thread(input, "Feedback: ")
+            except EOFError:
+                speculative.discard(thread_id)
+                break
+            prompt = Command(resume=answer)
 
 if __name__ == "__main__":
     asyncio.run(main())
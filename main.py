@@ -1,8 +1,39 @@
+import time
+
+started = time.perf_counter()
+
+import os
+import sys
+import argparse
+from dotenv import load_dotenv
+
+# Load environment variables before the tools read their settings
+load_dotenv()
+
 from server import mcp
+import metrics
 
 # Import tools so they get registered via decorators
 import tools.image_tools
+import tools.comfy_tools
 
 # Entry point to run the server
 if __name__ == "__main__":
-    mcp.run()
+    parser = argparse.ArgumentParser(description="Image generation MCP server")
+    parser.add_argument(
+        "--transport",
+        choices=["stdio", "sse", "streamable-http"],
+        default=os.getenv("MCP_TRANSPORT", "stdio"),
+        help="stdio for one server per client, or an HTTP transport for one long-lived server")
+    parser.add_argument("--host", default=os.getenv("MCP_HOST", "127.0.0.1"))
+    parser.add_argument("--port", type=int, default=int(os.getenv("MCP_PORT", "8000")))
+    args = parser.parse_args()
+
+    # Exposes the server's metrics when IMAGE_SERVER_METRICS_PORT/_FILE is set
+    metrics.start_exporter_from_env("IMAGE_SERVER_METRICS")
+    mcp.settings.host = args.host
+    mcp.settings.port = args.port
+    # stdout carries the stdio transport, so report on stderr
+    print(f"Image MCP server started in {(time.perf_counter() - started) * 1000:.0f} ms "
+          f"({args.transport})", file=sys.stderr)
+    mcp.run(transport=args.transport)
@@ -0,0 +1,261 @@
+import os
+import json
+import time
+import asyncio
+from contextlib import asynccontextmanager
+from typing import Iterable, Optional, Union
+
+from mcp import ClientSession, StdioServerParameters
+from mcp.client.stdio import stdio_client
+
+import metrics
+from single_flight import SingleFlight
+
+# Stdio parameters spawn a server process per session; a URL connects to a
+# long-lived server over streamable HTTP (or SSE for URLs ending in /sse)
+ServerParams = Union[StdioServerParameters, str]
+
+
+@asynccontextmanager
+async def _connect(server_params: ServerParams):
+    if not isinstance(server_params, str):
+        async with stdio_client(server_params) as (read, write):
+            yield read, write
+    elif server_params.rstrip("/").endswith("/sse"):
+        from mcp.client.sse import sse_client
+        async with sse_client(server_params) as (read, write):
+            yield read, write
+    else:
+        from mcp.client.streamable_http import streamablehttp_client
+        async with streamablehttp_client(server_params) as (read, write, _):
+            yield read, write
+
+
+def _call_key(tool: str, args: dict) -> str:
+    """Key of a tool call, ignoring whitespace differences in string arguments."""
+    normalized = {
+        name: " ".join(value.split()) if isinstance(value, str) else value
+        for name, value in args.items()
+    }
+    return json.dumps([tool, normalized], sort_keys=True, default=str)
+
+
+class _PooledSession:
+    """A single MCP server process with an initialized ClientSession.
+
+    The stdio transport and the session are async context managers that must be
+    entered and exited from the same task, so each pooled session owns a
+    background task that keeps them open until the session is closed.
+    """
+
+    def __init__(self, server_params: ServerParams):
+        self.server_params = server_params
+        self.session: Optional[ClientSession] = None
+        self.last_used = time.monotonic()
+        self.last_checked = self.last_used
+        self._closing = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+
+    async def start(self):
+        ready = asyncio.get_running_loop().create_future()
+        self._task = asyncio.create_task(self._run(ready))
+        await ready
+
+    async def _run(self, ready: asyncio.Future):
+        try:
+            async with _connect(self.server_params) as (read, write):
+                async with ClientSession(read, write) as session:
+                    await session.initialize()
+                    self.session = session
+                    ready.set_result(None)
+                    await self._closing.wait()
+        except Exception as e:
+            if not ready.done():
+                ready.set_exception(e)
+        finally:
+            self.session = None
+            if not ready.done():
+                ready.cancel()
+
+    @property
+    def alive(self) -> bool:
+        return self.session is not None and not self._task.done()
+
+    async def ping(self, timeout: float) -> bool:
+        if not self.alive:
+            return False
+        try:
+            await asyncio.wait_for(self.session.send_ping(), timeout)
+        except Exception:
+            return False
+        self.last_checked = time.monotonic()
+        return True
+
+    async def close(self):
+        self._closing.set()
+        if self._task is not None:
+            try:
+                await self._task
+            except BaseException:
+                pass
+
+
+class MCPSessionPool:
+    """A pool of warm MCP server processes shared by every tool call.
+
+    Sessions are spawned lazily up to `max_size`, checked out for the duration
+    of one tool call and returned afterwards. Sessions idle for longer than
+    `health_check_interval` are pinged before reuse, dead sessions are replaced
+    transparently, and sessions idle for longer than `idle_timeout` are reaped
+    down to `min_size`.
+
+    Calls to the tools named in `coalesce` are single-flighted: identical
+    concurrent calls share one call's result.
+
+    `server_params` is either StdioServerParameters, to spawn one server
+    process per session, or the URL of a server already running with an HTTP
+    transport, in which case sessions are just connections to it.
+
+    Defaults can be overridden with the MCP_POOL_SIZE, MCP_POOL_MIN_SIZE,
+    MCP_POOL_IDLE_TIMEOUT and MCP_POOL_HEALTH_CHECK_INTERVAL environment
+    variables.
+
+    The pool is bound to the event loop it is first used on. If it is used
+    from a different loop later (e.g. after `asyncio.run` returned) the old
+    sessions are discarded and new ones are spawned on the new loop.
+    """
+
+    def __init__(
+        self,
+        server_params: ServerParams,
+        max_size: Optional[int] = None,
+        min_size: Optional[int] = None,
+        idle_timeout: Optional[float] = None,
+        health_check_interval: Optional[float] = None,
+        ping_timeout: float = 5.0,
+        coalesce: Iterable[str] = (),
+    ):
+        self.server_params = server_params
+        self.max_size = max_size or int(os.getenv("MCP_POOL_SIZE", "4"))
+        self.min_size = min_size if min_size is not None else int(
+            os.getenv("MCP_POOL_MIN_SIZE", "1"))
+        self.idle_timeout = idle_timeout or float(
+            os.getenv("MCP_POOL_IDLE_TIMEOUT", "300"))
+        self.health_check_interval = health_check_interval or float(
+            os.getenv("MCP_POOL_HEALTH_CHECK_INTERVAL", "30"))
+        self.ping_timeout = ping_timeout
+        # Concurrent identical calls to these tools share one call
+        self.coalesce = frozenset(coalesce)
+        self.flights = SingleFlight("mcp_tool_call")
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._idle: list[_PooledSession] = []
+        self._sessions: set[_PooledSession] = set()
+        self._slots: Optional[asyncio.Semaphore] = None
+        self._reaper: Optional[asyncio.Task] = None
+
+    def _bind_loop(self):
+        loop = asyncio.get_running_loop()
+        if self._loop is loop:
+            return
+        # Sessions created on a previous loop died with it
+        self._loop = loop
+        self._idle = []
+        self._sessions = set()
+        self._slots = asyncio.Semaphore(self.max_size)
+        self._reaper = asyncio.create_task(self._reap())
+
+    async def _spawn(self) -> _PooledSession:
+        pooled = _PooledSession(self.server_params)
+        with metrics.timed("mcp_session_spawn"):
+            await pooled.start()
+        self._sessions.add(pooled)
+        return pooled
+
+    async def _discard(self, pooled: _PooledSession):
+        self._sessions.discard(pooled)
+        await pooled.close()
+
+    async def _acquire(self) -> _PooledSession:
+        while self._idle:
+            pooled = self._idle.pop()
+            stale = time.monotonic() - pooled.last_checked > self.health_check_interval
+            if pooled.alive and (not stale or await pooled.ping(self.ping_timeout)):
+                return pooled
+            await self._discard(pooled)
+        return await self._spawn()
+
+    def _release(self, pooled: _PooledSession):
+        pooled.last_used = pooled.last_checked = time.monotonic()
+        self._idle.append(pooled)
+
+    async def _reap(self):
+        while True:
+            await asyncio.sleep(min(self.idle_timeout, self.health_check_interval))
+            now = time.monotonic()
+            for pooled in list(self._idle):
+                if len(self._sessions) <= self.min_size:
+                    break
+                if now - pooled.last_used > self.idle_timeout:
+                    self._idle.remove(pooled)
+                    await self._discard(pooled)
+
+    async def start(self):
+        """Spawn `min_size` sessions up front so the first tool call is warm."""
+        self._bind_loop()
+        while len(self._sessions) < self.min_size:
+            self._release(await self._spawn())
+
+    async def call_tool(self, tool: str, args: dict, progress_callback=None):
+        """Call `tool` on a pooled session, respawning it once if it crashed.
+
+        `progress_callback(progress, total, message)` receives the server's
+        progress notifications for this call. Calls to `coalesce` tools with
+        the same arguments as a call already in flight wait for its result
+        instead, and only the first caller receives progress.
+        """
+        if tool in self.coalesce:
+            return await self.flights.do(
+                _call_key(tool, args), lambda: self._call_tool(tool, args, progress_callback))
+        return await self._call_tool(tool, args, progress_callback)
+
+    async def _call_tool(self, tool: str, args: dict, progress_callback=None):
+        self._bind_loop()
+        async with self._slots:
+            for attempt in range(2):
+                pooled = await self._acquire()
+                try:
+                    with metrics.timed("mcp_tool_call", tool=tool):
+                        result = await pooled.session.call_tool(
+                            tool, arguments=args, progress_callback=progress_callback)
+                except asyncio.CancelledError:
+                    # The server is fine, only this caller gave up on the result
+                    self._release(pooled)
+                    raise
+                except Exception:
+                    if await pooled.ping(self.ping_timeout):
+                        self._release(pooled)
+                        raise
+                    # The server process died under us, retry once on a fresh one
+                    await self._discard(pooled)
+                    if attempt > 0:
+                        raise
+                    continue
+                self._release(pooled)
+                return result
+
+    async def aclose(self):
+        if self._reaper is not None:
+            self._reaper.cancel()
+            self._reaper = None
+        sessions, self._sessions, self._idle = self._sessions, set(), []
+        if self._loop is asyncio.get_running_loop():
+            for pooled in sessions:
+                await pooled.close()
+        self._loop = None
+
+    async def __aenter__(self):
+        await self.start()
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.aclose()
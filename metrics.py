@@ -0,0 +1,245 @@
+"""
+In-process metrics for the pipeline scripts and the image MCP server.
+
+Operations are timed with `timed(name, **labels)`, which records a
+`<name>_duration_seconds` histogram, a `<name>_in_flight` gauge and a
+`<name>_errors_total` counter; `count` increments plain counters such as
+cache hits. Everything is a no-op until `enable` (or `start_exporter`) is
+called, so the instrumentation costs one attribute check when disabled.
+
+Metrics are exposed in the Prometheus text format on a local HTTP port
+and/or written periodically to a file for the node_exporter textfile
+collector.
+"""
+
+import os
+import sys
+import time
+import atexit
+import inspect
+import functools
+import threading
+from contextlib import contextmanager, nullcontext
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from typing import Optional
+
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+
+_enabled = False
+_lock = threading.Lock()
+# name -> (type, help, {label tuple: value}); histogram values are [bucket counts..., sum, count]
+_metrics: dict[str, tuple[str, str, dict]] = {}
+_disabled = nullcontext()
+
+
+def enable():
+    global _enabled
+    _enabled = True
+
+
+def enabled() -> bool:
+    return _enabled
+
+
+def _labels(labels: dict) -> tuple:
+    return tuple(sorted((key, str(value)) for key, value in labels.items()))
+
+
+def _series(name: str, kind: str, help: str, labels: dict):
+    metric = _metrics.get(name)
+    if metric is None:
+        metric = _metrics[name] = (kind, help, {})
+    return metric[2], _labels(labels)
+
+
+def count(name: str, amount: float = 1, help: str = "", **labels):
+    """Increment the counter `name`."""
+    if not _enabled:
+        return
+    with _lock:
+        values, key = _series(name, "counter", help, labels)
+        values[key] = values.get(key, 0) + amount
+
+
+def gauge(name: str, amount: float, help: str = "", **labels):
+    """Add `amount` (which may be negative) to the gauge `name`."""
+    if not _enabled:
+        return
+    with _lock:
+        values, key = _series(name, "gauge", help, labels)
+        values[key] = values.get(key, 0) + amount
+
+
+def observe(name: str, value: float, help: str = "", **labels):
+    """Record `value` in the histogram `name`."""
+    if not _enabled:
+        return
+    with _lock:
+        values, key = _series(name, "histogram", help, labels)
+        series = values.get(key)
+        if series is None:
+            series = values[key] = [0] * (len(BUCKETS) + 2)
+        for i, bound in enumerate(BUCKETS):
+            if value <= bound:
+                series[i] += 1
+        series[-2] += value
+        series[-1] += 1
+
+
+@contextmanager
+def _timed(name: str, ignore: tuple, labels: dict):
+    gauge(f"{name}_in_flight", 1, f"{name} operations in progress", **labels)
+    started = time.perf_counter()
+    try:
+        yield
+    except Exception as e:
+        # Cancellation is a BaseException and is not counted as a failure
+        if not isinstance(e, ignore):
+            count(f"{name}_errors_total", 1, f"Failed {name} operations", **labels)
+        raise
+    finally:
+        observe(f"{name}_duration_seconds", time.perf_counter() - started,
+                f"Duration of {name} operations", **labels)
+        gauge(f"{name}_in_flight", -1, **labels)
+
+
+def timed(name: str, ignore: tuple = (), **labels):
+    """Context manager timing one `name` operation.
+
+    Exceptions of the `ignore` types (such as LangGraph interrupts) are not
+    counted as errors.
+    """
+    if not _enabled:
+        return _disabled
+    return _timed(name, ignore, labels)
+
+
+def node(func=None, *, ignore: tuple = ()):
+    """Decorator timing a graph node or task as `graph_node{node=<function name>}`."""
+    if func is None:
+        return functools.partial(node, ignore=ignore)
+    name = func.__name__
+
+    if inspect.iscoroutinefunction(func):
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            with timed("graph_node", ignore, node=name):
+                return await func(*args, **kwargs)
+    else:
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with timed("graph_node", ignore, node=name):
+                return func(*args, **kwargs)
+    return wrapper
+
+
+def instrument_saver(saver):
+    """Time the checkpoint reads and writes of an async LangGraph saver in place."""
+    if not _enabled:
+        return saver
+    for operation in ("aget_tuple", "aput", "aput_writes"):
+        method = getattr(saver, operation)
+
+        async def wrapper(*args, _method=method, _operation=operation, **kwargs):
+            with timed("checkpoint", operation=_operation):
+                return await _method(*args, **kwargs)
+        setattr(saver, operation, wrapper)
+    return saver
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+
+def _format_labels(key: tuple, extra: tuple = ()) -> str:
+    pairs = key + extra
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in pairs) + "}"
+
+
+def render() -> str:
+    """Return all metrics in the Prometheus text exposition format."""
+    lines = []
+    with _lock:
+        for name, (kind, help, values) in sorted(_metrics.items()):
+            if help:
+                lines.append(f"# HELP {name} {help}")
+            lines.append(f"# TYPE {name} {kind}")
+            for key, value in sorted(values.items()):
+                if kind != "histogram":
+                    lines.append(f"{name}{_format_labels(key)} {value}")
+                    continue
+                for bound, bucket in zip(BUCKETS, value):
+                    lines.append(f"{name}_bucket{_format_labels(key, (('le', str(bound)),))} {bucket}")
+                lines.append(f"{name}_bucket{_format_labels(key, (('le', '+Inf'),))} {value[-1]}")
+                lines.append(f"{name}_sum{_format_labels(key)} {value[-2]}")
+                lines.append(f"{name}_count{_format_labels(key)} {value[-1]}")
+    return "\n".join(lines) + "\n"
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        body = render().encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+def write(path: str):
+    """Atomically write the current metrics to `path`."""
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    try:
+        with open(tmp_path, "w") as f:
+            f.write(render())
+        os.replace(tmp_path, path)
+    except OSError as e:
+        print(f"Writing metrics to {path} failed: {e}", file=sys.stderr)
+
+
+def _write_periodically(path: str, interval: float):
+    while True:
+        write(path)
+        time.sleep(interval)
+
+
+def start_exporter(port: Optional[int] = None, path: Optional[str] = None,
+                   host: str = "127.0.0.1", interval: float = 15.0):
+    """Enable metrics and expose them on `host:port` and/or in the file `path`.
+
+    Args:
+        port: Serve /metrics on this port (None or 0 to skip)
+        path: Rewrite this file every `interval` seconds; `{pid}` is replaced
+            by the process id so several server processes can share a setting
+        host: Interface to bind the HTTP exporter to
+        interval: Seconds between file writes
+    """
+    enable()
+    if port:
+        try:
+            server = ThreadingHTTPServer((host, port), _MetricsHandler)
+        except OSError as e:
+            # Usually another pooled server process already owns the port
+            print(f"Metrics exporter could not bind {host}:{port}: {e}", file=sys.stderr)
+        else:
+            server.daemon_threads = True
+            threading.Thread(target=server.serve_forever, daemon=True).start()
+    if path:
+        path = path.replace("{pid}", str(os.getpid()))
+        threading.Thread(target=_write_periodically, args=(path, interval), daemon=True).start()
+        # Short-lived scripts exit before the first interval
+        atexit.register(write, path)
+
+
+def start_exporter_from_env(prefix: str = "METRICS"):
+    """Start the exporter if `<prefix>_PORT` or `<prefix>_FILE` is set."""
+    port = int(os.getenv(f"{prefix}_PORT", "0"))
+    path = os.getenv(f"{prefix}_FILE")
+    if port or path:
+        start_exporter(port, path, os.getenv(f"{prefix}_HOST", "127.0.0.1"),
+                       float(os.getenv(f"{prefix}_INTERVAL", "15")))
@@ -0,0 +1,101 @@
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+from typing import Optional
+
+import metrics
+
+
+def normalize_topic(topic: str) -> str:
+    """Topics differing only in case, spacing or end punctuation share a key."""
+    return " ".join(topic.casefold().split()).strip(" .!?")
+
+
+class PromptCache:
+    """Persistent cache of prompts an LLM wrote for a topic.
+
+    Entries are keyed by a SHA-256 of the normalized topic, the model and a
+    template version, so changing the model or bumping the version never
+    serves prompts written the old way. Each entry holds the list of
+    prompts written for the topic, expires `ttl` seconds after it was
+    written, and the least recently used entries are evicted beyond
+    `max_entries`. A `max_entries` of 0 or less disables the cache.
+    """
+
+    def __init__(self, db_path: str, ttl: float, max_entries: int):
+        self.db_path = os.path.abspath(db_path)
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._db = None
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._db is None:
+            self._db = sqlite3.connect(
+                self.db_path, check_same_thread=False, isolation_level=None)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute("""
+                CREATE TABLE IF NOT EXISTS prompts (
+                    key TEXT PRIMARY KEY,
+                    topic TEXT NOT NULL,
+                    prompts TEXT NOT NULL,
+                    requested INTEGER NOT NULL,
+                    created REAL NOT NULL,
+                    last_access REAL NOT NULL
+                )
+            """)
+            self._db.execute(
+                "CREATE INDEX IF NOT EXISTS prompts_last_access ON prompts (last_access)")
+        return self._db
+
+    @staticmethod
+    def key(topic: str, model: str, version: str) -> str:
+        payload = json.dumps([normalize_topic(topic), model, version], ensure_ascii=False)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def get(self, key: str, count: int = 1) -> Optional[list[str]]:
+        """Return the prompts cached for `key` if `count` or more were asked for, or None.
+
+        Fewer than `count` prompts come back when the LLM repeated itself.
+        """
+        if self.max_entries <= 0:
+            return None
+        now = time.time()
+        with self._lock:
+            db = self._connect()
+            row = db.execute(
+                "SELECT prompts, requested, created FROM prompts WHERE key = ?", (key,)).fetchone()
+            if row is not None and self.ttl > 0 and now - row[2] > self.ttl:
+                db.execute("DELETE FROM prompts WHERE key = ?", (key,))
+                row = None
+            hit = row is not None and row[1] >= count
+            if hit:
+                db.execute("UPDATE prompts SET last_access = ? WHERE key = ?", (now, key))
+        metrics.count("prompt_cache_lookups_total", 1, "Prompt cache lookups",
+                      result="hit" if hit else "miss")
+        return json.loads(row[0])[:count] if hit else None
+
+    def put(self, key: str, topic: str, prompts: list[str], requested: int = 1) -> None:
+        """Store the `prompts` written when `requested` were asked for, replacing earlier ones."""
+        if self.max_entries <= 0:
+            return
+        now = time.time()
+        with self._lock:
+            db = self._connect()
+            db.execute(
+                "INSERT OR REPLACE INTO prompts VALUES (?, ?, ?, ?, ?, ?)",
+                (key, topic, json.dumps(prompts, ensure_ascii=False), requested, now, now))
+            (entries,) = db.execute("SELECT COUNT(*) FROM prompts").fetchone()
+            if entries > self.max_entries:
+                db.execute(
+                    "DELETE FROM prompts WHERE key IN "
+                    "(SELECT key FROM prompts ORDER BY last_access LIMIT ?)",
+                    (entries - self.max_entries,))
+
+    def stats(self) -> dict:
+        with self._lock:
+            (entries,) = self._connect().execute("SELECT COUNT(*) FROM prompts").fetchone()
+        return {"entries": entries, "max_entries": self.max_entries, "ttl": self.ttl}
@@ -0,0 +1,180 @@
+import os
+import json
+import time
+from collections import deque
+from typing import Iterator, Optional
+
+DEFAULT_TEMPLATE = "{topic}, high quality, detailed, professional, artistic"
+
+
+class AhoCorasick:
+    """Multi-keyword matcher whose cost depends on the text, not the keyword count.
+
+    All keywords are compiled into one automaton, so scanning a topic is a
+    single pass over its characters regardless of how many templates exist.
+    """
+
+    def __init__(self, keywords: list[str]):
+        self._goto: list[dict[str, int]] = [{}]
+        self._fail: list[int] = [0]
+        self._out: list[list[int]] = [[]]
+        for index, keyword in enumerate(keywords):
+            state = 0
+            for char in keyword:
+                next_state = self._goto[state].get(char)
+                if next_state is None:
+                    next_state = len(self._goto)
+                    self._goto[state][char] = next_state
+                    self._goto.append({})
+                    self._fail.append(0)
+                    self._out.append([])
+                state = next_state
+            self._out[state].append(index)
+
+        queue = deque(self._goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for char, next_state in self._goto[state].items():
+                queue.append(next_state)
+                fail = self._fail[state]
+                while fail and char not in self._goto[fail]:
+                    fail = self._fail[fail]
+                self._fail[next_state] = self._goto[fail].get(char, 0)
+                self._out[next_state] = self._out[next_state] + self._out[self._fail[next_state]]
+
+    def find(self, text: str) -> Iterator[int]:
+        """Yield the index of every keyword occurring in `text`."""
+        goto, fail, out = self._goto, self._fail, self._out
+        state = 0
+        for char in text:
+            while state and char not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(char, 0)
+            yield from out[state]
+
+
+class PromptTemplates:
+    """Keyword-driven prompt templates loaded from a JSON file.
+
+    The file holds a "default" template and a list of "templates", each with
+    "keywords" (strings or {"keyword", "weight"} objects), a "template" string
+    containing "{topic}" and an optional "priority". A topic is expanded with
+    the matching template of highest priority, then highest total weight of
+    matched keywords, then earliest position in the file. Keywords match
+    case-insensitively anywhere in the topic.
+
+    The file is re-read when its modification time changes, checked at most
+    once every `reload_interval` seconds.
+    """
+
+    def __init__(self, path: str, reload_interval: float = 1.0):
+        self.path = path
+        self.reload_interval = reload_interval
+        self.default = DEFAULT_TEMPLATE
+        self._templates: list[dict] = []
+        self._keywords: list[tuple[int, float]] = []
+        self._matcher = AhoCorasick([])
+        self._mtime: Optional[int] = None
+        self._checked = 0.0
+        self.reload()
+
+    def reload(self) -> bool:
+        """Recompile the templates if the file changed since the last load."""
+        self._checked = time.monotonic()
+        try:
+            mtime = os.stat(self.path).st_mtime_ns
+        except FileNotFoundError:
+            return False
+        if mtime == self._mtime:
+            return False
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                data = json.load(f)
+            self._compile(data)
+        except (ValueError, KeyError, TypeError) as e:
+            # Keep serving the previous templates while the file is being edited
+            print(f"Could not load prompt templates from {self.path}: {e}")
+            return False
+        self._mtime = mtime
+        return True
+
+    def _compile(self, data: dict) -> None:
+        templates, keywords, entries = [], [], []
+        for index, entry in enumerate(data.get("templates", [])):
+            templates.append({
+                "template": entry["template"],
+                "priority": entry.get("priority", 0),
+            })
+            for keyword in entry["keywords"]:
+                if isinstance(keyword, str):
+                    keyword = {"keyword": keyword}
+                keywords.append(keyword["keyword"].lower())
+                entries.append((index, float(keyword.get("weight", 1.0))))
+        # Swap in the new state only once everything compiled
+        self._matcher = AhoCorasick(keywords)
+        self._templates = templates
+        self._keywords = entries
+        self.default = data.get("default", DEFAULT_TEMPLATE)
+
+    def ranked(self, topic: str) -> list[str]:
+        """Return every template matching `topic`, best first."""
+        if time.monotonic() - self._checked > self.reload_interval:
+            self.reload()
+        keywords, templates = self._keywords, self._templates
+        weights: dict[int, float] = {}
+        seen = set()
+        for keyword in self._matcher.find(topic.lower()):
+            if keyword in seen:
+                continue
+            seen.add(keyword)
+            index, weight = keywords[keyword]
+            weights[index] = weights.get(index, 0.0) + weight
+        order = sorted(weights, key=lambda index: (
+            templates[index]["priority"], weights[index], -index), reverse=True)
+        return [templates[index]["template"] for index in order]
+
+    def match(self, topic: str) -> Optional[str]:
+        """Return the best matching template for `topic`, or None."""
+        ranked = self.ranked(topic)
+        return ranked[0] if ranked else None
+
+    def expand(self, topic: str) -> str:
+        """Expand `topic` into an enhanced prompt."""
+        template = self.match(topic) or self.default
+        return template.replace("{topic}", topic)
+
+    def candidates(self, topic: str, count: int) -> list[str]:
+        """Expand `topic` with up to `count` distinct templates, best first.
+
+        Matching templates come in ranked order followed by the default, so
+        the first candidate is always what `expand` returns.
+        """
+        templates = self.ranked(topic) + [self.default]
+        prompts = dict.fromkeys(template.replace("{topic}", topic) for template in templates)
+        return list(prompts)[:max(1, count)]
+
+
+def pick_candidate(feedback: str, candidates: list[str]) -> Optional[int]:
+    """Index of the candidate prompt chosen by `feedback`, or None for new prompts.
+
+    Empty feedback or "y..." approves the first candidate and "2" picks the
+    second; anything else asks for new candidates.
+    """
+    answer = feedback.strip().lower()
+    if not answer or answer[0] == "y":
+        return 0
+    if answer.isdigit() and 1 <= int(answer) <= len(candidates):
+        return int(answer) - 1
+    return None
+
+
+def format_prompt(value: dict, separator: str = "\n") -> str:
+    """The prompt of a `prompt_feedback` interrupt, or its numbered candidates.
+
+    `separator` goes between the "Prompts:" heading and the list, e.g. a
+    blank line for Markdown.
+    """
+    candidates = value.get("candidates")
+    if not candidates:
+        return f"Prompt: {value['prompt']}"
+    return f"Prompts:{separator}" + "\n".join(f"{i}. {prompt}" for i, prompt in enumerate(candidates, 1))
@@ -0,0 +1,67 @@
+import time
+import asyncio
+from typing import Any, Awaitable, Optional
+
+
+class SpeculativeRuns:
+    """Speculative tool calls started while a graph thread waits for a human.
+
+    At most one run is kept per thread, keyed by the value it was started for
+    (e.g. the proposed prompt). A node that would make the same call adopts
+    the run's result instead; starting a run for a different key, or calling
+    `discard`, cancels the previous one. Finished runs that are never adopted
+    are dropped after `ttl` seconds.
+    """
+
+    def __init__(self, ttl: float = 900.0):
+        self.ttl = ttl
+        self._runs: dict[str, tuple[str, asyncio.Task, float]] = {}
+
+    def _prune(self):
+        now = time.monotonic()
+        for thread_id, (_, task, started) in list(self._runs.items()):
+            if task.done() and now - started > self.ttl:
+                del self._runs[thread_id]
+
+    def start(self, thread_id: str, key: str, coro: Awaitable[Any]) -> asyncio.Task:
+        """Run `coro` in the background for `thread_id` unless already running for `key`."""
+        self._prune()
+        current = self._runs.get(thread_id)
+        if current is not None:
+            if current[0] == key:
+                coro.close()
+                return current[1]
+            current[1].cancel()
+        task = asyncio.ensure_future(coro)
+        self._runs[thread_id] = (key, task, time.monotonic())
+        return task
+
+    async def adopt(self, thread_id: str, key: str) -> Optional[Any]:
+        """Return the result of the run for `thread_id` and `key`, or None.
+
+        None means there was no usable run (none started, started for another
+        key, cancelled or failed) and the caller should make the call itself.
+        """
+        run = self._runs.pop(thread_id, None)
+        if run is None:
+            return None
+        run_key, task, _ = run
+        if run_key != key:
+            task.cancel()
+            return None
+        if task.cancelled():
+            return None
+        try:
+            return await task
+        except Exception as e:
+            print(f"Speculative run for {thread_id} failed: {e}")
+            return None
+
+    def discard(self, thread_id: str):
+        """Cancel and forget any run for `thread_id`."""
+        run = self._runs.pop(thread_id, None)
+        if run is not None:
+            run[1].cancel()
+
+    def pending(self, thread_id: str) -> bool:
+        return thread_id in self._runs
@@ -5,6 +5,7 @@ This can be run independently to test the image generation functionality.
 """
 
 import os
+import asyncio
 from dotenv import load_dotenv
 from tools.image_tools import generate_image, list_generated_images, get_image_info
 
@@ -18,11 +19,11 @@ def test_image_generation():
     
     # Test 1: Generate an image
     print("\n1. Testing image generation...")
-    result = generate_image(
+    result = asyncio.run(generate_image(
         prompt="A cute robot holding a paintbrush",
         model="dall-e-3", 
         size="1024x1024"
-    )
+    ))
     print(result)
     
     # Test 2: List generated images
@@ -0,0 +1,147 @@
+import asyncio
+
+import pytest
+
+from admission import AdmissionControl, QueueFull
+
+
+async def queue_behind_a_running_request(admission: AdmissionControl, requests: list[tuple]) -> list[str]:
+    """Start a request holding the only slot, queue `requests` behind it and
+    return the names of the queued requests in the order they were admitted."""
+    admitted = []
+    release = asyncio.Event()
+
+    async def hold():
+        async with admission.acquire("first"):
+            await release.wait()
+
+    async def request(name: str, user: str, priority: int = 0):
+        async with admission.acquire(user, priority):
+            admitted.append(name)
+
+    holder = asyncio.create_task(hold())
+    await asyncio.sleep(0)
+    tasks = []
+    for args in requests:
+        tasks.append(asyncio.create_task(request(*args)))
+        await asyncio.sleep(0)
+    release.set()
+    await asyncio.gather(holder, *tasks)
+    return admitted
+
+
+def test_queue_is_round_robin_across_users():
+    async def main():
+        admission = AdmissionControl("test", limit=1, max_queue=10)
+        return await queue_behind_a_running_request(admission, [
+            ("a1", "alice"), ("a2", "alice"), ("a3", "alice"), ("b1", "bob"), ("c1", "carol")])
+
+    assert asyncio.run(main()) == ["a1", "b1", "c1", "a2", "a3"]
+
+
+def test_higher_priority_goes_first():
+    async def main():
+        admission = AdmissionControl("test", limit=1, max_queue=10)
+        return await queue_behind_a_running_request(admission, [
+            ("a1", "alice"), ("b1", "bob", 5), ("a2", "alice", 5)])
+
+    assert asyncio.run(main()) == ["b1", "a2", "a1"]
+
+
+def test_full_queue_rejects_at_once():
+    async def main():
+        admission = AdmissionControl("test", limit=1, max_queue=1)
+        release = asyncio.Event()
+
+        async def hold(user: str):
+            async with admission.acquire(user):
+                await release.wait()
+
+        running = asyncio.create_task(hold("alice"))
+        await asyncio.sleep(0)
+        queued = asyncio.create_task(hold("bob"))
+        await asyncio.sleep(0)
+        assert (admission.running, admission.waiting) == (1, 1)
+        with pytest.raises(QueueFull):
+            async with admission.acquire("carol"):
+                pass
+        release.set()
+        await asyncio.gather(running, queued)
+        assert (admission.running, admission.waiting) == (0, 0)
+
+    asyncio.run(main())
+
+
+def test_cancelled_waiter_leaves_the_queue():
+    async def main():
+        admission = AdmissionControl("test", limit=1, max_queue=10)
+        release = asyncio.Event()
+        admitted = []
+
+        async def request(user: str):
+            async with admission.acquire(user):
+                admitted.append(user)
+                await release.wait()
+
+        running = asyncio.create_task(request("alice"))
+        await asyncio.sleep(0)
+        cancelled = asyncio.create_task(request("bob"))
+        queued = asyncio.create_task(request("carol"))
+        await asyncio.sleep(0)
+        cancelled.cancel()
+        await asyncio.gather(cancelled, return_exceptions=True)
+        assert admission.waiting == 1
+        release.set()
+        await asyncio.gather(running, queued)
+        assert admitted == ["alice", "carol"]
+        assert (admission.running, admission.waiting) == (0, 0)
+
+    asyncio.run(main())
+
+
+def test_waiters_are_told_their_position():
+    async def main():
+        admission = AdmissionControl("test", limit=1, max_queue=10, estimate=10.0)
+        release = asyncio.Event()
+        updates = {"bob": [], "carol": []}
+
+        async def request(user: str):
+            async with admission.acquire(user, on_update=lambda *update: updates[user].append(update)):
+                await release.wait()
+
+        running = asyncio.create_task(request("alice"))
+        await asyncio.sleep(0)
+        waiters = [asyncio.create_task(request("bob")), asyncio.create_task(request("carol"))]
+        await asyncio.sleep(0)
+        release.set()
+        await asyncio.gather(running, *waiters)
+        return updates
+
+    updates = asyncio.run(main())
+    assert updates["bob"] == [(0, 10.0)]
+    assert updates["carol"][0] == (1, 20.0)
+    assert updates["carol"][-1][0] == 0
+
+
+def test_slot_granted_to_a_cancelled_waiter_is_passed_on():
+    async def main():
+        admission = AdmissionControl("test", limit=1, max_queue=10)
+        admitted = []
+
+        async def request(user: str):
+            async with admission.acquire(user):
+                admitted.append(user)
+
+        holder = admission.acquire("alice")
+        await holder.__aenter__()
+        bob = asyncio.create_task(request("bob"))
+        carol = asyncio.create_task(request("carol"))
+        await asyncio.sleep(0)
+        # Bob is granted the slot, but cancelled before he can take it
+        await holder.__aexit__(None, None, None)
+        bob.cancel()
+        await asyncio.gather(bob, carol, return_exceptions=True)
+        assert admitted == ["carol"]
+        assert (admission.running, admission.waiting) == (0, 0)
+
+    asyncio.run(main())
@@ -0,0 +1,58 @@
+import os
+import json
+import asyncio
+from types import SimpleNamespace
+
+# graph.py passes the key on to the image server it spawns
+os.environ.setdefault("OPENAI_API_KEY", "test")
+
+import graph  # noqa: E402
+
+
+class FakeGraph:
+    async def aget_state(self, config):
+        return SimpleNamespace(next=())
+
+    async def astream(self, prompt, config):
+        if prompt["topic"] == "boom":
+            raise RuntimeError("render failed")
+        yield {"generate_image": {"image_url": f"http://images/{prompt['topic']}"}}
+
+
+def test_invalid_lines_do_not_stop_the_batch(tmp_path, capsys):
+    jobs = tmp_path / "jobs.jsonl"
+    jobs.write_text("\n".join([
+        json.dumps({"topic": "cat"}),
+        "{not json",
+        json.dumps(["a list"]),
+        "",
+        json.dumps({"feedback": "y"}),
+        json.dumps({"topic": "boom"}),
+        json.dumps({"topic": "dog", "feedback": 5}),
+        json.dumps({"topic": "owl"}),
+    ]) + "\n")
+    output = tmp_path / "results.jsonl"
+
+    asyncio.run(graph.run_batch(FakeGraph(), str(jobs), str(output), 4, False))
+
+    results = {result["line"]: result for result in map(json.loads, output.read_text().splitlines())}
+    assert sorted(results) == [1, 2, 3, 5, 6, 7, 8]
+    assert results[1]["image_url"] == "http://images/cat"
+    assert results[8]["status"] == "done"
+    for line in (2, 3, 5):
+        assert results[line]["status"] == "error"
+        assert results[line]["error"].startswith("Invalid job")
+    assert results[6] == {**results[6], "status": "error", "error": "render failed", "topic": "boom"}
+    assert results[7]["status"] == "error"
+    assert "Threads: 7" in capsys.readouterr().out
+
+
+def test_batch_runs_with_concurrency_below_one(tmp_path):
+    jobs = tmp_path / "jobs.jsonl"
+    jobs.write_text(json.dumps({"topic": "cat"}) + "\n" + json.dumps({"topic": "dog"}) + "\n")
+    output = tmp_path / "results.jsonl"
+
+    for concurrency in (0, -1):
+        asyncio.run(asyncio.wait_for(
+            graph.run_batch(FakeGraph(), str(jobs), str(output), concurrency, False), 5))
+        assert [json.loads(line)["status"] for line in output.read_text().splitlines()] == ["done", "done"]
@@ -0,0 +1,135 @@
+import os
+import asyncio
+import sqlite3
+
+from typing_extensions import TypedDict
+from langgraph.graph import StateGraph, START, END
+from langgraph.checkpoint.sqlite.aio import AsyncSqliteSaver
+
+from checkpoint_blobs import offload_large_values
+from checkpoint_maintenance import maintain
+
+IMAGE = "data:image/png;base64," + "A" * 100_000
+RAW = b"\x00" * 50_000
+
+
+class State(TypedDict):
+    topic: str
+    image: str
+    raw: bytes
+
+
+def render(state: State):
+    return {"image": IMAGE, "raw": RAW}
+
+
+def build():
+    builder = StateGraph(State)
+    builder.add_node("render", render)
+    builder.add_edge(START, "render")
+    builder.add_edge("render", END)
+    return builder
+
+
+def age_blobs(blob_dir):
+    for name in os.listdir(blob_dir):
+        os.utime(os.path.join(blob_dir, name), (0, 0))
+
+
+def config(thread_id: str) -> dict:
+    return {"configurable": {"thread_id": thread_id}}
+
+
+def test_large_values_round_trip_through_blobs(tmp_path):
+    db, blob_dir = str(tmp_path / "checkpoints.sqlite"), str(tmp_path / "blobs")
+
+    async def main():
+        async with AsyncSqliteSaver.from_conn_string(db) as saver:
+            offload_large_values(saver, blob_dir, 16384)
+            graph = build().compile(checkpointer=saver)
+            await graph.ainvoke({"topic": "cat"}, config("1"))
+            state = await graph.aget_state(config("1"))
+        assert state.values == {"topic": "cat", "image": IMAGE, "raw": RAW}
+
+    asyncio.run(main())
+    assert len(os.listdir(blob_dir)) == 2
+    with sqlite3.connect(db) as conn:
+        (largest,) = conn.execute("SELECT MAX(LENGTH(checkpoint)) FROM checkpoints").fetchone()
+    assert largest < 16384
+
+
+def test_sweep_keeps_referenced_blobs_and_deletes_the_rest(tmp_path):
+    db, blob_dir = str(tmp_path / "checkpoints.sqlite"), str(tmp_path / "blobs")
+
+    async def main():
+        async with AsyncSqliteSaver.from_conn_string(db) as saver:
+            offload_large_values(saver, blob_dir, 16384)
+            graph = build().compile(checkpointer=saver)
+            await graph.ainvoke({"topic": "cat"}, config("1"))
+            (tmp_path / "blobs" / ("f" * 32)).write_bytes(b"orphan")
+            age_blobs(blob_dir)
+            report = await maintain(saver.conn, blob_dir=blob_dir)
+            assert report["blobs_deleted"] == 1
+            assert (await graph.aget_state(config("1"))).values["image"] == IMAGE
+
+            await saver.adelete_thread("1")
+            report = await maintain(saver.conn, blob_dir=blob_dir)
+            assert report["blobs_deleted"] == 2
+
+    asyncio.run(main())
+    assert os.listdir(blob_dir) == []
+
+
+def test_value_written_again_after_its_blob_was_swept(tmp_path):
+    db, blob_dir = str(tmp_path / "checkpoints.sqlite"), str(tmp_path / "blobs")
+
+    async def main():
+        async with AsyncSqliteSaver.from_conn_string(db) as saver:
+            offload_large_values(saver, blob_dir, 16384)
+            graph = build().compile(checkpointer=saver)
+            await graph.ainvoke({"topic": "cat"}, config("1"))
+            await saver.adelete_thread("1")
+            age_blobs(blob_dir)
+            await maintain(saver.conn, blob_dir=blob_dir)
+            assert os.listdir(blob_dir) == []
+
+            # Same serializer, same values, another thread
+            await graph.ainvoke({"topic": "cat"}, config("2"))
+            state = await graph.aget_state(config("2"))
+            assert state.values["image"] == IMAGE and state.values["raw"] == RAW
+
+    asyncio.run(main())
+
+
+def test_reused_blob_is_refreshed_for_the_sweep_grace_period(tmp_path):
+    db, blob_dir = str(tmp_path / "checkpoints.sqlite"), str(tmp_path / "blobs")
+
+    async def main():
+        async with AsyncSqliteSaver.from_conn_string(db) as saver:
+            offload_large_values(saver, blob_dir, 16384)
+            graph = build().compile(checkpointer=saver)
+            await graph.ainvoke({"topic": "cat"}, config("1"))
+            age_blobs(blob_dir)
+            await graph.ainvoke({"topic": "cat"}, config("2"))
+
+    asyncio.run(main())
+    # A sweep racing thread 2's checkpoint write would not delete them
+    assert all(os.path.getmtime(os.path.join(blob_dir, name)) > 0 for name in os.listdir(blob_dir))
+
+
+def test_unchanged_values_are_not_hashed_again(tmp_path):
+    db, blob_dir = str(tmp_path / "checkpoints.sqlite"), str(tmp_path / "blobs")
+
+    async def main():
+        async with AsyncSqliteSaver.from_conn_string(db) as saver:
+            offload_large_values(saver, blob_dir, 16384)
+            puts = []
+            put = saver.serde.blobs.put
+            saver.serde.blobs.put = lambda *args: puts.append(args) or put(*args)
+            graph = build().compile(checkpointer=saver)
+            await graph.ainvoke({"topic": "cat"}, config("1"))
+            await graph.ainvoke({"topic": "dog"}, config("1"))
+            return puts
+
+    # Once per value, although every later checkpoint carries both again
+    assert len(asyncio.run(main())) == 2
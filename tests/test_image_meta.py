@@ -0,0 +1,47 @@
+import pytest
+from PIL import Image
+
+from tools.image_meta import read_image_header
+
+
+@pytest.mark.parametrize("format, extension, mode", [
+    ("PNG", "png", "RGB"),
+    ("PNG", "png", "RGBA"),
+    ("JPEG", "jpg", "RGB"),
+    ("WEBP", "webp", "RGB"),
+    ("WEBP", "webp", "RGBA"),
+    ("GIF", "gif", "P"),
+    ("AVIF", "avif", "RGB"),
+    ("AVIF", "avif", "RGBA"),
+])
+def test_reads_dimensions_from_the_header(tmp_path, format, extension, mode):
+    path = tmp_path / f"image.{extension}"
+    Image.new(mode, (300, 200)).save(path, format)
+    info = read_image_header(str(path))
+    assert info == {"format": format, "width": 300, "height": 200, "mode": mode}
+
+
+def test_unknown_format(tmp_path):
+    path = tmp_path / "image.bin"
+    path.write_bytes(b"not an image" * 10)
+    assert read_image_header(str(path)) is None
+
+
+def test_truncated_avif(tmp_path):
+    path = tmp_path / "image.avif"
+    Image.new("RGB", (300, 200)).save(path, "AVIF")
+    path.write_bytes(path.read_bytes()[:60])
+    assert read_image_header(str(path)) is None
+
+
+@pytest.mark.parametrize("length", [0, 1])
+def test_jpeg_with_a_corrupt_segment_length(tmp_path, length):
+    path = tmp_path / "image.jpg"
+    path.write_bytes(b"\xff\xd8\xff\xe0" + length.to_bytes(2, "big") + b"\x00" * 64)
+    assert read_image_header(str(path)) is None
+
+
+def test_jpeg_segment_past_the_end(tmp_path):
+    path = tmp_path / "image.jpg"
+    path.write_bytes(b"\xff\xd8\xff\xe0\xff\xf0JFIF")
+    assert read_image_header(str(path)) is None
@@ -0,0 +1,75 @@
+import os
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+from PIL import Image, ImageChops
+
+from tools import image_tools
+from tools.generation_cache import GenerationCache
+from tools.image_storage import store_image
+
+
+def noisy_png(path) -> str:
+    Image.effect_noise((256, 256), 64).convert("RGB").save(path, "PNG", compress_level=1)
+    return str(path)
+
+
+@pytest.mark.parametrize("storage", ["png", "webp-lossless"])
+def test_lossless_storage_keeps_every_pixel(tmp_path, storage):
+    source = noisy_png(tmp_path / "source.png")
+    original = Image.open(source).convert("RGB")
+    target = str(tmp_path / "stored")
+    stored = store_image(source, target, storage, 90)
+    assert not os.path.exists(source)
+    assert stored["stored_bytes"] == os.path.getsize(target)
+    assert ImageChops.difference(original, Image.open(target).convert("RGB")).getbbox() is None
+
+
+def test_png_no_smaller_than_the_source_keeps_the_source_bytes(tmp_path):
+    source = str(tmp_path / "source.png")
+    Image.new("RGB", (256, 256)).save(source, "PNG", optimize=True)
+    data = open(source, "rb").read()
+    stored = store_image(source, str(tmp_path / "stored.png"), "png", 90)
+    assert not stored["recompressed"]
+    assert open(tmp_path / "stored.png", "rb").read() == data
+
+
+def test_failed_recompression_keeps_the_original(tmp_path, monkeypatch):
+    def broken_encoder(*args):
+        raise OSError("encoder not available")
+
+    monkeypatch.setattr(image_tools, "store_image", broken_encoder)
+    monkeypatch.setattr(image_tools, "_get_variant_pool", lambda: ThreadPoolExecutor(1))
+    raw = noisy_png(tmp_path / "generated_cat.avif.orig")
+    data = open(raw, "rb").read()
+
+    path, stored = asyncio.run(image_tools._store(raw, str(tmp_path / "generated_cat.avif")))
+    assert stored is None
+    assert path == str(tmp_path / "generated_cat.png")
+    assert open(path, "rb").read() == data
+    assert not os.path.exists(raw)
+
+
+def test_cache_keeps_the_extension_of_the_cached_image(tmp_path):
+    cache = GenerationCache(str(tmp_path / "cache"), max_bytes=1)
+    source = tmp_path / "image.webp"
+    source.write_bytes(b"webp")
+    cache.put("a" * 64, str(source), {})
+    assert cache.get("a" * 64) is None
+    # Evicted straight away by the 1 byte budget, file included
+    assert [files for _, _, files in os.walk(tmp_path / "cache") if any(f.endswith(".webp") for f in files)] == []
+
+    cache.max_bytes = 1024
+    cache.put("b" * 64, str(source), {})
+    assert cache.get("b" * 64).endswith("b" * 64 + ".webp")
+
+
+def test_failed_open_reports_its_own_error(tmp_path):
+    async def chunks():
+        yield b"data"
+
+    with pytest.raises(FileNotFoundError) as excinfo:
+        asyncio.run(image_tools._write_file(str(tmp_path / "missing" / "image.png"), chunks()))
+    # Not a second FileNotFoundError from cleaning up the .part file
+    assert excinfo.value.__context__ is None
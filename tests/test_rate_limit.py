@@ -0,0 +1,39 @@
+import time
+import asyncio
+
+from tools.rate_limit import TokenBucket, retry_after
+
+
+def timed_acquires(bucket: TokenBucket, count: int) -> float:
+    async def main():
+        started = time.monotonic()
+        for _ in range(count):
+            await bucket.acquire()
+        return time.monotonic() - started
+
+    return asyncio.run(main())
+
+
+def test_burst_is_immediate_then_paced():
+    # 1200 per minute is one token every 50 ms
+    assert timed_acquires(TokenBucket(1200, burst=3), 3) < 0.03
+    elapsed = timed_acquires(TokenBucket(1200, burst=3), 5)
+    assert 0.09 <= elapsed < 0.3
+
+
+def test_zero_rate_disables_pacing():
+    assert timed_acquires(TokenBucket(0), 100) < 0.05
+
+
+def test_penalize_pauses_every_caller():
+    bucket = TokenBucket(0)
+    bucket.penalize(0.1)
+    assert timed_acquires(bucket, 1) >= 0.09
+
+
+def test_retry_after_headers():
+    assert retry_after(None) is None
+    assert retry_after({"retry-after-ms": "1500"}) == 1.5
+    assert retry_after({"retry-after": "3"}) == 3.0
+    assert retry_after({"retry-after": "Wed, 21 Oct 2015 07:28:00 GMT"}) == 0.0
+    assert retry_after({"retry-after": "soon"}) is None
@@ -0,0 +1,98 @@
+import asyncio
+
+import pytest
+
+from tools import image_tools
+from tools.rate_limit import TokenBucket
+from tools.resilience import CircuitBreaker, CircuitOpen, hedged
+
+
+def open_breaker(reset_timeout: float = 0.0) -> CircuitBreaker:
+    breaker = CircuitBreaker("test", failures=2, reset_timeout=reset_timeout)
+    breaker.check()
+    breaker.failure()
+    breaker.check()
+    breaker.failure()
+    return breaker
+
+
+def test_breaker_opens_after_consecutive_failures():
+    breaker = open_breaker(reset_timeout=60)
+    assert breaker.state == "open"
+    with pytest.raises(CircuitOpen):
+        breaker.check()
+
+
+def test_breaker_success_resets_failure_count():
+    breaker = CircuitBreaker("test", failures=2, reset_timeout=60)
+    breaker.failure()
+    breaker.success()
+    breaker.failure()
+    assert breaker.state == "closed"
+
+
+def test_half_open_lets_one_probe_through():
+    breaker = open_breaker()
+    breaker.check()
+    assert breaker.state == "half_open"
+    with pytest.raises(CircuitOpen):
+        breaker.check()
+    breaker.success()
+    assert breaker.state == "closed"
+    breaker.check()
+
+
+def test_failed_probe_reopens():
+    breaker = open_breaker()
+    breaker.check()
+    breaker.failure()
+    assert breaker.state == "open"
+
+
+def test_abandoned_probe_admits_the_next_call():
+    breaker = open_breaker()
+    breaker.check()
+    breaker.abandon()
+    breaker.check()
+    assert breaker.state == "half_open"
+
+
+def test_probe_cancelled_waiting_for_rate_limit_token(monkeypatch):
+    breaker = open_breaker()
+    monkeypatch.setattr(image_tools, "breaker", breaker)
+
+    async def main():
+        limiter = TokenBucket(60)
+        limiter.penalize(60)
+        monkeypatch.setattr(image_tools, "rate_limiter", limiter)
+        probe = asyncio.create_task(image_tools._request_image(prompt="a cat"))
+        await asyncio.sleep(0.01)
+        assert breaker.state == "half_open"
+        probe.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await probe
+
+    asyncio.run(main())
+    # The next call is the new probe rather than failing fast
+    breaker.check()
+
+
+def test_hedged_returns_the_first_success_and_cancels_the_other():
+    calls = []
+
+    async def call():
+        calls.append(None)
+        await asyncio.sleep(1.0 if len(calls) == 1 else 0.01)
+        return len(calls)
+
+    assert asyncio.run(hedged("test", call, 0.05)) == 2
+    assert len(calls) == 2
+
+
+def test_hedged_fails_only_when_both_calls_fail():
+    async def call():
+        await asyncio.sleep(0.01)
+        raise ValueError("boom")
+
+    with pytest.raises(ValueError):
+        asyncio.run(hedged("test", call, 0.0))
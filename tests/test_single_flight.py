@@ -0,0 +1,97 @@
+import asyncio
+
+import pytest
+
+from single_flight import SingleFlight
+
+
+def test_concurrent_calls_with_the_same_key_share_one_call():
+    flights = SingleFlight("test")
+    calls = []
+
+    async def call():
+        calls.append(None)
+        await asyncio.sleep(0.01)
+        return "image"
+
+    async def main():
+        return await asyncio.gather(*(flights.do("cat", call) for _ in range(3)),
+                                    flights.do("dog", call))
+
+    assert asyncio.run(main()) == ["image"] * 4
+    assert len(calls) == 2
+    assert (flights.calls, flights.coalesced) == (2, 2)
+    assert flights.in_flight() == 0
+
+
+def test_every_caller_gets_the_exception():
+    flights = SingleFlight("test")
+
+    async def call():
+        await asyncio.sleep(0.01)
+        raise ValueError("boom")
+
+    async def main():
+        return await asyncio.gather(flights.do("cat", call), flights.do("cat", call),
+                                    return_exceptions=True)
+
+    assert [type(result) for result in asyncio.run(main())] == [ValueError, ValueError]
+
+
+def test_cancelling_the_leader_keeps_the_call_for_the_others():
+    flights = SingleFlight("test")
+
+    async def call():
+        await asyncio.sleep(0.05)
+        return "image"
+
+    async def main():
+        leader = asyncio.create_task(flights.do("cat", call))
+        await asyncio.sleep(0)
+        follower = asyncio.create_task(flights.do("cat", call))
+        await asyncio.sleep(0.01)
+        leader.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await leader
+        return await follower
+
+    assert asyncio.run(main()) == "image"
+    assert flights.calls == 1
+
+
+def test_call_is_cancelled_when_every_caller_gives_up():
+    flights = SingleFlight("test")
+
+    async def main():
+        stopped = asyncio.Event()
+
+        async def call():
+            try:
+                await asyncio.sleep(10)
+            finally:
+                stopped.set()
+
+        callers = [asyncio.create_task(flights.do("cat", call)) for _ in range(2)]
+        await asyncio.sleep(0.01)
+        for caller in callers:
+            caller.cancel()
+        await asyncio.gather(*callers, return_exceptions=True)
+        await asyncio.wait_for(stopped.wait(), 1)
+        await asyncio.sleep(0)
+        return flights.in_flight()
+
+    assert asyncio.run(main()) == 0
+
+
+def test_a_finished_call_is_not_reused():
+    flights = SingleFlight("test")
+    calls = []
+
+    async def call():
+        calls.append(None)
+        return len(calls)
+
+    async def main():
+        return [await flights.do("cat", call), await flights.do("cat", call)]
+
+    assert asyncio.run(main()) == [1, 2]
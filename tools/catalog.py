@@ -0,0 +1,145 @@
+import os
+import time
+import sqlite3
+import threading
+from datetime import datetime
+from typing import Optional
+
+from tools.image_meta import read_image_header
+from tools.image_storage import IMAGE_EXTENSIONS
+
+SORT_COLUMNS = {
+    "created": "created",
+    "bytes": "bytes",
+    "filename": "filename",
+    "prompt": "prompt",
+}
+
+
+def _header(path: str) -> tuple[Optional[str], Optional[int], Optional[int]]:
+    info = read_image_header(path)
+    if info is None:
+        return None, None, None
+    return info["format"], info["width"], info["height"]
+
+
+def _timestamp(value: Optional[str]) -> Optional[float]:
+    """Parse an ISO 8601 date or datetime into a UNIX timestamp."""
+    if not value:
+        return None
+    return datetime.fromisoformat(value).timestamp()
+
+
+class ImageCatalog:
+    """SQLite index of generated images.
+
+    Every image written by the tools is recorded with its prompt, generation
+    parameters, format, size on disk (and as returned by the API, when it
+    was recompressed) and dimensions, so listings can be paginated, sorted
+    and filtered without scanning the output directory.
+    """
+
+    def __init__(self, db_path: str, image_dir: str):
+        self.db_path = os.path.abspath(db_path)
+        self.image_dir = os.path.abspath(image_dir)
+        is_new = not os.path.exists(self.db_path)
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(
+            self.db_path, check_same_thread=False, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("""
+            CREATE TABLE IF NOT EXISTS images (
+                path TEXT PRIMARY KEY,
+                filename TEXT NOT NULL,
+                prompt TEXT,
+                model TEXT,
+                size TEXT,
+                quality TEXT,
+                bytes INTEGER NOT NULL,
+                width INTEGER,
+                height INTEGER,
+                created REAL NOT NULL,
+                format TEXT,
+                original_bytes INTEGER
+            )
+        """)
+        # Catalogs created before images could be recompressed
+        columns = {row[1] for row in self._db.execute("PRAGMA table_info(images)")}
+        for column, type in (("format", "TEXT"), ("original_bytes", "INTEGER")):
+            if column not in columns:
+                self._db.execute(f"ALTER TABLE images ADD COLUMN {column} {type}")
+        self._db.execute(
+            "CREATE INDEX IF NOT EXISTS images_created ON images (created)")
+        self._db.execute(
+            "CREATE INDEX IF NOT EXISTS images_bytes ON images (bytes)")
+        if is_new:
+            self.backfill()
+
+    def add(self, path: str, prompt: Optional[str] = None, model: Optional[str] = None,
+            size: Optional[str] = None, quality: Optional[str] = None,
+            original_bytes: Optional[int] = None) -> None:
+        """Record (or refresh) the image at `path`.
+
+        `original_bytes` is the size the API returned the image at, if it
+        was recompressed; a refresh without it keeps the recorded one.
+        """
+        path = os.path.abspath(path)
+        stat = os.stat(path)
+        format, width, height = _header(path)
+        with self._lock:
+            self._db.execute(
+                "INSERT INTO images "
+                "(path, filename, prompt, model, size, quality, bytes, width, height, created, "
+                "format, original_bytes) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?) "
+                "ON CONFLICT (path) DO UPDATE SET filename = excluded.filename, "
+                "prompt = excluded.prompt, model = excluded.model, size = excluded.size, "
+                "quality = excluded.quality, bytes = excluded.bytes, width = excluded.width, "
+                "height = excluded.height, created = excluded.created, format = excluded.format, "
+                "original_bytes = COALESCE(excluded.original_bytes, images.original_bytes)",
+                (path, os.path.basename(path), prompt, model, size, quality,
+                 stat.st_size, width, height, time.time(), format, original_bytes))
+
+    def backfill(self) -> int:
+        """Import generated images already on disk that are not in the index."""
+        count = 0
+        for entry in os.scandir(self.image_dir):
+            if not (entry.name.startswith("generated_") and entry.name.endswith(IMAGE_EXTENSIONS)):
+                continue
+            stat = entry.stat()
+            format, width, height = _header(entry.path)
+            with self._lock:
+                cursor = self._db.execute(
+                    "INSERT OR IGNORE INTO images (path, filename, bytes, width, height, created, format) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    (entry.path, entry.name, stat.st_size, width, height, stat.st_mtime, format))
+            count += cursor.rowcount
+        return count
+
+    def query(self, limit: int = 50, offset: int = 0, sort_by: str = "created",
+              descending: bool = True, prompt_contains: Optional[str] = None,
+              since: Optional[str] = None, until: Optional[str] = None) -> tuple[list[dict], int]:
+        """Return one page of matching images and the total number of matches."""
+        if sort_by not in SORT_COLUMNS:
+            raise ValueError(f"sort_by must be one of {', '.join(SORT_COLUMNS)}")
+        clauses, args = [], []
+        if prompt_contains:
+            clauses.append("prompt LIKE ? ESCAPE '\\'")
+            escaped = prompt_contains.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+            args.append(f"%{escaped}%")
+        if since:
+            clauses.append("created >= ?")
+            args.append(_timestamp(since))
+        if until:
+            clauses.append("created < ?")
+            args.append(_timestamp(until))
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+        order = f"{SORT_COLUMNS[sort_by]} {'DESC' if descending else 'ASC'}"
+        with self._lock:
+            (total,) = self._db.execute(
+                f"SELECT COUNT(*) FROM images {where}", args).fetchone()
+            cursor = self._db.execute(
+                f"SELECT * FROM images {where} ORDER BY {order} LIMIT ? OFFSET ?",
+                [*args, limit, offset])
+            columns = [column[0] for column in cursor.description]
+            rows = [dict(zip(columns, row)) for row in cursor.fetchall()]
+        return rows, total
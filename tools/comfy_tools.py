@@ -0,0 +1,211 @@
+import os
+import sys
+import json
+import uuid
+import asyncio
+from collections import OrderedDict
+from typing import Optional
+from urllib.parse import quote
+from mcp.server.fastmcp import Context
+from server import mcp
+import metrics
+
+COMFY_URL = os.getenv("COMFY_URL", "http://127.0.0.1:8188").rstrip("/")
+# Address clients use to fetch the rendered images
+COMFY_URL_EXTERNAL = (os.getenv("COMFY_URL_EXTERNAL") or COMFY_URL).rstrip("/")
+COMFY_WORKFLOW_JSON_FILE = os.getenv("COMFY_WORKFLOW_JSON_FILE", "workflow.json")
+PROMPT_NODE_ID = os.getenv("PROMPT_NODE_ID", "6")
+OUTPUT_NODE_ID = os.getenv("OUTPUT_NODE_ID", "9")
+COMFY_TIMEOUT = float(os.getenv("COMFY_TIMEOUT", "600"))
+
+# Parsed workflow as (path, mtime_ns, workflow); reparsed only when the file changes
+_workflow: Optional[tuple[str, int, dict]] = None
+_http_client = None
+
+
+def _get_http_client():
+    """Keep-alive connection pool to the ComfyUI server."""
+    global _http_client
+    if _http_client is None:
+        import httpx
+        _http_client = httpx.AsyncClient(
+            timeout=httpx.Timeout(30.0, connect=10.0),
+            limits=httpx.Limits(max_connections=16, max_keepalive_connections=8),
+        )
+    return _http_client
+
+
+def _load_workflow() -> dict:
+    global _workflow
+    path = os.path.abspath(COMFY_WORKFLOW_JSON_FILE)
+    mtime_ns = os.stat(path).st_mtime_ns
+    if _workflow is None or _workflow[:2] != (path, mtime_ns):
+        with open(path) as f:
+            _workflow = (path, mtime_ns, json.load(f))
+    return _workflow[2]
+
+
+def _with_prompt(workflow: dict, prompt: str) -> dict:
+    """Copy of `workflow` with the prompt node's text replaced.
+
+    Only the top-level mapping and the prompt node are copied; every other
+    node is shared with the cached workflow, which is never modified.
+    """
+    node = workflow[PROMPT_NODE_ID]
+    patched = dict(workflow)
+    patched[PROMPT_NODE_ID] = {**node, "inputs": {**node["inputs"], "text": prompt}}
+    return patched
+
+
+class _Job:
+    def __init__(self, progress=None):
+        self.done = asyncio.get_running_loop().create_future()
+        self.progress = progress
+
+
+class ComfyEvents:
+    """ComfyUI's websocket event stream, shared by every render of this process.
+
+    One connection is kept open under a fixed client id and its events are
+    dispatched to the job waiting on each prompt id, so completion and
+    sampling progress arrive as they happen instead of by polling. Jobs still
+    pending when the connection drops are checked once against /history after
+    reconnecting, in case their completion was missed.
+    """
+
+    def __init__(self):
+        self.client_id = uuid.uuid4().hex
+        self._jobs: dict[str, _Job] = {}
+        # Outcomes of prompts that finished before anyone waited on them
+        self._finished: OrderedDict[str, Optional[str]] = OrderedDict()
+        self._connected: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+
+    async def connect(self, timeout: float = 10.0):
+        if self._task is None or self._task.done():
+            self._connected = asyncio.Event()
+            self._task = asyncio.create_task(self._run())
+        await asyncio.wait_for(self._connected.wait(), timeout)
+
+    async def _run(self):
+        import websockets
+
+        ws_url = "ws" + COMFY_URL[len("http"):] if COMFY_URL.startswith("http") else COMFY_URL
+        reconnecting = False
+        while True:
+            try:
+                async with websockets.connect(f"{ws_url}/ws?clientId={self.client_id}", max_size=None) as ws:
+                    self._connected.set()
+                    if reconnecting:
+                        for prompt_id in list(self._jobs):
+                            asyncio.create_task(self._check_history(prompt_id))
+                    async for message in ws:
+                        # Binary messages are sampler previews
+                        if isinstance(message, str):
+                            self._dispatch(json.loads(message))
+            except Exception as e:
+                # stdout carries the stdio transport
+                print(f"ComfyUI websocket disconnected: {e}", file=sys.stderr)
+            self._connected.clear()
+            reconnecting = True
+            await asyncio.sleep(1.0)
+
+    def _dispatch(self, event: dict):
+        data = event.get("data") or {}
+        prompt_id = data.get("prompt_id")
+        if prompt_id is None:
+            return
+        kind = event.get("type")
+        job = self._jobs.get(prompt_id)
+        if kind == "progress":
+            if job is not None and job.progress is not None:
+                asyncio.create_task(job.progress(data.get("value", 0), data.get("max", 0)))
+        elif (kind == "executing" and data.get("node") is None) or kind == "execution_success":
+            self._finish(prompt_id, None)
+        elif kind == "execution_error":
+            self._finish(prompt_id, data.get("exception_message") or "ComfyUI execution failed")
+        elif kind == "execution_interrupted":
+            self._finish(prompt_id, "ComfyUI execution was interrupted")
+
+    def _finish(self, prompt_id: str, error: Optional[str]):
+        job = self._jobs.pop(prompt_id, None)
+        if job is None:
+            self._finished[prompt_id] = error
+            while len(self._finished) > 256:
+                self._finished.popitem(last=False)
+        elif not job.done.done():
+            if error is None:
+                job.done.set_result(None)
+            else:
+                job.done.set_exception(RuntimeError(error))
+
+    async def _check_history(self, prompt_id: str):
+        try:
+            response = await _get_http_client().get(f"{COMFY_URL}/history/{prompt_id}")
+            entry = response.json().get(prompt_id)
+        except Exception:
+            return
+        if entry is not None and entry.get("status", {}).get("completed", True):
+            self._finish(prompt_id, None)
+
+    async def wait(self, prompt_id: str, progress=None, timeout: float = COMFY_TIMEOUT):
+        """Wait for `prompt_id` to finish, passing (value, max) progress to `progress`."""
+        if prompt_id in self._finished:
+            error = self._finished.pop(prompt_id)
+            if error is not None:
+                raise RuntimeError(error)
+            return
+        job = self._jobs[prompt_id] = _Job(progress)
+        try:
+            await asyncio.wait_for(job.done, timeout)
+        finally:
+            self._jobs.pop(prompt_id, None)
+
+
+events = ComfyEvents()
+
+
+async def _render(prompt: str, ctx: Context = None) -> str:
+    workflow = _with_prompt(await asyncio.to_thread(_load_workflow), prompt)
+    client = _get_http_client()
+    # Subscribe before submitting so no event of this prompt is missed
+    await events.connect()
+    response = await client.post(f"{COMFY_URL}/prompt", json={"prompt": workflow, "client_id": events.client_id})
+    response.raise_for_status()
+    prompt_id = response.json()["prompt_id"]
+
+    async def progress(value: float, total: float):
+        await ctx.report_progress(value, total, "Sampling")
+
+    try:
+        await events.wait(prompt_id, progress if ctx is not None else None)
+    except asyncio.CancelledError:
+        # Nobody wants the image any more, drop it if it is still queued
+        await asyncio.shield(client.post(f"{COMFY_URL}/queue", json={"delete": [prompt_id]}))
+        raise
+
+    response = await client.get(f"{COMFY_URL}/history/{prompt_id}")
+    response.raise_for_status()
+    outputs = response.json()[prompt_id]["outputs"]
+    image = outputs[OUTPUT_NODE_ID]["images"][0]
+    return (f"{COMFY_URL_EXTERNAL}/view?filename={quote(image['filename'])}"
+            f"&subfolder={quote(image.get('subfolder', ''))}&type={image.get('type', 'output')}")
+
+
+@mcp.tool()
+async def comfy_generate_image(prompt: str, ctx: Context = None) -> str:
+    """
+    Render an image with the ComfyUI workflow in COMFY_WORKFLOW_JSON_FILE.
+
+    Args:
+        prompt: Text for the workflow's prompt node (PROMPT_NODE_ID)
+
+    Returns:
+        The URL of the image saved by the workflow's output node (OUTPUT_NODE_ID)
+    """
+    try:
+        with metrics.timed("comfy_render"):
+            return await _render(prompt, ctx)
+
+    except Exception as e:
+        return f"Error generating image: {str(e)}"
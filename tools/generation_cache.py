@@ -0,0 +1,129 @@
+import os
+import json
+import uuid
+import time
+import shutil
+import sqlite3
+import hashlib
+import threading
+from typing import Optional
+
+
+def link_or_copy(src: str, dst: str) -> None:
+    """Hard-link `src` to `dst`, falling back to a copy across filesystems."""
+    if os.path.exists(dst) and os.path.samefile(src, dst):
+        return
+    tmp_path = f"{dst}.{uuid.uuid4().hex}.part"
+    try:
+        os.link(src, tmp_path)
+    except OSError:
+        shutil.copyfile(src, tmp_path)
+    os.replace(tmp_path, dst)
+
+
+class GenerationCache:
+    """Content-addressed on-disk cache of generated images.
+
+    Entries are keyed by a SHA-256 of the normalized generation parameters and
+    stored as `<cache_dir>/<key[:2]>/<key><extension>`, with the extension of
+    the image that was cached (e.g. .png or .webp). A SQLite index keeps the
+    parameters, size and last access time of every entry so the cache can be
+    kept under `max_bytes` by evicting the least recently used entries.
+    """
+
+    def __init__(self, cache_dir: str, max_bytes: int):
+        self.cache_dir = os.path.abspath(cache_dir)
+        self.max_bytes = max_bytes
+        os.makedirs(self.cache_dir, exist_ok=True)
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(
+            os.path.join(self.cache_dir, "index.sqlite"),
+            check_same_thread=False,
+            isolation_level=None,
+        )
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("""
+            CREATE TABLE IF NOT EXISTS entries (
+                key TEXT PRIMARY KEY,
+                params TEXT NOT NULL,
+                bytes INTEGER NOT NULL,
+                created REAL NOT NULL,
+                last_access REAL NOT NULL,
+                extension TEXT NOT NULL DEFAULT '.png'
+            )
+        """)
+        # Caches created when every entry was a PNG
+        columns = {row[1] for row in self._db.execute("PRAGMA table_info(entries)")}
+        if "extension" not in columns:
+            self._db.execute("ALTER TABLE entries ADD COLUMN extension TEXT NOT NULL DEFAULT '.png'")
+        self._db.execute(
+            "CREATE INDEX IF NOT EXISTS entries_last_access ON entries (last_access)")
+
+    @staticmethod
+    def key(**params) -> str:
+        """Hash generation parameters into a stable cache key."""
+        normalized = {
+            name: " ".join(value.split()) if isinstance(value, str) else value
+            for name, value in params.items()
+        }
+        payload = json.dumps(normalized, sort_keys=True, ensure_ascii=False)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def path(self, key: str, extension: str = ".png") -> str:
+        return os.path.join(self.cache_dir, key[:2], f"{key}{extension}")
+
+    def get(self, key: str) -> Optional[str]:
+        """Return the cached file for `key` and mark it as recently used."""
+        with self._lock:
+            row = self._db.execute(
+                "SELECT extension FROM entries WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            path = self.path(key, row[0])
+            if not os.path.exists(path):
+                self._db.execute("DELETE FROM entries WHERE key = ?", (key,))
+                return None
+            self._db.execute(
+                "UPDATE entries SET last_access = ? WHERE key = ?",
+                (time.time(), key))
+        return path
+
+    def put(self, key: str, source: str, params: dict) -> None:
+        """Store `source` under `key` and evict entries over the byte budget."""
+        if self.max_bytes <= 0:
+            return
+        extension = os.path.splitext(source)[1] or ".png"
+        path = self.path(key, extension)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        link_or_copy(source, path)
+        size = os.path.getsize(path)
+        now = time.time()
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO entries (key, params, bytes, created, last_access, extension) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (key, json.dumps(params, sort_keys=True), size, now, now, extension))
+            self._evict()
+
+    def _evict(self) -> None:
+        (total,) = self._db.execute(
+            "SELECT COALESCE(SUM(bytes), 0) FROM entries").fetchone()
+        if total <= self.max_bytes:
+            return
+        rows = self._db.execute(
+            "SELECT key, bytes, extension FROM entries ORDER BY last_access").fetchall()
+        for key, size, extension in rows:
+            if total <= self.max_bytes:
+                break
+            try:
+                os.unlink(self.path(key, extension))
+            except FileNotFoundError:
+                pass
+            self._db.execute("DELETE FROM entries WHERE key = ?", (key,))
+            total -= size
+
+    def stats(self) -> dict:
+        with self._lock:
+            entries, total = self._db.execute(
+                "SELECT COUNT(*), COALESCE(SUM(bytes), 0) FROM entries").fetchone()
+        return {"entries": entries, "bytes": total, "max_bytes": self.max_bytes}
@@ -0,0 +1,163 @@
+import struct
+from typing import BinaryIO, Optional
+
+PNG_SIGNATURE = b"\x89PNG\r\n\x1a\n"
+PNG_MODES = {0: "L", 2: "RGB", 3: "P", 4: "LA", 6: "RGBA"}
+JPEG_MODES = {1: "L", 3: "RGB", 4: "CMYK"}
+# Start-of-frame markers carry the image dimensions (DHT, JPG and DAC excluded)
+JPEG_SOF_MARKERS = {0xC0, 0xC1, 0xC2, 0xC3, 0xC5, 0xC6, 0xC7,
+                    0xC9, 0xCA, 0xCB, 0xCD, 0xCE, 0xCF}
+# Markers without a length field
+JPEG_STANDALONE_MARKERS = {0x01, *range(0xD0, 0xD9)}
+AVIF_BRANDS = {b"avif", b"avis"}
+# The image properties of an AVIF file sit in its leading `meta` box
+AVIF_HEADER_BYTES = 64 * 1024
+
+
+def _image(format: str, width: int, height: int, mode: str) -> dict:
+    return {"format": format, "width": width, "height": height, "mode": mode}
+
+
+def _png(header: bytes) -> Optional[dict]:
+    if len(header) < 26 or header[12:16] != b"IHDR":
+        return None
+    width, height, bit_depth, color_type = struct.unpack(">IIBB", header[16:26])
+    mode = PNG_MODES.get(color_type, "unknown")
+    if color_type == 0 and bit_depth == 1:
+        mode = "1"
+    elif color_type == 0 and bit_depth == 16:
+        mode = "I;16"
+    return _image("PNG", width, height, mode)
+
+
+def _gif(header: bytes) -> Optional[dict]:
+    if len(header) < 10:
+        return None
+    width, height = struct.unpack("<HH", header[6:10])
+    return _image("GIF", width, height, "P")
+
+
+def _webp(header: bytes) -> Optional[dict]:
+    chunk = header[12:16]
+    if chunk == b"VP8 " and len(header) >= 30 and header[23:26] == b"\x9d\x01\x2a":
+        width, height = struct.unpack("<HH", header[26:30])
+        return _image("WEBP", width & 0x3FFF, height & 0x3FFF, "RGB")
+    if chunk == b"VP8L" and len(header) >= 25 and header[20] == 0x2F:
+        bits = int.from_bytes(header[21:25], "little")
+        width = (bits & 0x3FFF) + 1
+        height = ((bits >> 14) & 0x3FFF) + 1
+        mode = "RGBA" if bits >> 28 & 1 else "RGB"
+        return _image("WEBP", width, height, mode)
+    if chunk == b"VP8X" and len(header) >= 30:
+        width = int.from_bytes(header[24:27], "little") + 1
+        height = int.from_bytes(header[27:30], "little") + 1
+        mode = "RGBA" if header[20] & 0x10 else "RGB"
+        return _image("WEBP", width, height, mode)
+    return None
+
+
+def _jpeg(f: BinaryIO) -> Optional[dict]:
+    f.seek(2)
+    while True:
+        byte = f.read(1)
+        if not byte:
+            return None
+        if byte != b"\xff":
+            continue
+        marker = f.read(1)
+        while marker == b"\xff":
+            marker = f.read(1)
+        if not marker:
+            return None
+        marker = marker[0]
+        if marker in JPEG_STANDALONE_MARKERS:
+            continue
+        if marker in (0xD9, 0xDA):
+            # End of image or start of scan before any frame header
+            return None
+        length_bytes = f.read(2)
+        if len(length_bytes) < 2:
+            return None
+        (length,) = struct.unpack(">H", length_bytes)
+        if length < 2:
+            # Corrupt, the length includes its own two bytes
+            return None
+        if marker in JPEG_SOF_MARKERS:
+            segment = f.read(6)
+            if len(segment) < 6:
+                return None
+            _, height, width, components = struct.unpack(">BHHB", segment)
+            return _image("JPEG", width, height, JPEG_MODES.get(components, "unknown"))
+        # A segment running past the end leaves the next read empty
+        f.seek(length - 2, 1)
+
+
+def _boxes(data: bytes, start: int, end: int):
+    """Yield (type, payload start, payload end) of the ISOBMFF boxes in data[start:end]."""
+    while start + 8 <= end:
+        size, kind = struct.unpack(">I4s", data[start:start + 8])
+        header = 8
+        if size == 1:
+            if start + 16 > end:
+                return
+            (size,) = struct.unpack(">Q", data[start + 8:start + 16])
+            header = 16
+        elif size == 0:
+            size = end - start
+        if size < header:
+            return
+        yield kind, start + header, min(start + size, end)
+        start += size
+
+
+def _child(data: bytes, start: int, end: int, kind: bytes, full_box: bool = False) -> Optional[tuple[int, int]]:
+    for child, child_start, child_end in _boxes(data, start, end):
+        if child == kind:
+            # Full boxes start with a version and flags
+            return (child_start + 4 if full_box else child_start), child_end
+    return None
+
+
+def _avif(f: BinaryIO) -> Optional[dict]:
+    f.seek(0)
+    data = f.read(AVIF_HEADER_BYTES)
+    meta = _child(data, 0, len(data), b"meta", full_box=True)
+    iprp = meta and _child(data, *meta, b"iprp")
+    ipco = iprp and _child(data, *iprp, b"ipco")
+    ispe = ipco and _child(data, *ipco, b"ispe", full_box=True)
+    if ispe is None or ispe[1] - ispe[0] < 8:
+        return None
+    # The first image spatial extents are the primary image's
+    width, height = struct.unpack(">II", data[ispe[0]:ispe[0] + 8])
+    mode = "RGBA" if b"auxiliary:alpha" in data[ipco[0]:ipco[1]] else "RGB"
+    return _image("AVIF", width, height, mode)
+
+
+def read_image_header(path: str) -> Optional[dict]:
+    """
+    Read the format, dimensions and mode of an image from its header only.
+
+    Supports PNG, JPEG, WebP, GIF and AVIF without decoding pixel data or
+    importing Pillow. Only a few dozen bytes are read for PNG, WebP and GIF.
+    JPEG metadata segments are skipped with seeks until the frame header,
+    and AVIF reads at most the leading 64 KiB holding its `meta` box.
+
+    Returns:
+        A dict with "format", "width", "height" and "mode", or None if the
+        file is not in a recognized format
+    """
+    with open(path, "rb") as f:
+        header = f.read(32)
+        if header.startswith(PNG_SIGNATURE):
+            return _png(header)
+        if header[:6] in (b"GIF87a", b"GIF89a"):
+            return _gif(header)
+        if header[:4] == b"RIFF" and header[8:12] == b"WEBP":
+            return _webp(header)
+        if header[:2] == b"\xff\xd8":
+            return _jpeg(f)
+        # The major brand, or a compatible brand (e.g. behind "mif1")
+        brands = {header[i:i + 4] for i in range(8, len(header) - 3, 4)}
+        if header[4:8] == b"ftyp" and brands & AVIF_BRANDS:
+            return _avif(f)
+    return None
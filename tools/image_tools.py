@@ -1,17 +1,432 @@
 import os
-import requests
-from openai import OpenAI
-from dotenv import load_dotenv
+import sys
+import glob
+import base64
+import asyncio
+import uuid
+import random
+import functools
+from datetime import datetime
+from typing import Optional
+from mcp.server.fastmcp import Context
 from server import mcp
+import metrics
+from single_flight import SingleFlight
+from tools.generation_cache import GenerationCache, link_or_copy
+from tools.rate_limit import TokenBucket, retry_after
+from tools.resilience import CircuitBreaker, LatencyTracker, hedged
+from tools.catalog import ImageCatalog
+from tools.image_meta import read_image_header
+from tools.image_variants import FORMATS, FITS, file_hash, variant_path, render_variant
+from tools.image_storage import STORAGE_FORMATS, encoder_available, storage_extension, store_image
 
-# Load environment variables
-load_dotenv()
+# Pace API calls to the account quota (0 disables pacing)
+rate_limiter = TokenBucket(
+    float(os.getenv("OPENAI_IMAGES_PER_MINUTE", "0")),
+    int(os.getenv("OPENAI_IMAGES_BURST", "1")),
+)
+MAX_ATTEMPTS = int(os.getenv("OPENAI_IMAGE_MAX_ATTEMPTS", "5"))
+
+# Deadlines in seconds for one images API request, for the whole generation
+# including retries, and for downloading the image (0 disables each)
+REQUEST_TIMEOUT = float(os.getenv("OPENAI_IMAGE_REQUEST_TIMEOUT", "120"))
+GENERATION_DEADLINE = float(os.getenv("IMAGE_GENERATION_DEADLINE", "300"))
+DOWNLOAD_TIMEOUT = float(os.getenv("IMAGE_DOWNLOAD_TIMEOUT", "120"))
+# A second request is started when the first runs longer than this
+# percentile of recent latencies (0 disables hedging). Hedged generations
+# are billed twice, so only downloads are hedged by default.
+REQUEST_HEDGE_PERCENTILE = float(os.getenv("OPENAI_IMAGE_HEDGE_PERCENTILE", "0"))
+DOWNLOAD_HEDGE_PERCENTILE = float(os.getenv("IMAGE_DOWNLOAD_HEDGE_PERCENTILE", "95"))
+request_latency = LatencyTracker(default=float(os.getenv("OPENAI_IMAGE_HEDGE_DELAY", "30")))
+download_latency = LatencyTracker(default=float(os.getenv("IMAGE_DOWNLOAD_HEDGE_DELAY", "5")))
+# Fail fast after consecutive 5xx, connection errors or timeouts
+breaker = CircuitBreaker(
+    "openai_images",
+    int(os.getenv("OPENAI_IMAGE_BREAKER_FAILURES", "5")),
+    float(os.getenv("OPENAI_IMAGE_BREAKER_RESET", "30")),
+)
+BATCH_CONCURRENCY = int(os.getenv("IMAGE_BATCH_CONCURRENCY", "4"))
+
+# "b64_json" returns the image inline and skips the download round trip
+RESPONSE_FORMAT = os.getenv("OPENAI_IMAGE_RESPONSE_FORMAT", "b64_json")
+DOWNLOAD_CHUNK_SIZE = 64 * 1024
+
+# Format images are saved in: "original" keeps the API's PNG bytes, "png" and
+# "webp-lossless" recompress without loss, "webp", "avif" and "jpeg" are
+# lossy at STORAGE_QUALITY
+STORAGE_FORMAT = os.getenv("IMAGE_STORAGE_FORMAT", "original")
+if STORAGE_FORMAT not in STORAGE_FORMATS:
+    raise ValueError(f"IMAGE_STORAGE_FORMAT must be one of {', '.join(STORAGE_FORMATS)}")
+if not encoder_available(STORAGE_FORMAT):
+    raise ValueError(f"This Pillow build cannot write IMAGE_STORAGE_FORMAT={STORAGE_FORMAT}")
+STORAGE_QUALITY = int(os.getenv("IMAGE_STORAGE_QUALITY", "90"))
+
+
+def _parse_variants(spec: str) -> list[dict]:
+    """Parse "WIDTH[xHEIGHT][:FORMAT],..." into variant parameters."""
+    variants = []
+    for entry in filter(None, (part.strip() for part in spec.split(","))):
+        size, _, format = entry.partition(":")
+        width, _, height = size.partition("x")
+        variants.append({"width": int(width), "height": int(height or 0), "format": format or "webp"})
+    return variants
+
+
+# Thumbnails and other derivatives are rendered, and saved images
+# recompressed, in worker processes so that resizing and encoding never
+# block the server's event loop
+VARIANT_WORKERS = int(os.getenv("IMAGE_VARIANT_WORKERS", "2"))
+# Variants rendered in the background after every saved image ("" disables)
+AUTO_VARIANTS = _parse_variants(os.getenv("IMAGE_AUTO_VARIANTS", "256:webp"))
+
+# The OpenAI SDK takes longer to import than the rest of the server, and the
+# clients, cache and catalog are only needed once a tool runs, so they are
+# all created on first use to keep server startup fast
+_http_client = None
+_client = None
+_cache = None
+_catalog = None
+_variant_pool = None
+
+# Source file hashes by (path, size, mtime), so repeat variant requests skip rehashing
+_source_hashes: dict[tuple, str] = {}
+# Background variant renders, referenced until they finish
+_background_variants: set[asyncio.Task] = set()
+
+# Concurrent requests for the same generation (by cache key) share one API call
+_in_flight = SingleFlight("generate_image")
+
+
+def _get_http_client():
+    """Shared keep-alive HTTP connection pool for the API and image downloads."""
+    global _http_client
+    if _http_client is None:
+        import httpx
+        _http_client = httpx.AsyncClient(
+            timeout=httpx.Timeout(60.0, connect=10.0),
+            limits=httpx.Limits(max_connections=32, max_keepalive_connections=16),
+        )
+    return _http_client
+
+
+def _get_client():
+    """OpenAI client; retries are handled by _create_image so that 429s can
+    pause the shared rate limiter."""
+    global _client
+    if _client is None:
+        from openai import AsyncOpenAI
+        _client = AsyncOpenAI(api_key=os.getenv("OPENAI_API_KEY"), http_client=_get_http_client(), max_retries=0)
+    return _client
+
+
+def _get_cache() -> GenerationCache:
+    """Content-addressed cache of previous generations, bounded to a byte budget."""
+    global _cache
+    if _cache is None:
+        _cache = GenerationCache(
+            os.getenv("IMAGE_CACHE_DIR", ".image_cache"),
+            int(os.getenv("IMAGE_CACHE_MAX_BYTES", str(1024 * 1024 * 1024))),
+        )
+    return _cache
+
+
+def _get_catalog() -> ImageCatalog:
+    """Index of every image written to the output directory."""
+    global _catalog
+    if _catalog is None:
+        _catalog = ImageCatalog(os.getenv("IMAGE_CATALOG_DB", "generated_images.sqlite"), os.getcwd())
+    return _catalog
+
+
+def _get_variant_pool():
+    global _variant_pool
+    if _variant_pool is None:
+        import multiprocessing
+        from concurrent.futures import ProcessPoolExecutor
+        # spawn rather than fork, as the server process runs threads
+        _variant_pool = ProcessPoolExecutor(
+            max_workers=max(1, VARIANT_WORKERS), mp_context=multiprocessing.get_context("spawn"))
+    return _variant_pool
+
+
+async def _source_hash(path: str) -> str:
+    stat = os.stat(path)
+    memo_key = (path, stat.st_size, stat.st_mtime_ns)
+    digest = _source_hashes.get(memo_key)
+    if digest is None:
+        if len(_source_hashes) > 10000:
+            _source_hashes.clear()
+        digest = _source_hashes[memo_key] = await asyncio.to_thread(file_hash, path)
+    return digest
+
+
+async def _variant(source: str, width: int, height: int, format: str, quality: int, fit: str) -> tuple[str, bool]:
+    """Return the path of the cached variant of `source`, rendering it if needed,
+    and whether it was already cached."""
+    params = {"width": width, "height": height, "format": format, "quality": quality, "fit": fit}
+    target = variant_path(source, await _source_hash(source), **params)
+    if os.path.exists(target):
+        metrics.count("image_variant_lookups_total", 1, "Image variant cache lookups", result="hit")
+        return target, True
+    metrics.count("image_variant_lookups_total", 1, "Image variant cache lookups", result="miss")
+    with metrics.timed("image_variant", format=format):
+        await asyncio.get_running_loop().run_in_executor(
+            _get_variant_pool(), functools.partial(render_variant, source, target, **params))
+    return target, False
+
+
+def _render_auto_variants(filepath: str):
+    """Post-save hook: render the AUTO_VARIANTS of a new image in the background."""
+    async def render(variant: dict):
+        try:
+            await _variant(filepath, quality=80, fit="contain", **variant)
+        except Exception as e:
+            # stdout carries the stdio transport
+            print(f"Rendering a variant of {filepath} failed: {e}", file=sys.stderr)
+
+    for variant in AUTO_VARIANTS:
+        task = asyncio.create_task(render(variant))
+        _background_variants.add(task)
+        task.add_done_callback(_background_variants.discard)
+
+
+async def _write_file(filepath: str, chunks) -> None:
+    """Write an async iterator of byte chunks to `filepath` atomically."""
+    tmp_path = f"{filepath}.{uuid.uuid4().hex}.part"
+    try:
+        with open(tmp_path, "wb") as f:
+            async for chunk in chunks:
+                await asyncio.to_thread(f.write, chunk)
+        os.replace(tmp_path, filepath)
+    except BaseException:
+        # The open itself may have failed
+        if os.path.exists(tmp_path):
+            os.unlink(tmp_path)
+        raise
+
+
+def _storage_params() -> dict:
+    """Storage settings that change the saved bytes, so they are part of the cache key."""
+    if STORAGE_FORMAT == "original":
+        return {}
+    if STORAGE_FORMATS[STORAGE_FORMAT][1]:
+        return {"storage": STORAGE_FORMAT}
+    return {"storage": STORAGE_FORMAT, "storage_quality": STORAGE_QUALITY}
+
+
+async def _store(raw_path: str, filepath: str) -> tuple[str, Optional[dict]]:
+    """Recompress the image at `raw_path` into `filepath` in a worker process.
+
+    If recompression fails, the image is kept as the API returned it, next
+    to `filepath` with a .png extension, rather than lost after it was paid
+    for. Returns the path the image was saved at and the sizes from
+    `store_image`, or None when the original was kept.
+    """
+    try:
+        with metrics.timed("image_store", format=STORAGE_FORMAT):
+            stored = await asyncio.get_running_loop().run_in_executor(
+                _get_variant_pool(),
+                functools.partial(store_image, raw_path, filepath, STORAGE_FORMAT, STORAGE_QUALITY))
+        return filepath, stored
+    except Exception as e:
+        # stdout carries the stdio transport
+        print(f"Recompressing {filepath} failed, keeping the original: {e}", file=sys.stderr)
+        metrics.count("image_store_failures_total", 1, "Recompressions that kept the original image",
+                      format=STORAGE_FORMAT)
+        original_path = f"{os.path.splitext(filepath)[0]}.png"
+        os.replace(raw_path, original_path)
+        return original_path, None
+    finally:
+        if os.path.exists(raw_path):
+            os.unlink(raw_path)
+
+
+async def _download_chunks(url: str):
+    async with _get_http_client().stream("GET", url) as response:
+        response.raise_for_status()
+        async for chunk in response.aiter_bytes(DOWNLOAD_CHUNK_SIZE):
+            yield chunk
+
+
+async def _decoded_chunks(b64_data: str):
+    yield await asyncio.to_thread(base64.b64decode, b64_data)
+
+
+def _hedge_delay(tracker: LatencyTracker, percentile: float):
+    return tracker.percentile(percentile) if percentile > 0 else None
+
+
+async def _deadline(phase: str, seconds: float, awaitable):
+    """Await `awaitable`, failing with TimeoutError after `seconds` (0 waits forever)."""
+    timeout = asyncio.timeout(seconds or None)
+    try:
+        async with timeout:
+            return await awaitable
+    except TimeoutError:
+        if not timeout.expired():
+            # A deadline of an inner phase
+            raise
+        metrics.count("deadline_exceeded_total", 1, "Calls cut off by a deadline", phase=phase)
+        raise TimeoutError(f"{phase.replace('_', ' ')} took longer than {seconds:g}s") from None
+
+
+async def _request_image(**kwargs):
+    """One images API request, bounded by REQUEST_TIMEOUT and fed to the breaker."""
+    import openai
+    breaker.check()
+    # Every way out of here settles the breaker, or a half-open probe
+    # cancelled while waiting for a token would block all later calls
+    try:
+        await rate_limiter.acquire()
+        started = asyncio.get_running_loop().time()
+        with metrics.timed("openai_image_request", model=kwargs.get("model")):
+            response = await _deadline(
+                "image_request", REQUEST_TIMEOUT, _get_client().images.generate(**kwargs))
+    except (openai.InternalServerError, openai.APIConnectionError, TimeoutError):
+        breaker.failure()
+        raise
+    except Exception:
+        # The API answered (e.g. a 429 or a rejected prompt), so it is healthy
+        breaker.success()
+        raise
+    except BaseException:
+        # Cancelled before the outcome was known
+        breaker.abandon()
+        raise
+    breaker.success()
+    request_latency.record(asyncio.get_running_loop().time() - started)
+    return response
+
+
+async def _create_image(**kwargs):
+    """Call the images API paced by the shared rate limiter.
+
+    429s pause the limiter for every caller for as long as `Retry-After`
+    asks; 429s, 5xx, connection errors and request timeouts are retried
+    with exponential backoff up to MAX_ATTEMPTS times, all within
+    GENERATION_DEADLINE. Each attempt may be hedged, and attempts fail
+    fast with CircuitOpen while the breaker is open.
+    """
+    import openai
+
+    async def attempts():
+        for attempt in range(1, MAX_ATTEMPTS + 1):
+            try:
+                return await hedged(
+                    "openai_image_request", functools.partial(_request_image, **kwargs),
+                    _hedge_delay(request_latency, REQUEST_HEDGE_PERCENTILE))
+            except (openai.RateLimitError, openai.InternalServerError, openai.APIConnectionError,
+                    TimeoutError) as e:
+                if attempt == MAX_ATTEMPTS:
+                    raise
+                response = getattr(e, "response", None)
+                delay = retry_after(response.headers if response is not None else None)
+                if delay is None:
+                    delay = min(60.0, 2 ** attempt) * random.uniform(0.5, 1.0)
+                metrics.count("openai_image_retries_total", 1, "Retried images API calls", reason=type(e).__name__)
+                if isinstance(e, openai.RateLimitError):
+                    rate_limiter.penalize(delay)
+                else:
+                    await asyncio.sleep(delay)
+
+    return await _deadline("image_generation", GENERATION_DEADLINE, attempts())
+
+
+async def _download(url: str, filepath: str):
+    """Stream `url` to `filepath`, hedged and bounded by DOWNLOAD_TIMEOUT."""
+    async def download():
+        started = asyncio.get_running_loop().time()
+        await _write_file(filepath, _download_chunks(url))
+        download_latency.record(asyncio.get_running_loop().time() - started)
+
+    await _deadline("image_download", DOWNLOAD_TIMEOUT, hedged(
+        "image_download", download, _hedge_delay(download_latency, DOWNLOAD_HEDGE_PERCENTILE)))
+
+
+async def _generate(prompt: str, model: str, size: str, quality: str, use_cache: bool, variant: int = 0) -> str:
+    quality = quality if model == "dall-e-3" else "standard"
+    params = {"prompt": prompt, "model": model, "size": size, "quality": quality}
+    params_without_variant = dict(params)
+    if variant:
+        params["variant"] = variant
+    cache = _get_cache()
+    catalog = _get_catalog()
+    key = cache.key(**params, **_storage_params())
+    
+    # Create a safe filename from the prompt, made unique by the cache key
+    safe_filename = "".join(c for c in prompt if c.isalnum() or c in (' ', '-', '_')).rstrip()
+    safe_filename = safe_filename.replace(' ', '_')[:50]  # Limit filename length
+    filename = f"generated_{safe_filename}_{key[:12]}{storage_extension(STORAGE_FORMAT)}"
+    filepath = os.path.abspath(filename)
+    
+    # Serve repeats of the same generation from the cache
+    cached = await asyncio.to_thread(cache.get, key) if use_cache else None
+    if use_cache:
+        metrics.count("image_cache_lookups_total", 1, "Generation cache lookups",
+                      result="miss" if cached is None else "hit")
+    if cached is not None:
+        await asyncio.to_thread(link_or_copy, cached, filepath)
+        await asyncio.to_thread(catalog.add, filepath, **params_without_variant)
+        _render_auto_variants(filepath)
+        return f"Image successfully generated and saved as '{filepath}'\nPrompt: {prompt}\nModel: {model}\nSize: {size}\nQuality: {quality}\nCache: hit"
+    
+    # Identical generations already in flight share that call's result
+    return await _in_flight.do(key, lambda: _create_and_save(
+        prompt, model, size, quality, key, filepath, params, params_without_variant))
+
+
+async def _create_and_save(prompt: str, model: str, size: str, quality: str, key: str,
+                           filepath: str, params: dict, params_without_variant: dict) -> str:
+    cache = _get_cache()
+    catalog = _get_catalog()
+    
+    # Generate the image
+    response = await _create_image(
+        model=model,
+        prompt=prompt,
+        n=1,
+        size=size,
+        quality=quality,
+        response_format=RESPONSE_FORMAT,
+    )
+    image = response.data[0]
+    
+    # Decode or stream the image straight to disk, next to the output file
+    # when it is recompressed afterwards
+    raw_path = filepath if STORAGE_FORMAT == "original" else f"{filepath}.{uuid.uuid4().hex}.orig"
+    source = "b64_json" if image.b64_json is not None else "url"
+    with metrics.timed("image_download", source=source):
+        if image.b64_json is not None:
+            await _write_file(raw_path, _decoded_chunks(image.b64_json))
+        else:
+            await _download(image.url, raw_path)
+    if metrics.enabled():
+        metrics.count("image_download_bytes_total", os.path.getsize(raw_path),
+                      "Bytes of generated images written", source=source)
+    original_bytes = None
+    stored = None
+    if raw_path != filepath:
+        filepath, stored = await _store(raw_path, filepath)
+    result = f"Image successfully generated and saved as '{filepath}'\nPrompt: {prompt}\nModel: {model}\nSize: {size}\nQuality: {quality}"
+    if stored is not None:
+        original_bytes = stored["original_bytes"]
+        if metrics.enabled():
+            for kind in ("original", "stored"):
+                metrics.count("image_storage_bytes_total", stored[f"{kind}_bytes"],
+                              "Bytes of generated images before and after recompression",
+                              format=STORAGE_FORMAT, kind=kind)
+        result += f"\nStored: {stored['stored_bytes']:,} bytes as {STORAGE_FORMAT} (original {original_bytes:,} bytes)"
+    if raw_path == filepath or stored is not None:
+        # An original kept after a failed recompression is not what the key promises
+        await asyncio.to_thread(cache.put, key, filepath, {**params, **_storage_params()})
+    await asyncio.to_thread(catalog.add, filepath, **params_without_variant, original_bytes=original_bytes)
+    _render_auto_variants(filepath)
+    
+    return result
 
-# Initialize OpenAI client
-client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
 
 @mcp.tool()
-def generate_image(prompt: str, model: str = "dall-e-3", size: str = "1024x1024", quality: str = "standard") -> str:
+async def generate_image(prompt: str, model: str = "dall-e-3", size: str = "1024x1024", quality: str = "standard", use_cache: bool = True) -> str:
     """
     Generate an image using OpenAI's DALL-E model and save it locally.
     
@@ -20,62 +435,108 @@ def generate_image(prompt: str, model: str = "dall-e-3", size: str = "1024x1024"
         model: Model to use ("dall-e-2" or "dall-e-3", default: "dall-e-3")
         size: Image size ("256x256", "512x512", "1024x1024", "1792x1024", "1024x1792" for DALL-E 3)
         quality: Image quality ("standard" or "hd" for DALL-E 3)
+        use_cache: Reuse a previous generation with identical parameters (default: True)
     
     Returns:
         A string describing the result and saved file path
     """
     try:
-        # Generate the image
-        response = client.images.generate(
-            model=model,
-            prompt=prompt,
-            n=1,
-            size=size,
-            quality=quality if model == "dall-e-3" else "standard"
-        )
-        
-        # Extract the image URL from the response
-        image_url = response.data[0].url
-        
-        # Create a safe filename from the prompt
-        safe_filename = "".join(c for c in prompt if c.isalnum() or c in (' ', '-', '_')).rstrip()
-        safe_filename = safe_filename.replace(' ', '_')[:50]  # Limit filename length
-        filename = f"generated_{safe_filename}.png"
-        
-        # Download and save the image
-        image_data = requests.get(image_url).content
-        filepath = os.path.abspath(filename)
-        
-        with open(filepath, "wb") as f:
-            f.write(image_data)
-        
-        return f"Image successfully generated and saved as '{filepath}'\nPrompt: {prompt}\nModel: {model}\nSize: {size}\nQuality: {quality}"
+        return await _generate(prompt, model, size, quality, use_cache)
         
     except Exception as e:
         return f"Error generating image: {str(e)}"
 
 @mcp.tool()
-def list_generated_images() -> str:
+async def generate_images(prompts: list[str], variants: int = 1, model: str = "dall-e-3", size: str = "1024x1024", quality: str = "standard", use_cache: bool = True, max_concurrency: int = BATCH_CONCURRENCY, ctx: Context = None) -> str:
     """
-    List all generated image files in the current directory.
+    Generate a batch of images concurrently, paced to the account's images-per-minute quota.
+    
+    Args:
+        prompts: Text descriptions of the images to generate
+        variants: Number of distinct images to generate per prompt (default: 1)
+        model: Model to use ("dall-e-2" or "dall-e-3", default: "dall-e-3")
+        size: Image size ("256x256", "512x512", "1024x1024", "1792x1024", "1024x1792" for DALL-E 3)
+        quality: Image quality ("standard" or "hd" for DALL-E 3)
+        use_cache: Reuse previous generations with identical parameters (default: True)
+        max_concurrency: Maximum number of generations in flight at once
     
     Returns:
-        A string listing all PNG files that start with 'generated_'
+        A string with one result per image, in the order they finished
     """
+    jobs = [(prompt, variant) for prompt in prompts for variant in range(max(1, variants))]
+    slots = asyncio.Semaphore(max(1, max_concurrency))
+    
+    async def run(index: int, prompt: str, variant: int) -> tuple[int, bool, str]:
+        async with slots:
+            try:
+                return index, True, await _generate(prompt, model, size, quality, use_cache, variant)
+            except Exception as e:
+                return index, False, f"Error generating image: {str(e)}"
+    
+    tasks = [asyncio.create_task(run(i, prompt, variant)) for i, (prompt, variant) in enumerate(jobs, 1)]
+    results = []
+    succeeded = 0
     try:
-        current_dir = os.getcwd()
-        image_files = [f for f in os.listdir(current_dir) if f.startswith('generated_') and f.endswith('.png')]
+        for done in asyncio.as_completed(tasks):
+            index, ok, result = await done
+            succeeded += ok
+            results.append(f"[{index}] {result}")
+            # Stream each result to the client as soon as it is ready
+            if ctx is not None:
+                await ctx.report_progress(len(results), len(jobs))
+                await ctx.info(results[-1])
+    finally:
+        for task in tasks:
+            task.cancel()
+    
+    header = f"Batch finished: {succeeded} succeeded, {len(jobs) - succeeded} failed\n"
+    return header + "\n\n".join(results)
+
+@mcp.tool()
+def list_generated_images(limit: int = 50, offset: int = 0, sort_by: str = "created", descending: bool = True, prompt_contains: str = None, since: str = None, until: str = None) -> str:
+    """
+    List generated image files from the image catalog.
+    
+    Args:
+        limit: Maximum number of images to return (default: 50)
+        offset: Number of images to skip, for pagination (default: 0)
+        sort_by: Sort key ("created", "bytes", "filename" or "prompt", default: "created")
+        descending: Sort in descending order (default: True)
+        prompt_contains: Only include images whose prompt contains this text
+        since: Only include images created at or after this ISO 8601 date/datetime
+        until: Only include images created before this ISO 8601 date/datetime
+    
+    Returns:
+        A string listing one page of generated images
+    """
+    try:
+        rows, total = _get_catalog().query(limit, offset, sort_by, descending, prompt_contains, since, until)
         
-        if not image_files:
+        if total == 0 and (prompt_contains or since or until):
+            return "No generated images match the given filters."
+        if total == 0:
             return "No generated images found in the current directory."
+        if not rows:
+            return f"No generated images at offset {offset} (total: {total})."
         
-        result = "Generated image files:\n"
-        for i, filename in enumerate(image_files, 1):
-            filepath = os.path.join(current_dir, filename)
-            size = os.path.getsize(filepath)
-            result += f"{i}. {filename} ({size:,} bytes)\n"
+        lines = [f"Generated image files ({offset + 1}-{offset + len(rows)} of {total}):"]
+        for i, row in enumerate(rows, offset + 1):
+            details = [f"{row['bytes']:,} bytes"]
+            if row["original_bytes"] and row["original_bytes"] != row["bytes"]:
+                details[0] += f" (was {row['original_bytes']:,})"
+            if row["format"]:
+                details.append(row["format"])
+            if row["width"]:
+                details.append(f"{row['width']}x{row['height']}")
+            if row["model"]:
+                details.append(row["model"])
+            details.append(datetime.fromtimestamp(row["created"]).isoformat(timespec="seconds"))
+            line = f"{i}. {row['filename']} ({', '.join(details)})"
+            if row["prompt"]:
+                line += f" - {row['prompt']}"
+            lines.append(line)
         
-        return result
+        return "\n".join(lines) + "\n"
         
     except Exception as e:
         return f"Error listing images: {str(e)}"
@@ -98,7 +559,12 @@ def get_image_info(filename: str) -> str:
         file_size = os.path.getsize(filename)
         abs_path = os.path.abspath(filename)
         
-        # Try to get image dimensions using PIL if available
+        # Read dimensions from the file header, no decoder needed
+        info = read_image_header(filename)
+        if info is not None:
+            return f"File: {filename}\nPath: {abs_path}\nSize: {file_size:,} bytes\nDimensions: {info['width']}x{info['height']}\nMode: {info['mode']}"
+        
+        # Fall back to PIL for formats the header reader does not know
         try:
             from PIL import Image
             with Image.open(filename) as img:
@@ -112,3 +578,80 @@ def get_image_info(filename: str) -> str:
             
     except Exception as e:
         return f"Error getting image info: {str(e)}"
+
+@mcp.tool()
+def get_images_info(filenames: list[str] = None, pattern: str = None) -> list[dict]:
+    """
+    Get information about many image files at once, reading only their headers.
+    
+    Args:
+        filenames: Names of the image files to inspect
+        pattern: Glob pattern selecting image files to inspect (e.g. "generated_*.png")
+    
+    Returns:
+        One entry per file with filename, path, bytes, format, width, height and mode,
+        or an error message for files that could not be read
+    """
+    paths = list(filenames or [])
+    if pattern:
+        paths.extend(sorted(glob.glob(pattern)))
+    
+    results = []
+    for filename in dict.fromkeys(paths):
+        entry = {"filename": filename, "path": os.path.abspath(filename)}
+        try:
+            entry["bytes"] = os.path.getsize(filename)
+            info = read_image_header(filename)
+            if info is None:
+                entry["error"] = "Unrecognized image format"
+            else:
+                entry.update(info)
+        except FileNotFoundError:
+            entry["error"] = "File not found"
+        except Exception as e:
+            entry["error"] = str(e)
+        results.append(entry)
+    
+    return results
+
+@mcp.tool()
+async def get_image_variant(filename: str, width: int = 256, height: int = 0, format: str = "webp", quality: int = 80, fit: str = "contain") -> str:
+    """
+    Get a resized and re-encoded copy of an image, such as a gallery thumbnail.
+    
+    Variants are cached next to the original, keyed by the source's content
+    hash and the parameters, so repeat requests return immediately.
+    
+    Args:
+        filename: Name of the source image file
+        width: Maximum width of the variant in pixels (default: 256)
+        height: Maximum height in pixels; 0 keeps the source aspect ratio (default: 0)
+        format: Output format ("webp", "avif", "jpeg" or "png", default: "webp")
+        quality: Encoder quality for lossy formats, 1-100 (default: 80)
+        fit: "contain" to fit inside width x height, "cover" to crop to exactly width x height
+    
+    Returns:
+        A string with the variant's file path, dimensions and size
+    """
+    try:
+        if not os.path.exists(filename):
+            return f"File '{filename}' not found."
+        if format not in FORMATS:
+            return f"Unsupported format '{format}'. Use one of: {', '.join(FORMATS)}"
+        if fit not in FITS:
+            return f"Unsupported fit '{fit}'. Use one of: {', '.join(FITS)}"
+        if width < 1 or height < 0:
+            return "Width must be positive and height must not be negative."
+        
+        source = os.path.abspath(filename)
+        path, cached = await _variant(source, width, height, format, max(1, min(100, quality)), fit)
+        lines = [f"Variant saved as '{path}'", f"Source: {source}", f"Size: {os.path.getsize(path):,} bytes"]
+        info = read_image_header(path)
+        if info is not None:
+            lines.append(f"Dimensions: {info['width']}x{info['height']}")
+        lines.append(f"Format: {format}")
+        lines.append(f"Cache: {'hit' if cached else 'miss'}")
+        return "\n".join(lines)
+        
+    except Exception as e:
+        return f"Error creating image variant: {str(e)}"
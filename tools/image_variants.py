@@ -0,0 +1,68 @@
+import os
+import uuid
+import hashlib
+import json
+
+FORMATS = {
+    "webp": ("WEBP", ".webp"),
+    "avif": ("AVIF", ".avif"),
+    "jpeg": ("JPEG", ".jpg"),
+    "png": ("PNG", ".png"),
+}
+FITS = ("contain", "cover")
+VARIANT_DIR = ".variants"
+
+
+def file_hash(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        while chunk := f.read(1024 * 1024):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def variant_path(source: str, source_hash: str, **params) -> str:
+    """Where the variant of `source` with `params` is cached, next to the source."""
+    key = hashlib.sha256(
+        json.dumps({"source": source_hash, **params}, sort_keys=True).encode()
+    ).hexdigest()
+    stem = os.path.splitext(os.path.basename(source))[0]
+    extension = FORMATS[params["format"]][1]
+    return os.path.join(os.path.dirname(os.path.abspath(source)), VARIANT_DIR, f"{stem}.{key[:16]}{extension}")
+
+
+def render_variant(source: str, target: str, width: int, height: int, format: str,
+                   quality: int, fit: str) -> dict:
+    """
+    Resize and re-encode `source` into `target`.
+
+    Runs in a worker process, so it only takes and returns plain values.
+    `height` 0 keeps the source aspect ratio.
+    """
+    from PIL import Image, ImageOps
+
+    with Image.open(source) as img:
+        img.load()
+        if not height:
+            height = max(1, round(img.height * width / img.width))
+        if fit == "cover":
+            img = ImageOps.fit(img, (width, height), Image.Resampling.LANCZOS)
+        else:
+            img = ImageOps.contain(img, (width, height), Image.Resampling.LANCZOS)
+        pil_format = FORMATS[format][0]
+        if pil_format == "JPEG" and img.mode not in ("RGB", "L"):
+            img = img.convert("RGB")
+        options = {"optimize": True} if pil_format in ("PNG", "JPEG") else {}
+        if pil_format != "PNG":
+            options["quality"] = quality
+
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        tmp_path = f"{target}.{uuid.uuid4().hex}.part"
+        try:
+            img.save(tmp_path, pil_format, **options)
+            os.replace(tmp_path, target)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.unlink(tmp_path)
+            raise
+        return {"width": img.width, "height": img.height}
@@ -0,0 +1,69 @@
+import time
+import asyncio
+from email.utils import parsedate_to_datetime
+from typing import Optional
+
+
+class TokenBucket:
+    """Async token bucket that paces requests to a per-minute quota.
+
+    `rate_per_minute` tokens are added per minute up to `burst`. A rate of 0 or
+    less disables pacing. `penalize` drains the bucket and pauses every waiter,
+    which is how a 429 from the API is propagated to all in-flight workers.
+    """
+
+    def __init__(self, rate_per_minute: float, burst: int = 1):
+        self.rate = rate_per_minute / 60.0
+        self.capacity = max(1, burst)
+        self.tokens = float(self.capacity)
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+        self._lock = asyncio.Lock()
+
+    def _refill(self, now: float) -> None:
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    async def acquire(self) -> None:
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                if now < self.paused_until:
+                    await asyncio.sleep(self.paused_until - now)
+                    continue
+                if self.rate <= 0:
+                    return
+                self._refill(now)
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+    def penalize(self, delay: float) -> None:
+        now = time.monotonic()
+        self.paused_until = max(self.paused_until, now + delay)
+        self.tokens = 0.0
+        self.updated = max(now, self.paused_until)
+
+
+def retry_after(headers) -> Optional[float]:
+    """Parse the delay requested by a `Retry-After`/`retry-after-ms` header."""
+    if headers is None:
+        return None
+    value = headers.get("retry-after-ms")
+    if value is not None:
+        try:
+            return float(value) / 1000
+        except ValueError:
+            pass
+    value = headers.get("retry-after")
+    if value is None:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
@@ -0,0 +1,116 @@
+import time
+import asyncio
+from collections import deque
+from typing import Any, Awaitable, Callable, Optional
+
+import metrics
+
+
+class CircuitOpen(Exception):
+    """Raised instead of calling a backend whose circuit breaker is open."""
+
+
+class CircuitBreaker:
+    """Fails calls fast while a backend keeps failing.
+
+    After `failures` consecutive failures the breaker opens and `check`
+    raises CircuitOpen for `reset_timeout` seconds. Then it lets a single
+    probe call through (half-open): success closes the breaker, failure opens
+    it again. `failures` of 0 or less disables the breaker.
+    """
+
+    def __init__(self, name: str, failures: int, reset_timeout: float):
+        self.name = name
+        self.failures = failures
+        self.reset_timeout = reset_timeout
+        self.state = "closed"
+        self.consecutive_failures = 0
+        self.opened_at = 0.0
+        self._probing = False
+
+    def _transition(self, state: str):
+        if state != self.state:
+            self.state = state
+            metrics.count("circuit_breaker_transitions_total", 1, "Circuit breaker state changes",
+                          breaker=self.name, state=state)
+
+    def check(self):
+        """Raise CircuitOpen unless a call may be made now."""
+        if self.failures <= 0 or self.state == "closed":
+            return
+        if self.state == "open" and time.monotonic() - self.opened_at >= self.reset_timeout:
+            self._transition("half_open")
+        if self.state == "half_open" and not self._probing:
+            self._probing = True
+            return
+        metrics.count("circuit_breaker_rejected_total", 1, "Calls failed fast by an open circuit breaker",
+                      breaker=self.name)
+        remaining = max(0.0, self.reset_timeout - (time.monotonic() - self.opened_at))
+        raise CircuitOpen(f"{self.name} is failing, not retrying for another {remaining:.0f}s")
+
+    def success(self):
+        self.consecutive_failures = 0
+        self._probing = False
+        self._transition("closed")
+
+    def abandon(self):
+        """Forget a call that was cancelled before its outcome was known."""
+        self._probing = False
+
+    def failure(self):
+        self.consecutive_failures += 1
+        self._probing = False
+        if self.failures > 0 and (self.state == "half_open" or self.consecutive_failures >= self.failures):
+            self.opened_at = time.monotonic()
+            self._transition("open")
+
+
+class LatencyTracker:
+    """Recent latencies of successful calls, for percentile-based hedge delays."""
+
+    def __init__(self, window: int = 200, min_samples: int = 20, default: float = 30.0):
+        self.samples: deque[float] = deque(maxlen=window)
+        self.min_samples = min_samples
+        self.default = default
+
+    def record(self, seconds: float):
+        self.samples.append(seconds)
+
+    def percentile(self, pct: float) -> float:
+        """Nearest-rank percentile, or `default` until `min_samples` were recorded."""
+        if len(self.samples) < self.min_samples:
+            return self.default
+        ordered = sorted(self.samples)
+        return ordered[min(len(ordered) - 1, int(pct / 100 * len(ordered)))]
+
+
+async def hedged(name: str, call: Callable[[], Awaitable[Any]], delay: Optional[float]) -> Any:
+    """Run `call`, starting a second copy if the first is still running after `delay`.
+
+    The first copy to succeed wins and the other is cancelled. If one copy
+    fails the other is still awaited, and the call only fails when both do.
+    A `delay` of None runs `call` once without hedging. Hedges are counted
+    in `hedged_requests_total{call, result}`.
+    """
+    if delay is None:
+        return await call()
+    first = asyncio.ensure_future(call())
+    tasks = {first}
+    try:
+        done, _ = await asyncio.wait(tasks, timeout=delay)
+        if not done:
+            metrics.count("hedged_requests_total", 1, "Hedged calls", call=name, result="fired")
+            tasks.add(asyncio.ensure_future(call()))
+        error = None
+        while tasks:
+            done, tasks = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is None:
+                    if task is not first:
+                        metrics.count("hedged_requests_total", 1, "Hedged calls", call=name, result="won")
+                    return task.result()
+                error = task.exception()
+        raise error
+    finally:
+        for task in tasks:
+            task.cancel()